@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Approximate nearest-neighbor index (IVF, pure NumPy) for large vocabularies.
+
+- Spherical k-means splits the unit vectors into `nlist` clusters
+- A query scores the centroids, then only the rows of its `nprobe` best
+  clusters (exactly, against the real vectors) -> nprobe is the recall/speed knob
+- Saved next to the model as <model>.kv.ivf/ (.npy arrays + meta.json) and
+  memory-mapped on load
+
+Build:  python ann_index.py --kv lexvec_300d.kv [--nlist 2048]
+"""
+
+import json
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from neighbors import CandidateStream
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors
+
+INDEX_SUFFIX = ".ivf"
+
+def index_dir_for(kv_path: str) -> str:
+    return kv_path + INDEX_SUFFIX
+
+# =============================
+# Index
+# =============================
+
+class IVFIndex:
+    """
+    centroids: (nlist, d) unit vectors
+    offsets:   (nlist+1,) start of each cluster in `members`
+    members:   (V,) vocab row ids grouped by cluster
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, members: np.ndarray,
+                 meta: Optional[Dict[str, Any]] = None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.members = members
+        self.meta = meta or {}
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    # ---- build ----
+
+    @classmethod
+    def build(
+        cls,
+        wv: "KeyedVectors",
+        nlist: Optional[int] = None,
+        iters: int = 10,
+        train_size: int = 100_000,
+        chunk: int = 65_536,
+        seed: int = 0,
+        fingerprint: Optional[str] = None,
+    ) -> "IVFIndex":
+        """Spherical k-means on a sample, then assign every row to its nearest centroid."""
+        t0 = time.perf_counter()
+        wv.fill_norms()
+        n = len(wv.vectors)
+        inv = np.where(wv.norms > 0, 1.0 / wv.norms, 0.0).astype(np.float32)
+        nlist = int(nlist or max(1, min(n, round(4 * np.sqrt(n)))))
+        rng = np.random.default_rng(seed)
+
+        def unit_rows(idx: np.ndarray) -> np.ndarray:
+            return np.asarray(wv.vectors[idx], dtype=np.float32) * inv[idx, None]
+
+        sample = np.sort(rng.choice(n, size=min(n, max(train_size, nlist)), replace=False))
+        train = unit_rows(sample)
+        cent = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(train @ cent.T, axis=1)
+            sums = np.zeros_like(cent)
+            np.add.at(sums, assign, train)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            # re-seed empty clusters from random training rows
+            sums[empty] = train[rng.choice(len(train), size=int(empty.sum()))]
+            cent = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+
+        assign = np.empty(n, dtype=np.int32)
+        for start in range(0, n, chunk):
+            idx = np.arange(start, min(n, start + chunk))
+            assign[start:start + len(idx)] = np.argmax(unit_rows(idx) @ cent.T, axis=1)
+
+        members = np.argsort(assign, kind="stable").astype(np.int32)
+        counts = np.bincount(assign, minlength=nlist)
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        meta = {
+            "nlist": nlist,
+            "dim": int(wv.vector_size),
+            "vocab_size": n,
+            "fingerprint": fingerprint,
+            "build_seconds": round(time.perf_counter() - t0, 3),
+        }
+        return cls(cent.astype(np.float32), offsets, members, meta)
+
+    # ---- persistence ----
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "members.npy"), self.members)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "IVFIndex":
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            np.load(os.path.join(path, "centroids.npy")),  # small; keep in RAM
+            np.load(os.path.join(path, "offsets.npy"), mmap_mode=mode),
+            np.load(os.path.join(path, "members.npy"), mmap_mode=mode),
+            meta,
+        )
+
+    # ---- search ----
+
+    def probe(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        """Cluster ids for each query row, best first, shape (b, nprobe)."""
+        nprobe = max(1, min(nprobe, self.nlist))
+        cs = q @ self.centroids.T
+        if nprobe >= self.nlist:
+            return np.argsort(-cs, axis=1)
+        top = np.argpartition(-cs, nprobe - 1, axis=1)[:, :nprobe]
+        return np.take_along_axis(top, np.argsort(-np.take_along_axis(cs, top, axis=1), axis=1), axis=1)
+
+    def rows(self, clusters: np.ndarray) -> np.ndarray:
+        if len(clusters) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.members[self.offsets[c]:self.offsets[c + 1]] for c in clusters]).astype(np.int64)
+
+    def stream(self, engine, q: np.ndarray, exclude: int, nprobe: int,
+               valid: Optional[np.ndarray] = None) -> "IVFCandidateStream":
+        """Approximate CandidateStream for one unit query vector (valid: row mask)."""
+        return IVFCandidateStream(engine, self, q, exclude, nprobe, valid=valid)
+
+# =============================
+# Approximate candidate stream
+# =============================
+
+class IVFCandidateStream(CandidateStream):
+    """
+    Ranked neighbors from the probed clusters only. If a caller reads past
+    them, the next-best clusters are probed and merged into the unread tail
+    (so the stream never runs dry before the vocabulary does).
+    """
+
+    def __init__(self, engine, index: IVFIndex, q: np.ndarray, exclude: int, nprobe: int,
+                 valid: Optional[np.ndarray] = None):
+        super().__init__(engine.wv.index_to_key, np.empty(0, dtype=np.float32), exclude)
+        self._valid = valid
+        self._engine = engine
+        self._index = index
+        self._q = q
+        self._cluster_order = index.probe(q[None, :], index.nlist)[0]
+        self._probed = 0
+        self._nprobe = max(1, nprobe)
+        self._served = 0  # ranked prefix already handed out; never reordered
+        self._order = np.empty(0, dtype=np.int64)
+        self._probe_more()
+
+    def _probe_more(self) -> None:
+        nxt = self._cluster_order[self._probed:self._probed + self._nprobe]
+        self._probed += len(nxt)
+        self._nprobe *= 2  # widen each round
+        rows = self._index.rows(nxt)
+        rows = rows[rows != self._exclude]
+        if self._valid is not None:
+            rows = rows[self._valid[rows]]
+        if not len(rows):
+            return
+        head, tail = self._order[:self._served], self._order[self._served:]
+        tail_scores = self._scores[self._served:]
+        cand = np.concatenate((tail, rows))
+        sc = np.concatenate((tail_scores, self._engine.score_rows(self._q, rows)))
+        rank = np.argsort(-sc, kind="stable")
+        self._order = np.concatenate((head, cand[rank]))
+        self._scores = np.concatenate((self._scores[:self._served], sc[rank]))
+
+    @property
+    def exhausted(self) -> bool:
+        return self._probed >= self._index.nlist
+
+    def take_rows(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        while len(self._order) < n and not self.exhausted:
+            self._probe_more()
+        n = min(n, len(self._order))
+        self._served = max(self._served, n)
+        return self._order[:n], self._scores[:n]
+
+# =============================
+# Build CLI
+# =============================
+
+if __name__ == "__main__":
+    import argparse
+    from gensim.models import KeyedVectors
+    from registry import model_fingerprint
+
+    ap = argparse.ArgumentParser(description="Build an IVF approximate index next to a .kv file.")
+    ap.add_argument("--kv", required=True, help="Path to KeyedVectors .kv file")
+    ap.add_argument("--nlist", type=int, default=None, help="Number of clusters (default ~4*sqrt(V))")
+    ap.add_argument("--iters", type=int, default=10, help="k-means iterations")
+    ap.add_argument("--train-size", type=int, default=100_000, help="Rows sampled for k-means")
+    args = ap.parse_args()
+
+    wv = KeyedVectors.load(args.kv, mmap="r")
+    index = IVFIndex.build(wv, nlist=args.nlist, iters=args.iters, train_size=args.train_size,
+                           fingerprint=model_fingerprint(args.kv))
+    out = index_dir_for(args.kv)
+    index.save(out)
+    print(f"Saved {index.nlist}-list index to {out} in {index.meta['build_seconds']}s")
@@ -1,13 +1,54 @@
-from flask import Flask, request, jsonify
-from flask import send_from_directory
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-from main import run_in_code
+from main import run_in_code, preload
+from registry import REGISTRY
+from tree_cache import TREE_CACHE
+from result_store import RESULT_STORE, encode_json, export_path, gzip_bytes
+from workers import BUILD_POOL, PoolSaturated
+from streaming import STREAM_STATS, TreeStream, ndjson_line, sse_message
+from lazy_tree import LAZY_TREES, MAX_DEPTH, MAX_STEP, new_lazy_tree
+from metrics import METRICS, Trace
+from filter_cache import VERDICT_CACHE
 import os
+import time
 import asyncio
-import aiofiles
 
 app = Flask(__name__, static_folder='.', static_url_path='')
 CORS(app)
+app.json.compact = True  # no pretty-printing, even with debug=True
+
+GZIP_MIN_BYTES = 1024
+
+def wants_gzip(body: bytes) -> bool:
+    return len(body) >= GZIP_MIN_BYTES and 'gzip' in request.headers.get('Accept-Encoding', '')
+
+def json_bytes_response(body: bytes, status: int = 200, gzipped: bool = False) -> Response:
+    resp = Response(body, status=status, mimetype='application/json')
+    resp.headers['Vary'] = 'Accept-Encoding'
+    if gzipped:
+        resp.headers['Content-Encoding'] = 'gzip'
+    return resp
+
+def int_arg(data, key: str, default: int, lo: int, hi: int) -> int:
+    """data[key] as an int clamped to [lo, hi]; ValueError if it is not an integer."""
+    value = data.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f'{key} must be an integer')
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f'{key} must be an integer') from None
+    return min(max(value, lo), hi)
+
+def busy_response(e: PoolSaturated):
+    resp = jsonify({'error': 'server busy, try again shortly', 'pool': BUILD_POOL.stats()})
+    resp.headers['Retry-After'] = str(int(e.retry_after))
+    return resp, 429
+
+# Import heavy deps (WordNet on a background thread), then load vectors + spell
+# filter once per worker, before the first request
+preload()
+REGISTRY.warm()
 
 @app.route('/')
 def index():
@@ -18,23 +59,186 @@ def index():
 def static_files(path):
     return app.send_static_file(path)
 
-# simple API endpoint to receive the submitted word
+# build (or fetch) the tree for a word; returns its result id, and the tree itself if inline=true;
+# trace=true adds per-stage timings and counters for this request
 @app.route('/api/word', methods=['POST'])
 async def receive_word():
     data = request.get_json(silent=True) or {}
     word = (data.get('word') or '').strip()
     if not word:
         return jsonify({'error': 'no word provided'}), 400
-    print("first print")
-    await run_in_code(word)
-    
+    trace = Trace() if data.get('trace') or request.args.get('trace') else None
+    try:
+        tree = await run_in_code(word, export=bool(data.get('export')), trace=trace)
+    except PoolSaturated as e:
+        METRICS.count('tree_requests_total', outcome='busy')
+        return busy_response(e)
+    except asyncio.TimeoutError:
+        METRICS.count('tree_requests_total', outcome='timeout')
+        return jsonify({'error': f'tree for "{word}" took too long'}), 503
+    METRICS.count('tree_requests_total', outcome='ok')
+    t0 = time.perf_counter()
+    tree_id, _ = RESULT_STORE.put(tree)
 
     response = {
         'word': word,
         'status': 'received',
-        'message': f'Got "{word}" on the backend'
+        'message': f'Got "{word}" on the backend',
+        'id': tree_id,
+        'tree_url': f'/api/tree/{tree_id}',
     }
-    return jsonify(response), 200
+    if data.get('export'):
+        response['export'] = export_path(tree_id)
+    if data.get('inline', True):
+        response['tree'] = tree
+    if trace is not None:
+        trace.add_stage('json_encode', time.perf_counter() - t0)  # so far: the stored copy
+        response['trace'] = trace.as_dict()
+    body = encode_json(response)
+    METRICS.add_stage('json_encode', time.perf_counter() - t0)
+    if wants_gzip(body):
+        return json_bytes_response(gzip_bytes(body), gzipped=True)
+    return json_bytes_response(body)
+
+# same build, streamed node by node as it is computed: NDJSON by default,
+# Server-Sent Events with ?format=sse or Accept: text/event-stream
+@app.route('/api/word/stream', methods=['GET', 'POST'])
+def stream_word():
+    data = request.get_json(silent=True) or {}
+    word = (data.get('word') or request.args.get('word') or '').strip()
+    if not word:
+        return jsonify({'error': 'no word provided'}), 400
+    try:
+        stream = TreeStream(word)
+    except PoolSaturated as e:
+        return busy_response(e)
+
+    sse = request.args.get('format') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+    fmt = sse_message if sse else ndjson_line
+    resp = Response((fmt(kind, payload) for kind, payload in stream),
+                    mimetype='text/event-stream' if sse else 'application/x-ndjson')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'  # don't let a proxy hold back the first nodes
+    return resp
+
+# time-to-first-node / first-level / total for streamed builds
+@app.route('/api/word/stream/stats', methods=['GET'])
+def stream_stats():
+    return jsonify(STREAM_STATS.stats()), 200
+
+# shallow tree that grows on demand: returns root + first level (depth=2) and a lazy tree id;
+# max_depth is capped at lazy_tree.MAX_DEPTH, and builds/expansions (at most MAX_STEP levels)
+# run on BUILD_POOL (local threads: lazy trees live in this process) like /api/word
+@app.route('/api/word/lazy', methods=['POST'])
+async def lazy_word():
+    data = request.get_json(silent=True) or {}
+    word = (data.get('word') or '').strip()
+    if not word:
+        return jsonify({'error': 'no word provided'}), 400
+    try:
+        max_depth = int_arg(data, 'max_depth', MAX_DEPTH, 1, MAX_DEPTH)
+        depth = int_arg(data, 'depth', 2, 1, min(MAX_STEP, max_depth))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        tree_id, tree = await BUILD_POOL.run(new_lazy_tree, word, depth, max_depth, local=True)
+    except PoolSaturated as e:
+        return busy_response(e)
+    except asyncio.TimeoutError:
+        return jsonify({'error': f'lazy tree for "{word}" took too long'}), 503
+    return jsonify({'id': tree_id, 'max_depth': tree.max_depth, 'tree': tree.root}), 200
+
+# expand one node of a lazy tree, addressed by its path of words from the root
+@app.route('/api/word/expand', methods=['POST'])
+async def expand_word():
+    data = request.get_json(silent=True) or {}
+    tree = LAZY_TREES.get(data.get('id') or '')
+    if tree is None:
+        return jsonify({'error': 'unknown or expired lazy tree id'}), 404
+    path = data.get('path') or []
+    if not isinstance(path, list) or not all(isinstance(w, str) for w in path):
+        return jsonify({'error': 'path must be a list of words'}), 400
+    try:
+        levels = int_arg(data, 'depth', 1, 1, MAX_STEP)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        node = await BUILD_POOL.run(tree.expand, path, levels, local=True)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except PoolSaturated as e:
+        return busy_response(e)
+    except asyncio.TimeoutError:
+        return jsonify({'error': 'expansion took too long'}), 503
+    return jsonify({'id': data['id'], 'path': path, 'node': node}), 200
+
+# content-addressed tree results (ids from /api/word); immutable, so cacheable forever
+@app.route('/api/tree/<tree_id>', methods=['GET'])
+def get_tree(tree_id):
+    body = RESULT_STORE.get(tree_id)
+    if body is None:
+        return jsonify({'error': 'unknown or expired tree id'}), 404
+    gz = wants_gzip(body)
+    if gz:
+        body = RESULT_STORE.get(tree_id, gzipped=True) or gzip_bytes(body)
+    resp = json_bytes_response(body, gzipped=gz)
+    resp.headers['ETag'] = f'"{tree_id}"'
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resp
+
+# stage timers / counters and current pool, cache and memory levels, in Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    pool = BUILD_POOL.stats()
+    cache = TREE_CACHE.stats()
+    verdicts = VERDICT_CACHE.stats()
+    gauges = {
+        'build_pool_in_flight': pool['in_flight'],
+        'build_pool_queued': pool['queued'],
+        'build_pool_rejected': pool['rejected'],
+        'build_pool_timed_out': pool['timed_out'],
+        'tree_cache_memory_items': cache['memory_items'],
+        'tree_cache_disk_bytes': cache['disk_bytes'],
+        'verdict_cache_items': verdicts['size'],
+        'verdict_cache_hits': verdicts['hits'],
+        'verdict_cache_misses': verdicts['misses'],
+        'result_store_items': len(RESULT_STORE),
+        'resident_memory_mb': REGISTRY.stats().get('rss_mb'),
+    }
+    return Response(METRICS.render(gauges), mimetype='text/plain; version=0.0.4')
+
+# loaded models/filters, load times and memory
+@app.route('/api/models', methods=['GET'])
+def model_stats():
+    return jsonify(REGISTRY.stats()), 200
+
+# build pool queue depth / rejections / timeouts
+@app.route('/api/pool', methods=['GET'])
+def pool_stats():
+    return jsonify(BUILD_POOL.stats()), 200
+
+# tree result cache hit/miss counters
+@app.route('/api/tree-cache', methods=['GET'])
+def tree_cache_stats():
+    return jsonify(TREE_CACHE.stats()), 200
+
+# re-load vector files (and optionally filters) without restarting; only already-loaded
+# or configured paths (400 otherwise)
+@app.route('/api/models/reload', methods=['POST'])
+def reload_models():
+    data = request.get_json(silent=True) or {}
+    path = data.get('path')
+    if path is not None and not isinstance(path, str):
+        return jsonify({'error': 'path must be a string'}), 400
+    try:
+        stats = REGISTRY.reload(path=path, filters=bool(data.get('filters')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'error': f'model file missing: {e}'}), 404
+    except Exception as e:
+        return jsonify({'error': f'reload failed: {type(e).__name__}: {e}'}), 500
+    return jsonify(stats), 200
 
 if __name__ == '__main__':
     # Run on localhost:8000
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Batch mode: similarity trees for thousands of roots in one run.
+
+- Roots are spread over a process pool; every worker memory-maps the same
+  vector file (and its .ivf/.tokidx/.vtables/.verdicts artifacts) via the registry
+- Inside a worker, all trees share one engine with a CleanListMemo, so the
+  filtered neighbor list of a token is computed once per worker, however
+  many roots' subtrees reach it (roots are handed out in contiguous chunks,
+  so nearby roots in the input land on the same worker)
+- Results are written as JSON Lines, in input order, as they complete;
+  roots are read lazily, so memory stays flat for any batch size
+- --format flat: one binary .wtree file instead (flat_tree.py): workers
+  send compact arrays with scores, the parent keeps only those
+
+Usage:  python batch.py --kv lexvec_300d.kv --roots-file roots.txt --out trees.jsonl --workers 8
+        python batch.py --kv lexvec_300d.kv --roots-file roots.txt --out trees.wtree --format flat
+"""
+
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from flat_tree import FlatTreeWriter, flatten_events
+from main import FILTER_CONFIG, TREE_PARAMS, build_similarity_tree, iter_similarity_tree
+from neighbors import CleanListMemo
+
+# Per-worker state, set by _init_worker
+_WORKER: Dict[str, Any] = {}
+
+def _init_worker(kv_path: str, filter_config: Dict[str, Any], params: Dict[str, Any], memo_items: int) -> None:
+    from registry import REGISTRY
+
+    model = REGISTRY.get_model(kv_path)
+    if memo_items:
+        model.engine.clean_memo = CleanListMemo(max_items=memo_items)
+    _WORKER.update(model=model, word_filter=REGISTRY.get_filter(**filter_config), params=params)
+
+# Results carry the worker's memo stats so far; the parent keeps the latest per pid
+Result = Tuple[str, Any, float, Dict[str, Any]]
+
+def _memo_stats() -> Dict[str, Any]:
+    memo = _WORKER["model"].engine.clean_memo
+    return {"pid": os.getpid(), **(memo.stats() if memo is not None else {})}
+
+def _lookups(memo: Dict[str, Any]) -> int:
+    return memo.get("hits", 0) + memo.get("misses", 0)
+
+def _build_one(root: str) -> Result:
+    model = _WORKER["model"]
+    t0 = time.perf_counter()
+    tree = build_similarity_tree(model.wv, root, word_filter=_WORKER["word_filter"],
+                                 engine=model.engine, **_WORKER["params"])
+    return root, tree, time.perf_counter() - t0, _memo_stats()
+
+def _build_one_flat(root: str) -> Result:
+    model = _WORKER["model"]
+    t0 = time.perf_counter()
+    flat = flatten_events(iter_similarity_tree(model.wv, root, word_filter=_WORKER["word_filter"],
+                                               engine=model.engine, **_WORKER["params"]), name=root)
+    return root, flat, time.perf_counter() - t0, _memo_stats()
+
+def iter_roots_file(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            word = line.strip()
+            if word:
+                yield word
+
+def build_batch(
+    roots: Iterable[str],
+    out_path: str,
+    kv_path: str,
+    filter_config: Optional[Dict[str, Any]] = None,
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    memo_items: int = 20000,
+    fmt: str = "jsonl",
+    **params,
+) -> Dict[str, Any]:
+    """
+    Build a tree per root and write {"root", "tree", "seconds"} lines to out_path
+    (fmt="flat": all trees as one flat_tree .wtree file, written at the end).
+    params: build_similarity_tree parameters (defaults: main.TREE_PARAMS).
+    workers=1 builds in this process (no pool). Returns a summary dict.
+    """
+    if fmt not in ("jsonl", "flat"):
+        raise ValueError(f"fmt must be 'jsonl' or 'flat', not {fmt!r}")
+    filter_config = dict(FILTER_CONFIG if filter_config is None else filter_config)
+    params = {**TREE_PARAMS, **params}
+    workers = workers or os.cpu_count() or 1
+    init_args = (kv_path, filter_config, params, memo_items)
+
+    t0 = time.perf_counter()
+    count = 0
+    memo_stats: Dict[int, Dict[str, Any]] = {}
+    flat_writer = FlatTreeWriter() if fmt == "flat" else None
+    build_one = _build_one_flat if flat_writer is not None else _build_one
+    with open(out_path, "w", encoding="utf-8") if flat_writer is None else contextlib.nullcontext() as out:
+        def write(results: Iterable[Result]) -> None:
+            nonlocal count
+            for root, tree, seconds, memo in results:
+                if _lookups(memo) >= _lookups(memo_stats.get(memo["pid"], {})):
+                    memo_stats[memo["pid"]] = memo
+                if flat_writer is not None:
+                    flat_writer.add_flat(tree)
+                else:
+                    out.write(json.dumps({"root": root, "tree": tree, "seconds": round(seconds, 4)},
+                                         ensure_ascii=False, separators=(",", ":")))
+                    out.write("\n")
+                count += 1
+
+        if workers == 1:
+            _init_worker(*init_args)
+            write(map(build_one, roots))
+        else:
+            # each worker loads (memory-maps) the model itself in _init_worker
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=init_args) as pool:
+                write(pool.imap(build_one, roots, chunksize=chunksize))
+    if flat_writer is not None:
+        flat_writer.finish().save(out_path)
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "roots": count,
+        "seconds": round(elapsed, 3),
+        "roots_per_second": round(count / elapsed, 2) if elapsed else None,
+        "workers": workers,
+        "memo": list(memo_stats.values()),
+    }
+
+if __name__ == "__main__":
+    import argparse
+    from main import KV_PATH
+
+    ap = argparse.ArgumentParser(description="Build similarity trees for many roots into a JSON Lines file.")
+    ap.add_argument("--kv", default=KV_PATH, help="Path to KeyedVectors .kv file")
+    ap.add_argument("--roots", nargs="*", default=[], help="Root words")
+    ap.add_argument("--roots-file", default=None, help="Newline-separated root words")
+    ap.add_argument("--out", required=True, help="Output .jsonl (or .wtree with --format flat) path")
+    ap.add_argument("--format", choices=("jsonl", "flat"), default="jsonl", help="JSON Lines or one flat binary file")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all CPUs; 1 = in-process)")
+    ap.add_argument("--chunksize", type=int, default=16, help="Roots handed to a worker at a time")
+    ap.add_argument("--memo-items", type=int, default=20000, help="Clean neighbor lists memoized per worker (0 = off)")
+    ap.add_argument("--depth", type=int, default=TREE_PARAMS["depth"], help="Tree depth (levels, including root)")
+    ap.add_argument("--breadth", type=int, default=TREE_PARAMS["breadth"], help="Children per node")
+    ap.add_argument("--min-sim-parent", type=float, default=TREE_PARAMS["min_sim_to_parent"], help="Min similarity to parent")
+    ap.add_argument("--min-sim-root", type=float, default=TREE_PARAMS["min_sim_to_root"], help="Min similarity to root (levels>=1)")
+    ap.add_argument("--ann-nprobe", type=int, default=TREE_PARAMS["ann_nprobe"], help="Probe N clusters of <kv>.ivf (default: exact)")
+    args = ap.parse_args()
+
+    roots: Iterable[str] = args.roots
+    if args.roots_file:
+        roots = itertools.chain(args.roots, iter_roots_file(args.roots_file))
+
+    summary = build_batch(
+        roots, args.out, args.kv,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        memo_items=args.memo_items,
+        fmt=args.format,
+        depth=args.depth,
+        breadth=args.breadth,
+        min_sim_to_parent=args.min_sim_parent,
+        min_sim_to_root=args.min_sim_root,
+        ann_nprobe=args.ann_nprobe,
+    )
+    print(f"Wrote {summary['roots']} trees to {args.out}: {summary}")
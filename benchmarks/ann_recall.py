@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Recall@k vs latency of the IVF index against the exact NeighborEngine path.
+
+    python benchmarks/ann_recall.py --kv lexvec_300d.kv --nprobe 4 8 16 32 64
+
+Builds <kv>.ivf first if it does not exist. Prints a table; --json writes the rows.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gensim.models import KeyedVectors
+
+from ann_index import IVFIndex, index_dir_for
+from neighbors import NeighborEngine
+from registry import model_fingerprint
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark approximate vs exact neighbor search.")
+    ap.add_argument("--kv", required=True, help="Path to KeyedVectors .kv file")
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    ap.add_argument("--k", type=int, default=100, help="Neighbors per query (recall@k)")
+    ap.add_argument("--queries", type=int, default=200, help="Random query tokens")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="Write results as JSON")
+    args = ap.parse_args()
+
+    wv = KeyedVectors.load(args.kv, mmap="r")
+    ivf_dir = index_dir_for(args.kv)
+    if not os.path.isdir(ivf_dir):
+        print(f"Building {ivf_dir} ...")
+        IVFIndex.build(wv, fingerprint=model_fingerprint(args.kv)).save(ivf_dir)
+    engine = NeighborEngine(wv, ann=IVFIndex.load(ivf_dir, mmap=True))
+
+    rng = np.random.default_rng(args.seed)
+    n = len(wv.index_to_key)
+    tokens = [wv.index_to_key[i] for i in rng.choice(n, size=min(n, args.queries), replace=False)]
+
+    t0 = time.perf_counter()
+    exact = {t: {w for w, _ in engine.most_similar(t, topn=args.k)} for t in tokens}
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(tokens)
+
+    rows = [{"mode": "exact", "nprobe": None, "recall": 1.0, "ms_per_query": round(exact_ms, 3)}]
+    for nprobe in args.nprobe:
+        hits = 0
+        t0 = time.perf_counter()
+        for t in tokens:
+            got = engine.most_similar(t, topn=args.k, nprobe=nprobe)
+            hits += len(exact[t] & {w for w, _ in got})
+        ms = (time.perf_counter() - t0) * 1000 / len(tokens)
+        rows.append({
+            "mode": "ivf",
+            "nprobe": nprobe,
+            "recall": round(hits / (args.k * len(tokens)), 4),
+            "ms_per_query": round(ms, 3),
+        })
+
+    print(f"vocab={n} dim={wv.vector_size} nlist={engine.ann.nlist} k={args.k} queries={len(tokens)}")
+    print(f"{'mode':<6} {'nprobe':>6} {'recall@k':>9} {'ms/query':>9} {'speedup':>8}")
+    for r in rows:
+        speed = exact_ms / r["ms_per_query"] if r["ms_per_query"] else float("inf")
+        print(f"{r['mode']:<6} {str(r['nprobe'] or '-'):>6} {r['recall']:>9.4f} {r['ms_per_query']:>9.3f} {speed:>7.1f}x")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"kv": args.kv, "k": args.k, "nlist": engine.ann.nlist, "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Memory and ranking agreement of the int8 / float16 compact stores versus the float32 scan.
+
+    python benchmarks/compact_vectors.py --rows 200000 --dim 300
+    python benchmarks/compact_vectors.py --kv lexvec_300d.kv --queries 500 --json compact.json
+
+Per mode (float32, float16, int8):
+- on-disk size of what the full-vocabulary scan reads
+- resident memory of a fresh process that loads the model the way the
+  registry does and answers --queries neighbor queries (mmap pages touched;
+  the files are evicted from the page cache first, so readahead behaves as
+  on a cold start)
+- query latency (one scan + top-k)
+- recall@k of the compact ranking alone (no rescoring) and with rescoring,
+  against the float32 top-k, plus float32 rows rescored per query
+- identical-tree rate over --trees roots
+"""
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gensim.models import KeyedVectors
+
+from compact_store import DTYPES, CompactVectors, advise_random, compact_dir_for
+from main import HybridFilter, build_similarity_tree, is_clean_word, is_probable_shape
+from neighbors import CandidateStream, NeighborEngine
+from synthetic_kv import make_synthetic_kv
+
+MODES = ("float32",) + DTYPES
+
+def pick_roots(wv: KeyedVectors, n: int, seed: int) -> List[str]:
+    keys = wv.index_to_key
+    rng = np.random.default_rng(seed)
+    picked = [keys[i] for i in rng.permutation(len(keys))[: n * 50]
+              if is_clean_word(keys[i]) and is_probable_shape(keys[i])]
+    return picked[:n]
+
+def engine_for(wv: KeyedVectors, mode: str, kv_path: str) -> NeighborEngine:
+    engine = NeighborEngine(wv)
+    if mode != "float32":
+        engine.compact = CompactVectors.load(os.path.join(compact_dir_for(kv_path), mode))
+        advise_random(wv.vectors)
+    return engine
+
+def evict_page_cache(directory: str) -> None:
+    """Drop the (just written, clean) model files from the page cache so every mode starts cold."""
+    os.sync()
+    for root, _, files in os.walk(directory):
+        for name in files:
+            fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+def rss_probe(kv_path: str, mode: str, queries: int, k: int, seed: int) -> Dict[str, Any]:
+    """Child-process side of --probe: load, query, report RSS."""
+    from registry import resident_memory_mb
+
+    if hasattr(os, "posix_fadvise"):
+        evict_page_cache(os.path.dirname(kv_path))
+    before = resident_memory_mb()
+    wv = KeyedVectors.load(kv_path, mmap="r")
+    engine = engine_for(wv, mode, kv_path)
+    if mode == "float32":
+        wv.fill_norms()  # as the registry does without a compact store
+    roots = pick_roots(wv, queries, seed)
+    t0 = time.perf_counter()
+    for r in roots:
+        engine.most_similar(r, topn=k)
+    ms = (time.perf_counter() - t0) * 1000.0 / max(1, len(roots))
+    return {"rss_mb": round(resident_memory_mb() - before, 1), "query_ms": round(ms, 3),
+            "rescored_per_query": round(engine.rescored / max(1, len(roots)), 1)}
+
+def measure_rss(kv_path: str, mode: str, queries: int, k: int, seed: int) -> Dict[str, Any]:
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--probe", mode, "--kv", kv_path,
+                          "--queries", str(queries), "--k", str(k), "--seed", str(seed)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def recall(wv: KeyedVectors, kv_path: str, mode: str, roots: List[str], k: int) -> Dict[str, float]:
+    exact = NeighborEngine(wv)
+    engine = engine_for(wv, mode, kv_path)
+    raw_hits = rescored_hits = 0
+    for r in roots:
+        truth = [w for w, _ in exact.most_similar(r, topn=k)]
+        if engine.compact is None:
+            raw = rescored = truth
+        else:
+            row = wv.key_to_index[r]
+            q = engine.unit([r])
+            approx = CandidateStream(wv.index_to_key, engine.compact.score(q)[0], row)
+            raw = [w for w, _ in approx.take(k)]
+            rescored = [w for w, _ in engine.most_similar(r, topn=k)]
+        raw_hits += len(set(raw) & set(truth))
+        rescored_hits += len(set(rescored) & set(truth))
+    total = max(1, k * len(roots))
+    return {"recall_raw": round(raw_hits / total, 4), "recall_rescored": round(rescored_hits / total, 4)}
+
+def same_trees(wv: KeyedVectors, kv_path: str, mode: str, roots: List[str], word_filter: HybridFilter) -> float:
+    exact = NeighborEngine(wv)
+    engine = engine_for(wv, mode, kv_path)
+    same = sum(build_similarity_tree(wv, r, word_filter=word_filter, engine=exact)
+               == build_similarity_tree(wv, r, word_filter=word_filter, engine=engine) for r in roots)
+    return round(same / max(1, len(roots)), 4)
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark compact (int8/float16) vector stores.")
+    ap.add_argument("--kv", default=None, help="Existing .kv to use instead of synthetic vectors")
+    ap.add_argument("--rows", type=int, default=100000, help="Synthetic vocabulary size")
+    ap.add_argument("--dim", type=int, default=300, help="Synthetic dimensionality")
+    ap.add_argument("--queries", type=int, default=200, help="Neighbor queries per mode")
+    ap.add_argument("--k", type=int, default=100, help="Top-k for recall and latency")
+    ap.add_argument("--trees", type=int, default=20, help="Roots for the identical-tree check")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="Write results as JSON")
+    ap.add_argument("--probe", choices=MODES, default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.probe:
+        print(json.dumps(rss_probe(args.kv, args.probe, args.queries, args.k, args.seed)))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="compact_bench_")
+    try:
+        kv_path = os.path.join(workdir, "model.kv")
+        if args.kv:
+            wv = KeyedVectors.load(args.kv, mmap="r")
+        else:
+            wv = make_synthetic_kv(args.rows, args.dim, seed=args.seed)
+        wv.save(kv_path)  # own copy, so the stores below live in the temp dir
+        disk_mb = {"float32": wv.vectors.nbytes / (1024 * 1024)}
+        for dtype in DTYPES:
+            store = CompactVectors.build(wv, dtype=dtype)
+            store.save(os.path.join(compact_dir_for(kv_path), dtype))
+            disk_mb[dtype] = store.nbytes / (1024 * 1024)
+        del wv, store  # unmap, so the probes below can evict every file from the page cache
+        gc.collect()
+
+        rows: List[Dict[str, Any]] = [{"mode": mode, "scan_mb": round(disk_mb[mode], 1),
+                                       **measure_rss(kv_path, mode, args.queries, args.k, args.seed)}
+                                      for mode in MODES]
+
+        wv = KeyedVectors.load(kv_path, mmap="r")
+        roots = pick_roots(wv, args.queries, args.seed)
+        word_filter = HybridFilter(use_spell=False)
+        for row in rows:
+            row.update(recall(wv, kv_path, row["mode"], roots, args.k))
+            row["same_trees"] = same_trees(wv, kv_path, row["mode"], roots[: args.trees], word_filter)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"vocab={len(wv.index_to_key)} dim={wv.vector_size} queries={len(roots)} k={args.k}")
+    print(f"{'mode':<8} {'scan MB':>8} {'RSS MB':>7} {'query ms':>9} {'rescored':>9} "
+          f"{'recall raw':>10} {'rescored':>9} {'same trees':>10}")
+    for r in rows:
+        print(f"{r['mode']:<8} {r['scan_mb']:>8} {r['rss_mb']:>7} {r['query_ms']:>9} {r['rescored_per_query']:>9} "
+              f"{r['recall_raw']:>10} {r['recall_rescored']:>9} {r['same_trees']:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"vocab": len(wv.index_to_key), "dim": wv.vector_size, "k": args.k, "modes": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
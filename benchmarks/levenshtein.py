@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Built-in edit-distance fallback versus rapidfuzz on sibling-diversity pools.
+
+    python benchmarks/levenshtein.py --rows 100000 --breadth 4 8 16
+    python benchmarks/levenshtein.py --kv lexvec_300d.kv --roots 50 --json levenshtein.json
+
+Pools are the real ones choose_children sees: get_clean_similar with
+target_count = max(60, breadth*12) plus keep_best_per_family, for --roots
+random roots. Per pool, one near_duplicate_many row (pool[i] vs the whole
+pool, for each i up to breadth) is timed with:
+- rapidfuzz: cdist + Levenshtein.normalized_similarity
+- numpy:     edit_distance.normalized_similarity_many, score_cutoff=0.84
+- numpy-all: the same without the length-ratio cutoff (every row scored)
+- python:    edit_distance.normalized_similarity per pair
+- contain:   the old fallback (substring containment)
+Agreement with rapidfuzz (near-duplicate flags) is reported per method, and
+trees are compared with the fallback forced on.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gensim.models import KeyedVectors
+
+import edit_distance
+import main as tree_main
+from main import (HybridFilter, build_similarity_tree, get_clean_similar, is_clean_word, is_probable_shape,
+                  keep_best_per_family)
+from neighbors import NeighborEngine
+from synthetic_kv import make_synthetic_kv
+
+THRESHOLD = 0.84  # near_duplicate_many default
+
+def contain_many(a: str, bs: List[str]) -> np.ndarray:
+    a = a.lower()
+    return np.array([1.0 if (a in b.lower() or b.lower() in a) else 0.0 for b in bs], dtype=np.float32)
+
+def methods() -> Dict[str, Callable[[str, List[str]], np.ndarray]]:
+    out: Dict[str, Callable[[str, List[str]], np.ndarray]] = {}
+    rf = tree_main._rf()
+    if rf is not None:
+        out["rapidfuzz"] = lambda a, bs: rf[1]([a], bs, scorer=rf[0].normalized_similarity, dtype=np.float32)[0]
+    out["numpy"] = lambda a, bs: edit_distance.normalized_similarity_many(a, bs, score_cutoff=THRESHOLD)
+    out["numpy-all"] = lambda a, bs: edit_distance.normalized_similarity_many(a, bs)
+    out["python"] = lambda a, bs: np.array([edit_distance.normalized_similarity(a, b) for b in bs],
+                                           dtype=np.float32)
+    out["contain"] = contain_many
+    return out
+
+def pick_roots(wv: KeyedVectors, n: int, seed: int) -> List[str]:
+    keys = wv.index_to_key
+    rng = np.random.default_rng(seed)
+    picked = [keys[i] for i in rng.permutation(len(keys))[: n * 50]
+              if is_clean_word(keys[i]) and is_probable_shape(keys[i])]
+    return picked[:n]
+
+def pools_for(wv: KeyedVectors, roots: List[str], breadth: int, word_filter: HybridFilter) -> List[List[str]]:
+    engine = NeighborEngine(wv)
+    pools = []
+    for r in roots:
+        raw = get_clean_similar(wv, r, target_count=max(60, breadth * 12), expand_factor=6,
+                                word_filter=word_filter, engine=engine)
+        pools.append([c for c, _ in keep_best_per_family(raw, score_getter=lambda t: t[1])])
+    return pools
+
+def run_pools(pools: List[List[str]], breadth: int, repeat: int) -> Dict[str, Dict[str, Any]]:
+    rows = [(pool[i], pool) for pool in pools for i in range(min(breadth, len(pool)))]
+    fns = methods()
+    truth = {i: fns["rapidfuzz"](a, bs) >= THRESHOLD for i, (a, bs) in enumerate(rows)} if "rapidfuzz" in fns else None
+    out: Dict[str, Dict[str, Any]] = {}
+    for name, fn in fns.items():
+        best = np.inf
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for a, bs in rows:
+                fn(a, bs)
+            best = min(best, time.perf_counter() - t0)
+        agree = None
+        if truth is not None:
+            agree = float(np.mean([np.array_equal(fn(a, bs) >= THRESHOLD, truth[i]) for i, (a, bs) in enumerate(rows)]))
+        out[name] = {"us_per_row": round(best * 1e6 / max(1, len(rows)), 2), "rows_agree": agree}
+    out["_pool"] = {"rows": len(rows), "mean_pool": round(float(np.mean([len(bs) for _, bs in rows])), 1)}
+    return out
+
+def same_trees(wv: KeyedVectors, roots: List[str], word_filter: HybridFilter) -> float:
+    """Trees with rapidfuzz versus the built-in fallback (rapidfuzz hidden)."""
+    if tree_main._rf() is None:
+        return float("nan")
+    with_rf = [build_similarity_tree(wv, r, word_filter=word_filter, engine=NeighborEngine(wv)) for r in roots]
+    saved = tree_main._rapidfuzz, tree_main._RF_OK
+    tree_main._rapidfuzz, tree_main._RF_OK = None, False
+    try:
+        without = [build_similarity_tree(wv, r, word_filter=word_filter, engine=NeighborEngine(wv)) for r in roots]
+    finally:
+        tree_main._rapidfuzz, tree_main._RF_OK = saved
+    return round(sum(a == b for a, b in zip(with_rf, without)) / max(1, len(roots)), 4)
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the built-in edit distance against rapidfuzz.")
+    ap.add_argument("--kv", default=None, help="Existing .kv to use instead of synthetic vectors")
+    ap.add_argument("--rows", type=int, default=100000, help="Synthetic vocabulary size")
+    ap.add_argument("--dim", type=int, default=300, help="Synthetic dimensionality")
+    ap.add_argument("--roots", type=int, default=30, help="Random roots (one pool each per breadth)")
+    ap.add_argument("--breadth", type=int, nargs="+", default=[4, 8, 16], help="Breadths (pool = max(60, 12*b))")
+    ap.add_argument("--trees", type=int, default=20, help="Roots for the identical-tree check")
+    ap.add_argument("--repeat", type=int, default=3, help="Timing repeats (best kept)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="Write results as JSON")
+    args = ap.parse_args()
+
+    wv = KeyedVectors.load(args.kv, mmap="r") if args.kv else make_synthetic_kv(args.rows, args.dim, seed=args.seed)
+    word_filter = HybridFilter(use_spell=False)
+    roots = pick_roots(wv, args.roots, args.seed)
+
+    results: Dict[str, Any] = {"vocab": len(wv.index_to_key), "threshold": THRESHOLD, "breadths": {}}
+    for breadth in args.breadth:
+        results["breadths"][breadth] = run_pools(pools_for(wv, roots, breadth, word_filter), breadth, args.repeat)
+    results["same_trees"] = same_trees(wv, roots[: args.trees], word_filter)
+
+    print(f"vocab={results['vocab']} roots={len(roots)} threshold={THRESHOLD} same_trees={results['same_trees']}")
+    print(f"{'breadth':>7} {'pool':>6} {'method':<10} {'us/row':>9} {'agree':>7}")
+    for breadth, res in results["breadths"].items():
+        for name, r in res.items():
+            if name.startswith("_"):
+                continue
+            agree = "-" if r["rows_agree"] is None else f"{r['rows_agree']:.3f}"
+            print(f"{breadth:>7} {res['_pool']['mean_pool']:>6} {name:<10} {r['us_per_row']:>9} {agree:>7}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared neighbor-list cache across worker processes versus per-process scans.
+
+    python benchmarks/neighbor_cache.py --rows 100000 --roots 40 --workers 4
+    python benchmarks/neighbor_cache.py --kv lexvec_300d.kv --entries 65536 --k 512
+
+Distinct roots are dealt round-robin to --workers processes (each loads the
+model itself, as gunicorn workers do) and built in three rounds:
+- "no cache": every worker scans for every node
+- "cold": a fresh shared cache; a worker reads what the others stored
+  before it (overlap between different roots' trees)
+- "warm": the same roots again (a restarted worker, or a repeated root)
+Per round: ms per tree, the cache hit rate, neighbor scans issued, live
+fallbacks past K, and whether every tree equals the uncached one.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+from synthetic_kv import make_synthetic_kv
+
+def pick_roots(kv_path: str, n: int, seed: int) -> List[str]:
+    from gensim.models import KeyedVectors
+    from main import is_clean_word, is_probable_shape
+
+    wv = KeyedVectors.load(kv_path, mmap="r")
+    keys = wv.index_to_key
+    rng = np.random.default_rng(seed)
+    picked = [keys[i] for i in rng.permutation(min(len(keys), 20000))[: n * 50]
+              if is_clean_word(keys[i]) and is_probable_shape(keys[i])]
+    return picked[:n]
+
+def _worker(args: Tuple[str, Optional[str], List[str], Dict[str, Any]]) -> Dict[str, Any]:
+    kv_path, cache_dir, roots, params = args
+    from gensim.models import KeyedVectors
+    from main import FILTER_CONFIG, HybridFilter, build_similarity_tree
+    from neighbor_cache import SharedNeighborCache
+    from neighbors import NeighborEngine
+
+    wv = KeyedVectors.load(kv_path, mmap="r")
+    engine = NeighborEngine(wv)
+    if cache_dir is not None:
+        engine.shared = SharedNeighborCache.load(cache_dir)
+    word_filter = HybridFilter(**{**FILTER_CONFIG, "use_spell": False})
+    build_similarity_tree(wv, roots[0], word_filter=word_filter, engine=NeighborEngine(wv), **params)  # warm-up
+    engine.scans = 0
+    with metrics.tracing() as trace:
+        t0 = time.perf_counter()
+        trees = [build_similarity_tree(wv, r, word_filter=word_filter, engine=engine, **params) for r in roots]
+        seconds = time.perf_counter() - t0
+    fallbacks = trace.counters.get(("neighbor_cache_fallbacks_total", ()), 0)
+    stats = engine.shared.stats() if engine.shared is not None else {"hits": 0, "misses": 0}
+    return {"trees": trees, "seconds": seconds, "scans": engine.scans, "fallbacks": fallbacks,
+            "hits": stats["hits"], "misses": stats["misses"]}
+
+def run_round(kv_path: str, cache_dir: Optional[str], shares: List[List[str]], params: Dict[str, Any]) -> Dict[str, Any]:
+    # one process per share, one after another: each sees what the earlier ones stored
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for share in shares:
+        with ctx.Pool(1) as pool:
+            results.append(pool.apply(_worker, ((kv_path, cache_dir, share, params),)))
+    n = sum(len(s) for s in shares)
+    hits, misses = sum(r["hits"] for r in results), sum(r["misses"] for r in results)
+    return {
+        "trees": [t for r in results for t in r["trees"]],
+        "ms_per_tree": round(sum(r["seconds"] for r in results) * 1000.0 / n, 2),
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        "worker_hit_rates": [round(r["hits"] / (r["hits"] + r["misses"]), 4) if r["hits"] + r["misses"] else None
+                             for r in results],
+        "scans": sum(r["scans"] for r in results),
+        "fallbacks": sum(r["fallbacks"] for r in results),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the shared neighbor-list cache across worker processes.")
+    ap.add_argument("--kv", default=None, help="Existing .kv to use instead of synthetic vectors")
+    ap.add_argument("--rows", type=int, default=100000, help="Synthetic vocabulary size")
+    ap.add_argument("--dim", type=int, default=300, help="Synthetic dimensionality")
+    ap.add_argument("--roots", type=int, default=40, help="Distinct random roots")
+    ap.add_argument("--workers", type=int, default=4, help="Worker processes sharing the cache")
+    ap.add_argument("--entries", type=int, default=65536, help="Cache capacity (lists)")
+    ap.add_argument("--k", type=int, default=512, help="Neighbors per cached list")
+    ap.add_argument("--depth", type=int, default=4)
+    ap.add_argument("--breadth", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="Write results as JSON")
+    args = ap.parse_args()
+
+    from neighbor_cache import SharedNeighborCache
+
+    workdir = tempfile.mkdtemp(prefix="nbcache_bench_")
+    try:
+        if args.kv:
+            kv_path = args.kv
+        else:
+            kv_path = os.path.join(workdir, "model.kv")
+            make_synthetic_kv(args.rows, args.dim, seed=args.seed).save(kv_path)
+        roots = pick_roots(kv_path, args.roots, args.seed)
+        shares = [roots[i::args.workers] for i in range(args.workers)]
+        params = {"depth": args.depth, "breadth": args.breadth}
+        cache_dir = os.path.join(workdir, "model.kv.nbcache")
+        cache = SharedNeighborCache.create(cache_dir, k=args.k, entries=args.entries)
+
+        rows = {"no cache": run_round(kv_path, None, shares, params)}
+        rows["cold"] = run_round(kv_path, cache_dir, shares, params)
+        rows["warm"] = run_round(kv_path, cache_dir, shares, params)
+        reference = rows["no cache"].pop("trees")
+        for r in ("cold", "warm"):
+            rows[r]["same"] = rows[r].pop("trees") == reference
+        entries, cache_mb = int(np.count_nonzero(cache.tags)), round(cache.nbytes / (1024 * 1024), 1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"roots={len(roots)} workers={args.workers} depth={args.depth} breadth={args.breadth} "
+          f"k={args.k} capacity={args.entries} entries={entries} cache={cache_mb} MB")
+    print(f"{'round':>9} {'ms/tree':>8} {'hit rate':>9} {'scans':>6} {'fallbacks':>10} {'same':>5}  per-worker hit rate")
+    for name, r in rows.items():
+        print(f"{name:>9} {r['ms_per_tree']:>8} {str(r['hit_rate']):>9} {r['scans']:>6} {r['fallbacks']:>10} "
+              f"{str(r.get('same', '')):>5}  {r['worker_hit_rates'] if r['hit_rate'] is not None else ''}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"roots": len(roots), "workers": args.workers, "k": args.k, "entries": entries,
+                       "cache_mb": cache_mb, "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
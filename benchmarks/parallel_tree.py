@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Parallel (level-wise) tree builds versus the serial build.
+
+    python benchmarks/parallel_tree.py --rows 100000 --workers 1 2 4 8
+    python benchmarks/parallel_tree.py --kv lexvec_300d.kv --mode process --workers 4 8 16 32
+
+Per worker count: ms per tree (median over --roots roots), the speedup
+over the serial build (workers=1, no plan), the split into the concurrent
+pool phase and the depth-first pass, pools computed ahead / picks reused /
+picked again from a warm list / scored only / missed, and whether every
+tree equals the serial one. The "ideal" column is Amdahl's bound from the
+measured workers=1 split: the depth-first pass stays serial, the pool
+phase divides by the worker count (capped at the widest level). Even at
+workers=1 the plan beats the serial build: it scores each level in one
+product instead of one per sibling group. Thread mode scales further where
+BLAS uses several cores; process mode (--mode process) runs the pools in
+worker processes that memory-map the same model.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gensim.models import KeyedVectors
+
+import metrics
+from main import FILTER_CONFIG, TREE_PARAMS, HybridFilter, build_similarity_tree, is_clean_word, is_probable_shape
+from neighbors import NeighborEngine
+from parallel_tree import process_executor
+from registry import REGISTRY
+from synthetic_kv import make_synthetic_kv
+
+def pick_roots(wv: KeyedVectors, n: int, seed: int) -> List[str]:
+    keys = wv.index_to_key
+    rng = np.random.default_rng(seed)
+    picked = [keys[i] for i in rng.permutation(len(keys))[: n * 50]
+              if is_clean_word(keys[i]) and is_probable_shape(keys[i])]
+    return picked[:n]
+
+def run(wv: KeyedVectors, engine: NeighborEngine, roots: List[str], word_filter: HybridFilter,
+        params: Dict[str, Any], workers: int, executor=None) -> Dict[str, Any]:
+    trees, ms, pool_ms = [], [], []
+    with metrics.tracing() as trace:
+        for r in roots:
+            before = trace.histograms.get((metrics.STAGE_SECONDS, (("stage", "parallel_pools"),)))
+            before = before.sum if before is not None else 0.0
+            t0 = time.perf_counter()
+            trees.append(build_similarity_tree(wv, r, word_filter=word_filter, engine=engine,
+                                               workers=workers, executor=executor, **params))
+            ms.append((time.perf_counter() - t0) * 1000.0)
+            after = trace.histograms.get((metrics.STAGE_SECONDS, (("stage", "parallel_pools"),)))
+            pool_ms.append(((after.sum if after is not None else 0.0) - before) * 1000.0)
+    counters = {dict(labels)["result"]: v for (name, labels), v in trace.counters.items()
+                if name == "parallel_tree_pools_total"}
+    return {"trees": trees, "ms_per_tree": round(float(np.median(ms)), 2),
+            "pool_phase_ms": round(float(np.median(pool_ms)), 2), "pools": counters}
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark parallel level-wise tree builds.")
+    ap.add_argument("--kv", default=None, help="Existing .kv to use instead of synthetic vectors")
+    ap.add_argument("--rows", type=int, default=100000, help="Synthetic vocabulary size")
+    ap.add_argument("--dim", type=int, default=300, help="Synthetic dimensionality")
+    ap.add_argument("--roots", type=int, default=20, help="Random roots")
+    ap.add_argument("--depth", type=int, default=TREE_PARAMS["depth"])
+    ap.add_argument("--breadth", type=int, default=TREE_PARAMS["breadth"])
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to try")
+    ap.add_argument("--mode", choices=("thread", "process"), default="thread")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="Write results as JSON")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="parallel_bench_")
+    try:
+        if args.kv:
+            kv_path = args.kv
+        else:
+            kv_path = os.path.join(workdir, "model.kv")  # process workers load it from disk
+            make_synthetic_kv(args.rows, args.dim, seed=args.seed).save(kv_path)
+        # Same loading path as the process workers (registry: vocab tables, verdict masks)
+        model = REGISTRY.get_model(kv_path)
+        wv, engine = model.wv, model.engine
+        filter_config = {**FILTER_CONFIG, "use_spell": False}
+        word_filter = REGISTRY.get_filter(**filter_config)
+        roots = pick_roots(wv, args.roots, args.seed)
+        params = {"depth": args.depth, "breadth": args.breadth}
+
+        serial = run(wv, engine, roots, word_filter, params, workers=1)  # warms the verdict cache too
+        serial = run(wv, engine, roots, word_filter, params, workers=1)  # no pool phase: the plain serial build
+        rows = []
+        for workers in args.workers:
+            if args.mode == "process":
+                with process_executor(kv_path, filter_config, workers=workers) as ex:
+                    ex.submit(int).result()  # start the workers outside the timing
+                    res = run(wv, engine, roots, word_filter, params, workers=workers, executor=ex)
+            else:
+                with ThreadPoolExecutor(workers) as ex:
+                    res = run(wv, engine, roots, word_filter, params, workers=workers, executor=ex)
+            res["workers"] = workers
+            res["same"] = res.pop("trees") == serial["trees"]
+            rows.append(res)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    base = next((r for r in rows if r["workers"] == 1), rows[0])
+    widest = args.breadth ** (args.depth - 2)
+    for r in rows:
+        dfs = base["ms_per_tree"] - base["pool_phase_ms"]
+        r["ideal_ms"] = round(dfs + base["pool_phase_ms"] / min(r["workers"], widest), 2)
+        r["speedup"] = round(serial["ms_per_tree"] / r["ms_per_tree"], 2)
+
+    print(f"vocab={len(wv.index_to_key)} roots={len(roots)} depth={args.depth} breadth={args.breadth} "
+          f"mode={args.mode} cpus={os.cpu_count()} serial={serial['ms_per_tree']} ms/tree")
+    print(f"{'workers':>7} {'ms/tree':>8} {'speedup':>8} {'pools ms':>9} {'ideal':>8} {'computed':>9} {'reused':>7} "
+          f"{'warm':>6} {'scored':>7} {'missed':>7} {'same':>5}")
+    for r in rows:
+        p = r["pools"]
+        print(f"{r['workers']:>7} {r['ms_per_tree']:>8} {r['speedup']:>8} {r['pool_phase_ms']:>9} {r['ideal_ms']:>8} "
+              f"{p.get('computed', 0):>9} {p.get('reused', 0):>7} {p.get('warm', 0):>6} {p.get('scored', 0):>7} "
+              f"{p.get('missed', 0):>7} {str(r['same']):>5}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"serial_ms_per_tree": serial["ms_per_tree"], "mode": args.mode, "cpus": os.cpu_count(),
+                       "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
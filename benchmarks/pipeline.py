@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Per-stage timings of the tree pipeline on a synthetic (or given) vector model.
+
+    python benchmarks/pipeline.py --rows 100000 --dim 300 --json bench.json
+    python benchmarks/pipeline.py --kv lexvec_300d.kv --depth 3 4 --breadth 3 4 --json bench.json
+    python benchmarks/pipeline.py --rows 100000 --json new.json --baseline bench.json
+
+Stages, each timed on its own: pick_token, HybridFilter.is_valid (cold and
+cached), get_clean_similar, keep_best_per_family, sibling diversity
+(TreeBuilder.pick_diverse), then full build_similarity_tree over a
+depth x breadth grid. --json writes machine-readable results; --baseline
+compares p50s with an earlier run and exits 1 on regressions.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gensim
+from gensim.models import KeyedVectors
+
+from main import (HybridFilter, TreeBuilder, build_similarity_tree, canonical_key, get_clean_similar,
+                  is_clean_word, is_probable_shape, keep_best_per_family, pick_token)
+from neighbors import NeighborEngine
+from synthetic_kv import make_synthetic_kv
+
+def summarize(ms: List[float]) -> Dict[str, float]:
+    a = np.asarray(ms, dtype=np.float64)
+    return {
+        "calls": int(a.size),
+        "mean_ms": round(float(a.mean()), 4),
+        "p50_ms": round(float(np.percentile(a, 50)), 4),
+        "p95_ms": round(float(np.percentile(a, 95)), 4),
+        "total_ms": round(float(a.sum()), 3),
+    }
+
+def time_each(fn: Callable[[Any], Any], items: Iterable[Any]) -> List[float]:
+    out = []
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        out.append((time.perf_counter() - t0) * 1000.0)
+    return out
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def run_stages(wv: KeyedVectors, word_filter: HybridFilter, roots: List[str], rng: np.random.Generator,
+               samples: int) -> Dict[str, Dict[str, float]]:
+    engine = NeighborEngine(wv)
+    keys = wv.index_to_key
+    stages: Dict[str, Dict[str, float]] = {}
+
+    # pick_token: exact hits, case misses and out-of-vocab lookups
+    hits = [keys[i] for i in rng.choice(len(keys), size=samples)]
+    misses = [w.upper() for w in hits[: samples // 2]] + [w + "zq" for w in hits[: samples // 2]]
+    stages["pick_token_hit"] = summarize(time_each(lambda w: pick_token(wv, w), hits))
+    stages["pick_token_miss"] = summarize(time_each(lambda w: pick_token(wv, w), misses))
+
+    # HybridFilter.is_valid: every check on first sight, then the verdict cache
+    cold = HybridFilter(allow=word_filter.allow, deny=word_filter.deny, language=word_filter.language,
+                        spell_distance=word_filter.spell_distance, use_spell=word_filter.use_spell,
+                        use_cache=False)
+    tokens = [keys[i] for i in rng.choice(len(keys), size=samples * 10)]
+    stages["is_valid_uncached"] = summarize(time_each(cold.is_valid, tokens))
+    for t in tokens:
+        word_filter.is_valid(t)
+    stages["is_valid_cached"] = summarize(time_each(word_filter.is_valid, tokens))
+
+    # get_clean_similar: one vocabulary scan + filtering per parent, tree-sized pool
+    pools: Dict[str, list] = {}
+
+    def clean(root: str) -> None:
+        pools[root] = get_clean_similar(wv, root, target_count=60, expand_factor=6,
+                                        word_filter=word_filter, engine=engine)
+    stages["get_clean_similar"] = summarize(time_each(clean, roots))
+
+    # keep_best_per_family on those pools
+    stages["keep_best_per_family"] = summarize(time_each(
+        lambda r: keep_best_per_family(pools[r], score_getter=lambda t: t[1], family_of=canonical_key), roots))
+
+    # sibling diversity: a fresh builder per root so used_norms starts empty
+    builders = {r: TreeBuilder(wv, r, word_filter=word_filter, engine=engine) for r in roots}
+    families = {r: keep_best_per_family(pools[r], score_getter=lambda t: t[1]) for r in roots}
+    stages["sibling_diversity"] = summarize(time_each(
+        lambda r: builders[r].pick_diverse(r, families[r], level=1), roots))
+    return stages
+
+def run_grid(wv: KeyedVectors, word_filter: HybridFilter, roots: List[str],
+             depths: List[int], breadths: List[int]) -> List[Dict[str, Any]]:
+    rows = []
+    for depth in depths:
+        for breadth in breadths:
+            engine = NeighborEngine(wv)  # no warm neighbor state between grid points
+            nodes = []
+
+            def build(root: str) -> None:
+                tree = build_similarity_tree(wv, root, depth=depth, breadth=breadth,
+                                             word_filter=word_filter, engine=engine)
+                stack, n = [tree], 0
+                while stack:
+                    node = stack.pop()
+                    n += 1
+                    stack.extend(node["children"])
+                nodes.append(n)
+
+            ms = time_each(build, roots)
+            rows.append({"depth": depth, "breadth": breadth, "mean_nodes": round(float(np.mean(nodes)), 1),
+                         "scans_per_tree": round(engine.scans / len(roots), 2), **summarize(ms)})
+    return rows
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """p50 regressions beyond `tolerance` (0.25 = 25% slower) versus a baseline result file."""
+    slower = []
+    pairs = [(f"stage {name}", row, baseline.get("stages", {}).get(name))
+             for name, row in current["stages"].items()]
+    old_grid = {(r["depth"], r["breadth"]): r for r in baseline.get("grid", [])}
+    pairs += [(f"tree depth={r['depth']} breadth={r['breadth']}", r, old_grid.get((r["depth"], r["breadth"])))
+              for r in current["grid"]]
+    for label, new, old in pairs:
+        if old and old["p50_ms"] > 0 and new["p50_ms"] > old["p50_ms"] * (1.0 + tolerance):
+            slower.append(f"{label}: p50 {old['p50_ms']:.3f} -> {new['p50_ms']:.3f} ms "
+                          f"(+{(new['p50_ms'] / old['p50_ms'] - 1) * 100:.0f}%)")
+    return slower
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark tree-pipeline stages on synthetic vectors.")
+    ap.add_argument("--kv", default=None, help="Existing .kv to use instead of synthetic vectors")
+    ap.add_argument("--rows", type=int, default=50000, help="Synthetic vocabulary size (10k-1M)")
+    ap.add_argument("--dim", type=int, default=300, help="Synthetic dimensionality (100-300)")
+    ap.add_argument("--real-words", action="store_true", help="Synthetic base words from pyspellchecker")
+    ap.add_argument("--spell", action="store_true", help="Enable the dictionary check in HybridFilter")
+    ap.add_argument("--roots", type=int, default=20, help="Random root words per measurement")
+    ap.add_argument("--samples", type=int, default=500, help="Lookups per pick_token/is_valid stage (x10 for is_valid)")
+    ap.add_argument("--depth", type=int, nargs="+", default=[2, 3, 4], help="Grid of tree depths")
+    ap.add_argument("--breadth", type=int, nargs="+", default=[2, 4, 6], help="Grid of breadths")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="Write results as JSON")
+    ap.add_argument("--baseline", default=None, help="Earlier --json output to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 slowdown vs baseline")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    if args.kv:
+        wv = KeyedVectors.load(args.kv, mmap="r")
+    else:
+        wv = make_synthetic_kv(args.rows, args.dim, seed=args.seed, real_words=args.real_words)
+    load_s = time.perf_counter() - t0
+
+    rng = np.random.default_rng(args.seed)
+    word_filter = HybridFilter(use_spell=args.spell)
+    keys = wv.index_to_key
+    candidates = [i for i in rng.permutation(len(keys))[: args.roots * 50]
+                  if is_clean_word(keys[i]) and is_probable_shape(keys[i])]
+    roots = [keys[i] for i in candidates[: args.roots]]
+
+    stages = run_stages(wv, word_filter, roots, rng, args.samples)
+    grid = run_grid(wv, word_filter, roots, args.depth, args.breadth)
+
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "gensim": gensim.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "model": args.kv or "synthetic",
+            "vocab": len(keys),
+            "dim": wv.vector_size,
+            "seed": args.seed,
+            "spell": bool(word_filter.use_spell),
+            "roots": roots,
+            "load_seconds": round(load_s, 3),
+        },
+        "stages": stages,
+        "grid": grid,
+    }
+
+    print(f"vocab={len(keys)} dim={wv.vector_size} roots={len(roots)} (loaded in {load_s:.2f}s)")
+    print(f"{'stage':<22} {'calls':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, r in stages.items():
+        print(f"{name:<22} {r['calls']:>6} {r['mean_ms']:>9.4f} {r['p50_ms']:>9.4f} {r['p95_ms']:>9.4f}")
+    print(f"\n{'depth':>5} {'breadth':>7} {'nodes':>6} {'scans':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for r in grid:
+        print(f"{r['depth']:>5} {r['breadth']:>7} {r['mean_nodes']:>6} {r['scans_per_tree']:>6} "
+              f"{r['mean_ms']:>9.2f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            slower = compare(result, json.load(f), args.tolerance)
+        if slower:
+            print(f"\nRegressions vs {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in slower:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\nNo p50 regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
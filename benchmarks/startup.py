@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cold-start costs: import time, CLI startup and time to the first tree.
+
+    python benchmarks/startup.py --rows 50000 --repeat 5
+    python benchmarks/startup.py --kv lexvec_300d.kv --json startup.json
+    python benchmarks/startup.py --rows 50000 --baseline-dir ../package-old
+
+Every number comes from fresh interpreter processes (median of --repeat):
+- import main: wall time of the import alone, and of `python -c "import main"`
+- run_cli() --help: CLI startup with nothing to do
+- run_cli() --kv ... --roots ...: one CLI tree end to end
+- first tree in a server-style process: import + model load, then the first
+  and the second build_similarity_tree, without preload() ("lazy": optional
+  dependencies load inside the first request) and with preload()
+  before the model load ("preload", as app.py does)
+--baseline-dir runs the same probes against another checkout (e.g. a
+`git worktree` of an older commit) and prints both columns.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from synthetic_kv import make_synthetic_kv  # noqa: E402
+
+# Child side of the first-tree probe (run with cwd = the checkout under test)
+_FIRST_TREE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter() - t0
+if sys.argv[1] == "preload" and hasattr(main, "preload"):
+    main.preload()
+from gensim.models import KeyedVectors
+wv = KeyedVectors.load(sys.argv[2], mmap="r")
+word_filter = main.HybridFilter(use_spell=False)
+t_ready = time.perf_counter() - t0
+t1 = time.perf_counter()
+main.build_similarity_tree(wv, sys.argv[3], word_filter=word_filter)
+t_first = time.perf_counter() - t1
+t1 = time.perf_counter()
+main.build_similarity_tree(wv, sys.argv[4], word_filter=word_filter)
+t_second = time.perf_counter() - t1
+print(json.dumps({"import_s": t_import, "ready_s": t_ready, "first_tree_s": t_first,
+                  "second_tree_s": t_second, "total_s": t_ready + t_first}))
+"""
+
+# main.py runs run_in_code() unless USE_CLI is set, so the CLI probes call run_cli() directly
+_CLI = "import main; main.run_cli()"
+
+_IMPORT = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+print(json.dumps({"import_s": time.perf_counter() - t0}))
+"""
+
+def run(cmd: List[str], cwd: str) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    out = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - t0
+    last = out.stdout.strip().splitlines()[-1] if out.stdout.strip() else ""
+    res = json.loads(last) if last.startswith("{") else {}
+    res["wall_s"] = wall
+    return res
+
+def median_of(repeat: int, cmd: List[str], cwd: str) -> Dict[str, float]:
+    runs = [run(cmd, cwd) for _ in range(repeat)]
+    return {k: round(float(np.median([r[k] for r in runs])) * 1000.0, 1) for k in runs[0]}  # ms
+
+def probe_checkout(cwd: str, kv_path: str, roots: List[str], repeat: int) -> Dict[str, Dict[str, float]]:
+    py = sys.executable
+    return {
+        "import main": median_of(repeat, [py, "-c", _IMPORT], cwd),
+        "run_cli --help": median_of(repeat, [py, "-c", _CLI, "--help"], cwd),
+        "run_cli one tree": median_of(repeat, [py, "-c", _CLI, "--kv", kv_path, "--roots", roots[0],
+                                               "--no-spell"], cwd),
+        "first tree (lazy)": median_of(repeat, [py, "-c", _FIRST_TREE, "lazy", kv_path, *roots], cwd),
+        "first tree (preload)": median_of(repeat, [py, "-c", _FIRST_TREE, "preload", kv_path, *roots], cwd),
+    }
+
+def pick_roots(kv_path: str) -> List[str]:
+    from gensim.models import KeyedVectors
+    from main import is_clean_word, is_probable_shape
+
+    wv = KeyedVectors.load(kv_path, mmap="r")
+    words = [w for w in wv.index_to_key[:1000] if is_clean_word(w) and is_probable_shape(w)]
+    return [words[0], words[1]]
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark import / CLI / first-tree startup times.")
+    ap.add_argument("--kv", default=None, help="Existing .kv to use instead of synthetic vectors")
+    ap.add_argument("--rows", type=int, default=50000, help="Synthetic vocabulary size")
+    ap.add_argument("--dim", type=int, default=300, help="Synthetic dimensionality")
+    ap.add_argument("--repeat", type=int, default=5, help="Fresh processes per probe (median reported)")
+    ap.add_argument("--baseline-dir", default=None, help="Another checkout to measure the same way")
+    ap.add_argument("--json", default=None, help="Write results as JSON")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="startup_bench_")
+    try:
+        kv_path = os.path.abspath(args.kv) if args.kv else os.path.join(workdir, "model.kv")
+        if not args.kv:
+            make_synthetic_kv(args.rows, args.dim).save(kv_path)
+        roots = pick_roots(kv_path)
+        results = {"current": probe_checkout(REPO, kv_path, roots, args.repeat)}
+        if args.baseline_dir:
+            results["baseline"] = probe_checkout(os.path.abspath(args.baseline_dir), kv_path, roots, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    cols = list(results)
+    print(f"roots={roots} repeat={args.repeat} (median ms)")
+    print(f"{'':<37}" + "".join(f"{c:>10}" for c in cols))
+    for probe in results["current"]:
+        for key in results["current"][probe]:
+            vals = "".join(f"{results[c][probe].get(key, float('nan')):>10}" for c in cols)
+            print(f"{probe:<22} {key:<14}{vals}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"roots": roots, "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
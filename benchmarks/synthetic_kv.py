@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic KeyedVectors for benchmarking without the lexvec download.
+
+    python benchmarks/synthetic_kv.py --rows 100000 --dim 300 --out synthetic_100k.kv
+
+Vocabulary mimics a real embedding vocab (fractions of --rows):
+- ~55% base words: dictionary words from pyspellchecker when installed
+  (--real-words), else pronounceable pseudo-words
+- ~20% inflections (-s, -ed, -ing, -er, -ly, ...) that share a morphological family
+- ~5% Capitalized forms, ~5% one-edit typos (near-duplicates for the dedupe checks)
+- ~5% unpronounceable junk and ~10% noise (digits, underscores, hyphens, urls)
+  that the clean-word/shape filters reject
+
+Vectors: base words scattered around topic centers; every variant sits close
+to its base word, as inflections and misspellings do in trained embeddings.
+"""
+
+import argparse
+from typing import List, Optional, Tuple
+
+import numpy as np
+from gensim.models import KeyedVectors
+
+_ONSETS = ["b", "bl", "br", "c", "ch", "cl", "cr", "d", "dr", "f", "fl", "fr", "g", "gl", "gr", "h", "j",
+           "k", "l", "m", "n", "p", "pl", "pr", "qu", "r", "s", "sh", "sl", "sp", "st", "t", "th", "tr",
+           "v", "w", "wh", "y", "z"]
+_VOWELS = ["a", "e", "i", "o", "u", "ai", "ea", "ee", "ie", "oa", "oo", "ou"]
+_CODAS = ["", "", "", "n", "r", "s", "t", "l", "m", "nd", "nt", "st", "ck", "ng", "rt"]
+_SUFFIXES = ["s", "es", "ed", "ing", "er", "ers", "ly", "ness", "ment", "ful"]
+_CONSONANTS = list("bcdfghjklmnpqrstvwxz")
+
+def _pseudo_word(rng: np.random.Generator) -> str:
+    return "".join(
+        _ONSETS[rng.integers(len(_ONSETS))] + _VOWELS[rng.integers(len(_VOWELS))] + _CODAS[rng.integers(len(_CODAS))]
+        for _ in range(int(rng.integers(1, 4)))
+    )
+
+def _dictionary_words(limit: int) -> List[str]:
+    try:
+        from spellchecker import SpellChecker
+    except ImportError:
+        return []
+    freq = SpellChecker(language="en").word_frequency.dictionary
+    words = sorted(freq, key=lambda w: -freq[w])  # most frequent first
+    return [w for w in words if w.isalpha() and len(w) > 1][:limit]
+
+def _typo(word: str, rng: np.random.Generator) -> str:
+    i = int(rng.integers(len(word)))
+    kind = rng.integers(3)
+    if kind == 0 and len(word) > 3:  # deletion
+        return word[:i] + word[i + 1:]
+    if kind == 1 and i < len(word) - 1:  # transposition
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word[:i] + _CONSONANTS[rng.integers(len(_CONSONANTS))] + word[i:]  # insertion
+
+def _noise(rng: np.random.Generator, base: str) -> str:
+    kind = rng.integers(5)
+    if kind == 0:
+        return f"{base}{rng.integers(0, 2000)}"
+    if kind == 1:
+        return f"{base}_{_pseudo_word(rng)}"
+    if kind == 2:
+        return f"{_pseudo_word(rng)}-{base}"
+    if kind == 3:
+        return f"www.{base}.com"
+    return str(rng.integers(0, 10 ** 6))
+
+def make_vocab(rows: int, seed: int = 0, real_words: bool = False) -> Tuple[List[str], np.ndarray]:
+    """Returns (tokens, base) where base[i] is the row of token i's base word (itself for bases)."""
+    rng = np.random.default_rng(seed)
+    n_base = max(1, int(rows * 0.55))
+    seen = set()
+    tokens: List[str] = []
+    base: List[int] = []
+
+    def add(tok: str, of: int) -> None:
+        if tok and tok not in seen and len(tokens) < rows:
+            seen.add(tok)
+            tokens.append(tok)
+            base.append(of if of >= 0 else len(tokens) - 1)
+
+    for w in (_dictionary_words(n_base) if real_words else []):
+        add(w, -1)
+    while len(tokens) < n_base:
+        add(_pseudo_word(rng), -1)
+    n_base = len(tokens)
+
+    # (share of rows, maker) for variant kinds, drawn from random base words
+    kinds = [
+        (0.20, lambda b: b + _SUFFIXES[rng.integers(len(_SUFFIXES))]),
+        (0.05, lambda b: b.title()),
+        (0.05, lambda b: _typo(b, rng)),
+        (0.05, lambda b: "".join(rng.choice(_CONSONANTS, size=int(rng.integers(4, 9))))),
+        (0.10, lambda b: _noise(rng, b)),
+    ]
+    for share, make in kinds:
+        target = len(tokens) + int(rows * share)
+        tries = 0
+        while len(tokens) < min(target, rows) and tries < rows * 4:
+            tries += 1
+            b = int(rng.integers(n_base))
+            add(make(tokens[b]), b)
+    while len(tokens) < rows:  # top up if the variant pools collided
+        add(_pseudo_word(rng) + _pseudo_word(rng), -1)
+    return tokens, np.asarray(base, dtype=np.int64)
+
+def make_synthetic_kv(
+    rows: int = 50000,
+    dim: int = 300,
+    seed: int = 0,
+    real_words: bool = False,
+    topics: Optional[int] = None,
+) -> KeyedVectors:
+    """Clustered float32 vectors over make_vocab(); deterministic for a given seed."""
+    tokens, base = make_vocab(rows, seed=seed, real_words=real_words)
+    rng = np.random.default_rng(seed + 1)
+    topics = topics or max(20, rows // 250)
+    centers = rng.standard_normal((topics, dim), dtype=np.float32)
+    vectors = np.empty((len(tokens), dim), dtype=np.float32)
+    is_base = base == np.arange(len(tokens))
+    base_rows = np.flatnonzero(is_base)
+    vectors[base_rows] = centers[rng.integers(topics, size=len(base_rows))]
+    vectors[base_rows] += 0.7 * rng.standard_normal((len(base_rows), dim), dtype=np.float32)
+    var_rows = np.flatnonzero(~is_base)
+    vectors[var_rows] = vectors[base[var_rows]]
+    vectors[var_rows] += 0.35 * rng.standard_normal((len(var_rows), dim), dtype=np.float32)
+
+    kv = KeyedVectors(dim, dtype=np.float32)
+    kv.add_vectors(tokens, vectors)
+    return kv
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Write a synthetic KeyedVectors model for benchmarks.")
+    ap.add_argument("--rows", type=int, default=50000, help="Vocabulary size (10k-1M)")
+    ap.add_argument("--dim", type=int, default=300, help="Vector dimensionality (100-300)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--real-words", action="store_true", help="Use pyspellchecker's English words as base words")
+    ap.add_argument("--out", required=True, help="Output .kv path")
+    args = ap.parse_args()
+
+    kv = make_synthetic_kv(args.rows, args.dim, seed=args.seed, real_words=args.real_words)
+    kv.save(args.out)
+    print(f"Saved {len(kv.index_to_key)} x {kv.vector_size} synthetic vectors to {args.out}")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tree serialization: nested JSON versus flat arrays (flat_tree.py).
+
+    python benchmarks/tree_serialization.py --rows 50000 --roots 50 --nodes 1000000
+    python benchmarks/tree_serialization.py --kv lexvec_300d.kv --nodes 5000000
+
+--roots real trees are built once, then repeated until the set holds
+--nodes nodes. Per format: seconds to write, seconds to read back, file
+size and (--memory) peak traced memory of a second write:
+- nested JSON, indent=2 (the old save_tree_json) and compact
+- batch JSON Lines (one {"root", "tree"} line per tree)
+- .wtree: save, load (memory-mapped, every array touched) and from_bytes
+- .npz (np.savez of the same arrays; loads by copying)
+- per-node JSON Lines and Markdown streamed from the arrays, against a
+  recursive walk over the nested dicts
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flat_tree import FlatTrees, FlatTreeWriter, flatten_events, write_jsonl, write_markdown
+from synthetic_kv import make_synthetic_kv
+
+def build_trees(kv_path: str, n: int, seed: int, params: Dict[str, Any]) -> FlatTrees:
+    from gensim.models import KeyedVectors
+    from main import FILTER_CONFIG, HybridFilter, is_clean_word, is_probable_shape, iter_similarity_tree
+    from neighbors import NeighborEngine
+
+    wv = KeyedVectors.load(kv_path, mmap="r")
+    engine = NeighborEngine(wv)
+    word_filter = HybridFilter(**{**FILTER_CONFIG, "use_spell": False})
+    keys = wv.index_to_key
+    rng = np.random.default_rng(seed)
+    roots = [keys[i] for i in rng.permutation(min(len(keys), 20000))[: n * 50]
+             if is_clean_word(keys[i]) and is_probable_shape(keys[i])][:n]
+    writer = FlatTreeWriter()
+    for r in roots:
+        writer.add_flat(flatten_events(iter_similarity_tree(wv, r, word_filter=word_filter, engine=engine, **params),
+                                       name=r))
+    return writer.finish()
+
+def replicate(flat: FlatTrees, nodes: int) -> FlatTrees:
+    writer = FlatTreeWriter()
+    while writer.n_nodes < nodes:
+        writer.add_flat(flat)
+    return writer.finish()
+
+def nested_markdown(node: Dict[str, Any], depth: int = 0) -> List[str]:
+    """A nested tree as the bullet lines flat_tree.write_markdown streams."""
+    score = node.get("score")
+    lines = [f"{'  ' * depth}- **{node['word']}**{'' if score is None else f' *(sim: {score:.3f})*'}"]
+    for ch in node["children"]:
+        lines.extend(nested_markdown(ch, depth + 1))
+    return lines
+
+def measure(write: Callable[[], Any], read: Optional[Callable[[], Any]], path: str,
+            memory: bool = False) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    write()
+    out = {"write_s": round(time.perf_counter() - t0, 4), "read_s": None,
+           "size_mb": round(os.path.getsize(path) / (1024 * 1024), 2), "peak_mb": None}
+    if read is not None:
+        t0 = time.perf_counter()
+        read()
+        out["read_s"] = round(time.perf_counter() - t0, 4)
+    if memory:  # a second, traced write: tracemalloc slows allocation-heavy code too much to time it
+        tracemalloc.start()
+        write()
+        out["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark nested JSON versus flat tree serialization.")
+    ap.add_argument("--kv", default=None, help="Existing .kv to use instead of synthetic vectors")
+    ap.add_argument("--rows", type=int, default=50000, help="Synthetic vocabulary size")
+    ap.add_argument("--dim", type=int, default=300, help="Synthetic dimensionality")
+    ap.add_argument("--roots", type=int, default=50, help="Distinct trees actually built")
+    ap.add_argument("--nodes", type=int, default=1000000, help="Total nodes after repeating the trees")
+    ap.add_argument("--depth", type=int, default=4)
+    ap.add_argument("--breadth", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--memory", action="store_true", help="Also trace peak memory of each write")
+    ap.add_argument("--json", default=None, help="Write results as JSON")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="treeser_bench_")
+    try:
+        if args.kv:
+            kv_path = args.kv
+        else:
+            kv_path = os.path.join(workdir, "model.kv")
+            make_synthetic_kv(args.rows, args.dim, seed=args.seed).save(kv_path)
+        flat = replicate(build_trees(kv_path, args.roots, args.seed, {"depth": args.depth, "breadth": args.breadth}),
+                         args.nodes)
+        names = [flat.name(i) for i in range(len(flat))]
+        nested = [flat.to_nested(i) for i in range(len(flat))]
+        path = lambda name: os.path.join(workdir, name)
+
+        def load_json(p: str) -> Any:
+            with open(p, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        def dump_json(p: str, **kw) -> None:
+            with open(p, "w", encoding="utf-8") as f:
+                json.dump(nested, f, ensure_ascii=False, **kw)
+
+        def write_batch() -> None:
+            with open(path("batch.jsonl"), "w", encoding="utf-8") as f:
+                for root, tree in zip(names, nested):
+                    f.write(json.dumps({"root": root, "tree": tree}, ensure_ascii=False, separators=(",", ":")))
+                    f.write("\n")
+
+        def read_batch() -> None:
+            with open(path("batch.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    json.loads(line)
+
+        def load_wtree() -> None:
+            loaded = FlatTrees.load(path("trees.wtree"))
+            for a in (loaded.parent, loaded.token, loaded.score, loaded.level):
+                a.sum()  # touch every page
+
+        def save_npz() -> None:
+            np.savez(path("trees.npz"), tree_offsets=flat.tree_offsets, parent=flat.parent, token=flat.token,
+                     score=flat.score, level=flat.level, names=flat.names, word_offsets=flat.word_offsets,
+                     word_data=flat.word_data)
+
+        def load_npz() -> None:
+            with np.load(path("trees.npz")) as z:
+                for name in z.files:
+                    z[name].sum()
+
+        def stream(p: str, export: Callable[[FlatTrees, Any], int]) -> Callable[[], None]:
+            def run() -> None:
+                with open(p, "w", encoding="utf-8") as f:
+                    export(flat, f)
+            return run
+
+        def recursive_markdown() -> None:
+            with open(path("recursive.md"), "w", encoding="utf-8") as f:
+                for root, tree in zip(names, nested):
+                    f.write(f"# {root}\n" + "\n".join(nested_markdown(tree)) + "\n\n")
+
+        rows = {
+            "json indent=2": measure(lambda: dump_json(path("indent.json"), indent=2),
+                                     lambda: load_json(path("indent.json")), path("indent.json"), args.memory),
+            "json compact": measure(lambda: dump_json(path("compact.json"), separators=(",", ":")),
+                                    lambda: load_json(path("compact.json")), path("compact.json"), args.memory),
+            "batch jsonl": measure(write_batch, read_batch, path("batch.jsonl"), args.memory),
+            "wtree": measure(lambda: flat.save(path("trees.wtree")), load_wtree, path("trees.wtree"), args.memory),
+            "npz": measure(save_npz, load_npz, path("trees.npz"), args.memory),
+            "node jsonl": measure(stream(path("nodes.jsonl"), write_jsonl), None, path("nodes.jsonl"), args.memory),
+            "md recursive": measure(recursive_markdown, None, path("recursive.md"), args.memory),
+            "md streamed": measure(stream(path("streamed.md"), write_markdown), None, path("streamed.md"), args.memory),
+        }
+        t0 = time.perf_counter()
+        blob = flat.to_bytes()
+        t1 = time.perf_counter()
+        FlatTrees.from_bytes(blob)
+        t2 = time.perf_counter()
+        with open(path("streamed.md"), "r", encoding="utf-8") as a, open(path("recursive.md"), "r", encoding="utf-8") as b:
+            same_md = a.read() == b.read()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"trees={len(flat)} nodes={flat.n_nodes} arrays={round(flat.nbytes / (1024 * 1024), 2)} MB "
+          f"to_bytes={round((t1 - t0) * 1000.0, 2)} ms from_bytes={round((t2 - t1) * 1000.0, 3)} ms "
+          f"markdown identical={same_md}")
+    print(f"{'format':>14} {'write s':>8} {'read s':>8} {'size MB':>8} {'peak MB':>8}")
+    for name, r in rows.items():
+        print(f"{name:>14} {r['write_s']:>8} {str(r['read_s'] if r['read_s'] is not None else '-'):>8} "
+              f"{r['size_mb']:>8} {str(r['peak_mb'] if r['peak_mb'] is not None else '-'):>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"trees": len(flat), "nodes": flat.n_nodes, "markdown_identical": same_md,
+                       "to_bytes_ms": round((t1 - t0) * 1000.0, 2), "from_bytes_ms": round((t2 - t1) * 1000.0, 3),
+                       "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Reduced-precision copy of the vector matrix for the full-vocabulary scan.
+
+- Rows are stored pre-normalized (unit length) as float16, or as int8 with a
+  float32 scale per row (4x smaller than the float32 .kv matrix)
+- The original norms are kept, so the engine no longer needs fill_norms()
+  (which reads the whole float32 matrix) when a compact store is attached
+- Queries score the compact rows in blocks; RescoredStream then rescores the
+  top candidates against the float32 vectors and only hands out rows whose
+  exact score provably beats every unrescored row (per-query error bound),
+  so rankings, and therefore trees, are the same as the exact scan
+- Saved next to the model as <model>.kv.compact/ (.npy arrays + meta.json)
+  and memory-mapped on load; only a handful of float32 rows per query are
+  paged in from the .kv file
+
+Build:  python compact_store.py --kv lexvec_300d.kv [--dtype int8|float16]
+"""
+
+import json
+import mmap
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from neighbors import CandidateStream
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors
+
+COMPACT_SUFFIX = ".compact"
+DTYPES = ("int8", "float16")
+
+# float32 rounding differences between the compact and exact dot products
+_SLACK = 1e-5
+
+def compact_dir_for(kv_path: str) -> str:
+    return kv_path + COMPACT_SUFFIX
+
+def advise_random(array: np.ndarray) -> bool:
+    """
+    madvise(MADV_RANDOM) on a memory-mapped array: with the scan on the compact
+    rows, the float32 matrix is only read a few rows at a time, and default
+    readahead would page in far more of it than rescoring needs.
+    """
+    advice = getattr(mmap, "MADV_RANDOM", None)
+    while array is not None and not isinstance(array, np.memmap):
+        array = getattr(array, "base", None)
+    mm = getattr(array, "_mmap", None)
+    if advice is None or mm is None:
+        return False
+    try:
+        mm.madvise(advice)
+    except (OSError, ValueError):
+        return False
+    return True
+
+# =============================
+# Store
+# =============================
+
+class CompactVectors:
+    """
+    codes:  (V, d) int8 or float16 unit rows
+    scales: (V,) float32 per-row scale (int8 only; unit row ~= codes * scale)
+    norms:  (V,) float32 norms of the original rows
+    """
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray], norms: np.ndarray,
+                 meta: Optional[Dict[str, Any]] = None, block: int = 1024):
+        self.codes = codes
+        self.scales = scales
+        self.norms = norms
+        self.meta = meta or {}
+        self.block = block  # rows converted to float32 at a time (small enough to stay in cache)
+
+    @property
+    def dtype(self) -> str:
+        return str(self.codes.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.norms.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    # ---- build ----
+
+    @classmethod
+    def build(cls, wv: "KeyedVectors", dtype: str = "int8", chunk: int = 65_536,
+              fingerprint: Optional[str] = None) -> "CompactVectors":
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+        t0 = time.perf_counter()
+        n, d = len(wv.vectors), int(wv.vector_size)
+        codes = np.empty((n, d), dtype=np.int8 if dtype == "int8" else np.float16)
+        scales = np.empty(n, dtype=np.float32) if dtype == "int8" else None
+        norms = np.empty(n, dtype=np.float32)
+        max_residual = 0.0
+        for start in range(0, n, chunk):
+            rows = np.asarray(wv.vectors[start:start + chunk], dtype=np.float32)
+            stop = start + len(rows)
+            nrm = np.linalg.norm(rows, axis=1)
+            norms[start:stop] = nrm
+            unit = rows / np.where(nrm > 0, nrm, 1.0)[:, None]
+            if scales is None:
+                codes[start:stop] = unit.astype(np.float16)
+                decoded = codes[start:stop].astype(np.float32)
+            else:
+                peak = np.abs(unit).max(axis=1)
+                scale = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+                codes[start:stop] = np.rint(unit / scale[:, None]).astype(np.int8)
+                scales[start:stop] = scale
+                decoded = codes[start:stop] * scale[:, None]
+            max_residual = max(max_residual, float(np.linalg.norm(unit - decoded, axis=1).max(initial=0.0)))
+        meta = {
+            "dtype": dtype,
+            "dim": d,
+            "vocab_size": n,
+            "max_residual": max_residual,
+            "fingerprint": fingerprint,
+            "build_seconds": round(time.perf_counter() - t0, 3),
+        }
+        return cls(codes, scales, norms, meta)
+
+    # ---- persistence ----
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "codes.npy"), self.codes)
+        np.save(os.path.join(path, "norms.npy"), self.norms)
+        scales_path = os.path.join(path, "scales.npy")
+        if self.scales is not None:
+            np.save(scales_path, self.scales)
+        elif os.path.exists(scales_path):
+            os.remove(scales_path)  # left over from an int8 build
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CompactVectors":
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        scales_path = os.path.join(path, "scales.npy")
+        return cls(
+            np.load(os.path.join(path, "codes.npy"), mmap_mode=mode),
+            np.load(scales_path) if os.path.exists(scales_path) else None,  # small; keep in RAM
+            np.load(os.path.join(path, "norms.npy")),
+            meta,
+        )
+
+    # ---- search ----
+
+    def score(self, q: np.ndarray) -> np.ndarray:
+        """Approximate cosine of every row to each unit query row, shape (b, V)."""
+        n = len(self.codes)
+        out = np.empty((len(q), n), dtype=np.float32)
+        qt = np.ascontiguousarray(q.T, dtype=np.float32)
+        for start in range(0, n, self.block):
+            block = np.asarray(self.codes[start:start + self.block], dtype=np.float32)
+            sims = (block @ qt).T
+            if self.scales is not None:
+                sims *= self.scales[start:start + len(block)]
+            out[:, start:start + len(block)] = sims
+        return out
+
+    def error_bound(self, q: np.ndarray) -> np.ndarray:
+        """
+        Per query row: max |approximate - exact| cosine over all rows
+        (Cauchy-Schwarz: |(u - decoded(u)) . q| <= max_residual * |q|).
+        """
+        return self.meta["max_residual"] * np.linalg.norm(q, axis=1) + _SLACK
+
+    @classmethod
+    def load_for(cls, kv_path: str, fingerprint: Optional[str], vocab_size: int) -> Optional["CompactVectors"]:
+        """Memory-map <kv>.compact/ if it was built for this exact file, else None."""
+        path = compact_dir_for(kv_path)
+        if not os.path.isdir(path):
+            return None
+        store = cls.load(path)
+        if store.meta.get("fingerprint") != fingerprint or store.meta.get("vocab_size") != vocab_size:
+            print(f"Ignoring stale compact store {path} (rebuild with compact_store.py)")
+            return None
+        return store
+
+# =============================
+# Rescored candidate stream
+# =============================
+
+class RescoredStream(CandidateStream):
+    """
+    Exact ranking from approximate scores. Candidates are read from the
+    approximate ranking in doubling rounds and rescored exactly; a rescored
+    row is handed out once its exact score is >= (next unrescored approximate
+    score + error bound), i.e. no row left behind can still outrank it.
+    """
+
+    def __init__(self, engine, approx: CandidateStream, q: np.ndarray, err: float):
+        super().__init__(engine.wv.index_to_key, np.empty(0, dtype=np.float32), approx._exclude)
+        self._engine = engine
+        self._approx = approx
+        self._q = q
+        self._err = float(err)
+        self._rows = np.empty(0, dtype=np.int64)      # rescored rows
+        self._exact = np.empty(0, dtype=np.float32)   # their exact scores
+        self._done = False
+
+    def _rescore_more(self, n: int) -> None:
+        want = max(n, 2 * len(self._rows), 16)
+        rows, approx = self._approx.take_rows(want + 1)  # +1: the first row we do not rescore
+        new = rows[len(self._rows):want]
+        if len(new):
+            self._rows = np.concatenate((self._rows, new))
+            self._exact = np.concatenate((self._exact, self._engine.score_rows(self._q, new)))
+            self._engine.rescored += len(new)
+        if len(rows) > want:
+            cut = float(approx[want]) + self._err
+        else:
+            cut = -np.inf  # every remaining row is rescored
+            self._done = True
+        rank = np.argsort(-self._exact, kind="stable")
+        rank = rank[self._exact[rank] >= cut]
+        self._order = self._rows[rank]
+        self._scores = self._exact[rank]
+
+    @property
+    def exhausted(self) -> bool:
+        return self._done
+
+    def take_rows(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        while len(self._order) < n and not self._done:
+            self._rescore_more(n)
+        n = min(n, len(self._order))
+        return self._order[:n], self._scores[:n]
+
+# =============================
+# Build CLI
+# =============================
+
+if __name__ == "__main__":
+    import argparse
+    from gensim.models import KeyedVectors
+    from registry import model_fingerprint
+
+    ap = argparse.ArgumentParser(description="Write a float16/int8 copy of a .kv matrix for compact scans.")
+    ap.add_argument("--kv", required=True, help="Path to KeyedVectors .kv file")
+    ap.add_argument("--dtype", choices=DTYPES, default="int8", help="Storage type of the unit rows")
+    args = ap.parse_args()
+
+    wv = KeyedVectors.load(args.kv, mmap="r")
+    store = CompactVectors.build(wv, dtype=args.dtype, fingerprint=model_fingerprint(args.kv))
+    out = compact_dir_for(args.kv)
+    store.save(out)
+    full_mb = wv.vectors.nbytes / (1024 * 1024)
+    print(f"Saved {args.dtype} store to {out} in {store.meta['build_seconds']}s: "
+          f"{store.nbytes / (1024 * 1024):.1f} MB vs {full_mb:.1f} MB float32")
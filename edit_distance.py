@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Built-in normalized Levenshtein similarity (used when rapidfuzz is not installed).
+
+- Same definition as rapidfuzz.distance.Levenshtein.normalized_similarity:
+  1 - distance / max(len(a), len(b)), unit costs, case-sensitive, 1.0 for
+  two empty strings
+- One-vs-many: Myers/Hyyro bit-parallel DP, one uint64 bit-vector per
+  candidate, all candidates advanced together column by column in NumPy
+  (patterns longer than 64 chars use the same recurrence on Python ints)
+- score_cutoff: distance >= |len(a) - len(b)| and >= the character-multiset
+  (bag) distance, so candidates whose length ratio or letter counts already
+  cap their similarity below the cutoff skip the DP and are reported as 0.0
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_WORD = 64  # pattern length handled by the uint64 path
+_FEW = 8    # below this many rows, per-pair Python ints beat per-column array ops
+
+def _peq(a: str) -> Dict[str, int]:
+    """Bit i set in peq[c] where a[i] == c."""
+    peq: Dict[str, int] = {}
+    for i, ch in enumerate(a):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    return peq
+
+def distance(a: str, b: str) -> int:
+    """Levenshtein distance (bit-parallel on Python ints, any length)."""
+    if len(a) < len(b):
+        a, b = b, a  # shorter string as the text: fewer columns
+    m = len(a)
+    if m == 0:
+        return len(b)
+    peq = _peq(a)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for ch in b:
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+def normalized_similarity(a: str, b: str) -> float:
+    longest = max(len(a), len(b))
+    return 1.0 - distance(a, b) / longest if longest else 1.0
+
+def _codes(strings: List[str], width: int) -> np.ndarray:
+    """(n, width) uint32 code points, zero-padded (one UTF-32 encode for the whole batch)."""
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    flat = np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32)
+    out = np.zeros((len(strings), width), dtype=np.uint32)
+    rows = np.repeat(np.arange(len(strings)), lengths)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    out[rows, cols] = flat
+    return out
+
+def _bag_distance(a: str, codes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    max(|A - B|, |B - A|) over character multisets: a lower bound on the edit
+    distance that costs a few array ops for the whole batch.
+    """
+    a_codes = np.frombuffer(a.encode("utf-32-le"), dtype=np.uint32)
+    chars, ids = np.unique(np.concatenate((codes.ravel(), a_codes)), return_inverse=True)
+    k = len(chars)
+    n = len(codes)
+    b_ids = ids[:codes.size].reshape(codes.shape)
+    live = np.arange(codes.shape[1]) < lengths[:, None]  # padding is not a character
+    counts = np.bincount((np.arange(n)[:, None] * k + b_ids)[live], minlength=n * k).reshape(n, k)
+    diff = counts - np.bincount(ids[codes.size:], minlength=k)
+    return np.maximum(np.clip(diff, 0, None).sum(axis=1), np.clip(-diff, 0, None).sum(axis=1))
+
+def _distances_u64(a: str, codes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Levenshtein distance from a (1 <= len(a) <= 64) to every padded row of
+    codes, advancing all rows one column at a time. Bits above len(a) - 1
+    only ever receive carries and shifts from below, so no masking is needed.
+    """
+    m = len(a)
+    peq = _peq(a)
+    chars = np.array(sorted(peq, key=ord), dtype="U1").view(np.uint32)
+    masks = np.array([peq[chr(c)] for c in chars.tolist()], dtype=np.uint64)
+    cols = np.ascontiguousarray(codes.T)
+    pos = np.minimum(np.searchsorted(chars, cols), len(chars) - 1)
+    eqs = np.where(chars[pos] == cols, masks[pos], np.uint64(0))  # (L, n) match masks per column
+    live = (np.arange(len(cols))[:, None] < lengths).astype(np.uint64)
+
+    n = codes.shape[0]
+    one = np.uint64(1)
+    shift = np.uint64(m - 1)
+    pv = np.full(n, np.uint64((1 << m) - 1), dtype=np.uint64)
+    mv = np.zeros(n, dtype=np.uint64)
+    up = np.zeros(n, dtype=np.uint64)
+    down = np.zeros(n, dtype=np.uint64)
+    xh = np.empty(n, dtype=np.uint64)
+    for eq, on in zip(eqs, live):
+        xv = eq | mv
+        np.bitwise_and(eq, pv, out=xh)
+        xh += pv
+        xh ^= pv
+        xh |= eq
+        ph = xh | pv
+        np.invert(ph, out=ph)
+        ph |= mv
+        mh = pv & xh
+        up += (ph >> shift) & on
+        down += (mh >> shift) & on
+        ph <<= one
+        ph |= one
+        mh <<= one
+        np.bitwise_or(xv, ph, out=pv)
+        np.invert(pv, out=pv)
+        pv |= mh
+        np.bitwise_and(ph, xv, out=mv)
+    return m + up.astype(np.int64) - down.astype(np.int64)
+
+def normalized_similarity_many(a: str, bs: List[str], score_cutoff: Optional[float] = None) -> np.ndarray:
+    """normalized_similarity(a, b) for every b, float32; below score_cutoff -> 0.0."""
+    out = np.zeros(len(bs), dtype=np.float32)
+    if not bs:
+        return out
+    la = len(a)
+    lengths = np.fromiter(map(len, bs), dtype=np.int64, count=len(bs))
+    longest = np.maximum(lengths, la)
+    idx = np.arange(len(bs))
+    if score_cutoff is not None:
+        # distance >= |la - lb|  =>  similarity <= min / max
+        idx = np.flatnonzero(np.minimum(lengths, la) >= score_cutoff * longest - 1e-9)
+    if not len(idx):
+        return out
+    sub = [bs[i] for i in idx.tolist()]
+    if not la or la > _WORD or len(idx) <= _FEW:
+        dist = np.array([distance(a, b) for b in sub], dtype=np.int64) if la else lengths[idx]
+        return _finish(out, idx, dist, longest, score_cutoff)
+    codes = _codes(sub, int(lengths[idx].max()))
+    if score_cutoff is not None:
+        # distance >= bag distance  =>  similarity <= 1 - bag / max
+        ok = _bag_distance(a, codes, lengths[idx]) <= (1.0 - score_cutoff) * longest[idx] + 1e-9
+        idx, codes = idx[ok], codes[ok]
+        sub = [b for b, keep in zip(sub, ok.tolist()) if keep]
+        if not len(idx):
+            return out
+    if len(idx) <= _FEW:
+        dist = np.array([distance(a, b) for b in sub], dtype=np.int64)
+    else:
+        dist = _distances_u64(a, codes, lengths[idx])
+    return _finish(out, idx, dist, longest, score_cutoff)
+
+def _finish(out: np.ndarray, idx: np.ndarray, dist: np.ndarray, longest: np.ndarray,
+            score_cutoff: Optional[float]) -> np.ndarray:
+    lng = longest[idx]
+    sims = np.where(lng > 0, 1.0 - dist / np.maximum(lng, 1), 1.0)
+    if score_cutoff is not None:
+        sims = np.where(sims >= score_cutoff, sims, 0.0)
+    out[idx] = sims
+    return out
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HybridFilter verdict caching.
+
+- VerdictLRU:  bounded, thread-safe LRU shared by all filters; keys are
+               (filter config key, word), so a different allow/deny/spell
+               config never reuses stale verdicts
+- VerdictMask: the filter evaluated once over a whole vocabulary, stored as a
+               packed bitmask in <model>.kv.verdicts/<config digest>.npy and
+               memory-mapped on load; retrieval drops invalid rows before ranking
+
+Build:  python filter_cache.py --kv lexvec_300d.kv [--no-spell] [--allow-file ...]
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+MASK_SUFFIX = ".verdicts"
+
+def mask_dir_for(kv_path: str) -> str:
+    return kv_path + MASK_SUFFIX
+
+def config_digest(config_key: Tuple) -> str:
+    """Stable short id for a HybridFilter.config_key() (frozensets sorted)."""
+    parts = [sorted(p) if isinstance(p, frozenset) else p for p in config_key]
+    return hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()[:16]
+
+# =============================
+# Online LRU
+# =============================
+
+class VerdictLRU:
+    """HybridFilter reject reasons per (config key, word); "" = passes."""
+
+    def __init__(self, maxsize: int = 200_000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            v = self._data.get(key)
+            if v is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return v
+
+    def put(self, key: Hashable, value: str) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+# Shared by every HybridFilter in the process
+VERDICT_CACHE = VerdictLRU()
+
+# =============================
+# Offline whole-vocabulary mask
+# =============================
+
+class VerdictMask:
+    """Packed is_valid() bit per vocabulary row (bit order = np.packbits default)."""
+
+    def __init__(self, bits: np.ndarray, size: int, meta: Optional[Dict[str, Any]] = None):
+        self.bits = bits
+        self.size = size
+        self.meta = meta or {}
+        self._valid: Optional[np.ndarray] = None
+
+    @property
+    def valid(self) -> np.ndarray:
+        """Unpacked bool array (V,), computed once."""
+        if self._valid is None:
+            self._valid = np.unpackbits(np.asarray(self.bits), count=self.size).astype(bool)
+        return self._valid
+
+    def __getitem__(self, row: int) -> bool:
+        return bool((self.bits[row >> 3] >> (7 - (row & 7))) & 1)
+
+    @classmethod
+    def build(cls, wv, word_filter, fingerprint: Optional[str] = None) -> "VerdictMask":
+        t0 = time.perf_counter()
+        valid = np.fromiter((word_filter.is_valid(k) for k in wv.index_to_key), dtype=bool,
+                            count=len(wv.index_to_key))
+        meta = {
+            "vocab_size": len(valid),
+            "valid": int(valid.sum()),
+            "fingerprint": fingerprint,
+            "config": config_digest(word_filter.config_key()),
+            "build_seconds": round(time.perf_counter() - t0, 3),
+        }
+        return cls(np.packbits(valid), len(valid), meta)
+
+    def save(self, kv_path: str) -> str:
+        d = mask_dir_for(kv_path)
+        os.makedirs(d, exist_ok=True)
+        np.save(os.path.join(d, f"{self.meta['config']}.npy"), self.bits)
+        with open(os.path.join(d, f"{self.meta['config']}.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        return d
+
+    @classmethod
+    def load_all(cls, kv_path: str, fingerprint: Optional[str] = None) -> Dict[str, "VerdictMask"]:
+        """Every mask saved for this model, keyed by config digest (stale ones skipped)."""
+        d = mask_dir_for(kv_path)
+        out: Dict[str, VerdictMask] = {}
+        if not os.path.isdir(d):
+            return out
+        for name in os.listdir(d):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(d, name), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+                print(f"Ignoring stale verdict mask {name} (rebuild with filter_cache.py)")
+                continue
+            bits = np.load(os.path.join(d, name[:-5] + ".npy"), mmap_mode="r")
+            out[meta["config"]] = cls(bits, meta["vocab_size"], meta)
+        return out
+
+if __name__ == "__main__":
+    import argparse
+    from gensim.models import KeyedVectors
+    from main import HybridFilter
+    from registry import model_fingerprint
+
+    ap = argparse.ArgumentParser(description="Precompute HybridFilter verdicts for a whole vocabulary.")
+    ap.add_argument("--kv", required=True, help="Path to KeyedVectors .kv file")
+    ap.add_argument("--lang", default="en", help="Language for pyspellchecker (if installed)")
+    ap.add_argument("--spell-distance", type=int, default=1, help="Edit distance for spellchecker")
+    ap.add_argument("--no-spell", action="store_true", help="Disable dictionary check even if available")
+    ap.add_argument("--allow-file", default=None, help="Path to newline-separated whitelist file")
+    ap.add_argument("--deny-file", default=None, help="Path to newline-separated blacklist file")
+    args = ap.parse_args()
+
+    def load_word_file(path: Optional[str]) -> set:
+        if not path: return set()
+        with open(path, "r", encoding="utf-8") as f:
+            return {line.strip().lower() for line in f if line.strip()}
+
+    wv = KeyedVectors.load(args.kv, mmap="r")
+    word_filter = HybridFilter(
+        allow=load_word_file(args.allow_file),
+        deny=load_word_file(args.deny_file),
+        language=args.lang,
+        spell_distance=args.spell_distance,
+        use_spell=not args.no_spell,
+        use_cache=False,
+    )
+    mask = VerdictMask.build(wv, word_filter, fingerprint=model_fingerprint(args.kv))
+    d = mask.save(args.kv)
+    print(f"{mask.meta['valid']}/{mask.size} valid; saved {d}/{mask.meta['config']}.npy "
+          f"in {mask.meta['build_seconds']}s")
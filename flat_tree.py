@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Flat, array-backed similarity trees and streaming exporters.
+
+- FlatTrees: any number of trees as parallel per-node arrays in build order
+  (the iter_similarity_tree event ids): parent (int32, row within the tree,
+  -1 = root), token (int32, into one word table shared by all trees), score
+  (float32 similarity to parent, NaN where unknown) and level (uint8);
+  tree_offsets (T+1,) int64 marks where each tree starts
+- Binary file (.wtree): magic, a JSON header with every array's dtype,
+  shape and offset, then the raw arrays 64-byte aligned. load() memory-maps
+  the file and each array is a view into it (zero-copy); from_bytes() does
+  the same over any buffer. No per-node decoding, NumPy only
+- FlatTreeWriter appends trees as they finish (from events, nested dicts or
+  other FlatTrees) into compact arrays, never holding nested dicts
+- write_jsonl / write_markdown stream nodes straight from the arrays, one
+  tree at a time; every distinct word is escaped once
+
+Convert:  python flat_tree.py trees.wtree --jsonl nodes.jsonl --md trees.md
+          python flat_tree.py --from-batch trees.jsonl --out trees.wtree
+"""
+
+import io
+import json
+import mmap
+import os
+from array import array
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"WTREE\x00\x01\x00"
+_ALIGN = 64
+
+# =============================
+# Flat trees
+# =============================
+
+class FlatTrees:
+    """
+    tree_offsets: (T+1,) int64, first node row of each tree (plus the total)
+    parent:       (N,) int32, parent row relative to its tree's first row; -1 = root
+    token:        (N,) int32, index into words
+    score:        (N,) float32, similarity to parent (NaN for roots and unknown)
+    level:        (N,) uint8, depth below the root
+    names:        (T,) int32, index into words of the word each tree was requested for
+    words:        word table, stored as UTF-8 bytes + offsets and decoded on first use
+    """
+
+    _ARRAYS = ("tree_offsets", "parent", "token", "score", "level", "names", "word_offsets", "word_data")
+
+    def __init__(self, tree_offsets: np.ndarray, parent: np.ndarray, token: np.ndarray, score: np.ndarray,
+                 level: np.ndarray, names: np.ndarray, word_offsets: np.ndarray, word_data: np.ndarray,
+                 buffer: Any = None):
+        self.tree_offsets = tree_offsets
+        self.parent = parent
+        self.token = token
+        self.score = score
+        self.level = level
+        self.names = names
+        self.word_offsets = word_offsets
+        self.word_data = word_data
+        self._words: Optional[List[str]] = None
+        self._buffer = buffer  # keeps a mapped file open while views into it exist
+
+    @staticmethod
+    def _word_table(words: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        encoded = [w.encode("utf-8") for w in words]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    @property
+    def words(self) -> List[str]:
+        if self._words is None:
+            data = self.word_data.tobytes()
+            bounds = self.word_offsets.tolist()
+            self._words = [data[a:b].decode("utf-8") for a, b in zip(bounds, bounds[1:])]
+        return self._words
+
+    def __len__(self) -> int:
+        return len(self.tree_offsets) - 1
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.parent)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self._ARRAYS)
+
+    def name(self, i: int) -> str:
+        return self.words[self.names[i]]
+
+    def rows(self, i: int) -> Tuple[int, int]:
+        """[start, stop) node rows of tree i."""
+        return int(self.tree_offsets[i]), int(self.tree_offsets[i + 1])
+
+    def events(self, i: int) -> Iterator[Dict[str, Any]]:
+        """Tree i as iter_similarity_tree() events (index/siblings recomputed)."""
+        start, stop = self.rows(i)
+        words = self.words
+        parent = self.parent[start:stop].tolist()
+        counts: Dict[int, int] = {}
+        for p in parent:
+            counts[p] = counts.get(p, 0) + 1
+        seen: Dict[int, int] = {}
+        for j, (p, t, s, lv) in enumerate(zip(parent, self.token[start:stop].tolist(),
+                                               self.score[start:stop].tolist(), self.level[start:stop].tolist())):
+            index = seen.get(p, 0)
+            seen[p] = index + 1
+            yield {"id": j, "parent": None if p < 0 else p, "word": words[t], "level": lv,
+                   "score": None if s != s else s, "index": index, "siblings": counts[p]}
+
+    def to_nested(self, i: int) -> Dict[str, Any]:
+        """Tree i as the {"word", "children"} dict build_similarity_tree returns."""
+        start, stop = self.rows(i)
+        words = self.words
+        nodes: List[Dict[str, Any]] = []
+        for p, t, s in zip(self.parent[start:stop].tolist(), self.token[start:stop].tolist(),
+                           self.score[start:stop].tolist()):
+            node = {"word": words[t], "children": []}
+            nodes.append(node)
+            if p >= 0:
+                node["score"] = None if s != s else s
+                nodes[p]["children"].append(node)
+        return nodes[0]
+
+    def dfs_order(self, i: int) -> np.ndarray:
+        """Rows of tree i (relative to its start) in depth-first, children-in-order sequence."""
+        start, stop = self.rows(i)
+        return np.array(_dfs_order(self.parent[start:stop].tolist()), dtype=np.int64)
+
+    # ---- binary format ----
+
+    def _header(self) -> bytes:
+        """Magic, header length, JSON header (array dtypes/shapes/offsets), padded to the first array."""
+        arrays, offset = {}, 0
+        for name in self._ARRAYS:
+            arr = getattr(self, name)
+            arrays[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+            offset += -(-arr.nbytes // _ALIGN) * _ALIGN
+        raw = json.dumps({"trees": len(self), "nodes": self.n_nodes, "arrays": arrays}).encode("utf-8")
+        raw += b" " * (-(len(MAGIC) + 8 + len(raw)) % _ALIGN)
+        return MAGIC + len(raw).to_bytes(8, "little") + raw
+
+    def write(self, f: IO[bytes]) -> int:
+        """Write the binary form to an open file; returns bytes written."""
+        head = self._header()
+        f.write(head)
+        size = len(head)
+        for name in self._ARRAYS:
+            arr = np.ascontiguousarray(getattr(self, name))
+            pad = -arr.nbytes % _ALIGN
+            f.write(memoryview(arr).cast("B"))
+            f.write(b"\0" * pad)
+            size += arr.nbytes + pad
+        return size
+
+    def to_bytes(self) -> bytes:
+        buf = io.BytesIO()
+        self.write(buf)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, buf: Any) -> "FlatTrees":
+        """Views into `buf` (bytes, memoryview, mmap): nothing is copied."""
+        view = memoryview(buf)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError("not a flat tree file (bad magic)")
+        n = int.from_bytes(view[len(MAGIC):len(MAGIC) + 8], "little")
+        base = len(MAGIC) + 8 + n
+        header = json.loads(bytes(view[len(MAGIC) + 8:base]))
+        arrays = {}
+        for name in cls._ARRAYS:
+            spec = header["arrays"][name]
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            arrays[name] = np.frombuffer(view, dtype=dtype, count=count,
+                                         offset=base + spec["offset"]).reshape(spec["shape"])
+        return cls(**arrays, buffer=buf)
+
+    def save(self, path: str) -> int:
+        """Write to path atomically; returns the file size."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            size = self.write(f)
+        os.replace(tmp, path)
+        return size
+
+    @classmethod
+    def load(cls, path: str, mmap_file: bool = True) -> "FlatTrees":
+        """Read a .wtree file; mmap_file=True maps it and returns views (zero-copy)."""
+        with open(path, "rb") as f:
+            if not mmap_file:
+                return cls.from_bytes(f.read())
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f"{path} is empty")
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_bytes(mapped)
+
+# =============================
+# Writer
+# =============================
+
+class FlatTreeWriter:
+    """Accumulates trees into compact arrays; finish() returns the FlatTrees."""
+
+    def __init__(self):
+        self._offsets = array("q", [0])
+        self._parent = array("i")
+        self._token = array("i")
+        self._score = array("f")
+        self._level = array("B")
+        self._names = array("i")
+        self._words: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self._parent)
+
+    def _word_id(self, word: str) -> int:
+        i = self._index.get(word)
+        if i is None:
+            i = self._index[word] = len(self._words)
+            self._words.append(word)
+        return i
+
+    def record(self, events: Iterable[Dict[str, Any]], name: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Pass iter_similarity_tree() events through, appending them as one tree."""
+        start = len(self._parent)
+        word_id = self._word_id
+        for event in events:
+            if event["id"] != len(self._parent) - start:
+                raise ValueError(f"events out of order: id {event['id']} at row {len(self._parent) - start}")
+            parent = event["parent"]
+            score = event.get("score")
+            self._parent.append(-1 if parent is None else parent)
+            self._token.append(word_id(event["word"]))
+            self._score.append(float("nan") if score is None else score)
+            self._level.append(event["level"])
+            yield event
+        if len(self._parent) == start:
+            raise ValueError("empty tree")
+        self._offsets.append(len(self._parent))
+        self._names.append(word_id(name if name is not None else self._words[self._token[start]]))
+
+    def add_events(self, events: Iterable[Dict[str, Any]], name: Optional[str] = None) -> None:
+        for _ in self.record(events, name=name):
+            pass
+
+    def add_tree(self, tree: Dict[str, Any], name: Optional[str] = None) -> None:
+        """A nested {"word", "children"} tree; each child's "score" is kept (NaN if it has none)."""
+        from main import tree_events
+
+        self.add_events(tree_events(tree), name=name)
+
+    def add_flat(self, flat: FlatTrees) -> None:
+        """Append every tree of another FlatTrees (e.g. returned by a worker process)."""
+        remap = np.array([self._word_id(w) for w in flat.words], dtype=np.int32)
+        base = len(self._parent)
+        self._offsets.extend((flat.tree_offsets[1:] + base).tolist())
+        self._parent.extend(flat.parent.tolist())
+        self._token.extend(remap[flat.token].tolist())
+        self._score.extend(flat.score.tolist())
+        self._level.extend(flat.level.tolist())
+        self._names.extend(remap[flat.names].tolist())
+
+    def finish(self) -> FlatTrees:
+        as_np = lambda a, dtype: np.frombuffer(a, dtype=dtype).copy() if len(a) else np.zeros(0, dtype=dtype)
+        word_offsets, word_data = FlatTrees._word_table(self._words)
+        flat = FlatTrees(as_np(self._offsets, np.int64), as_np(self._parent, np.int32),
+                         as_np(self._token, np.int32), as_np(self._score, np.float32),
+                         as_np(self._level, np.uint8), as_np(self._names, np.int32), word_offsets, word_data)
+        flat._words = list(self._words)
+        return flat
+
+def flatten_events(events: Iterable[Dict[str, Any]], name: Optional[str] = None) -> FlatTrees:
+    """One tree's iter_similarity_tree() events as a FlatTrees."""
+    writer = FlatTreeWriter()
+    writer.add_events(events, name=name)
+    return writer.finish()
+
+# =============================
+# Streaming exporters
+# =============================
+
+def _dfs_order(parent: List[int]) -> List[int]:
+    # plain lists: trees are small, NumPy call overhead would dominate
+    kids: List[List[int]] = [[] for _ in parent]
+    for j in range(1, len(parent)):
+        kids[parent[j]].append(j)
+    order: List[int] = []
+    stack = [0] if parent else []
+    while stack:
+        j = stack.pop()
+        order.append(j)
+        stack.extend(reversed(kids[j]))
+    return order
+
+def _scores_text(scores: np.ndarray) -> List[Optional[str]]:
+    return [None if s != s else repr(round(s, 6)) for s in scores.tolist()]
+
+def write_jsonl(flat: FlatTrees, f: IO[str], trees: Optional[Iterable[int]] = None) -> int:
+    """
+    One JSON line per node, in build order:
+    {"tree": i, "id": row, "parent": row|null, "word": str, "level": int, "score": float|null}.
+    Returns the number of lines written.
+    """
+    words = [json.dumps(w, ensure_ascii=False) for w in flat.words]
+    n = 0
+    for i in (range(len(flat)) if trees is None else trees):
+        start, stop = flat.rows(i)
+        lines = []
+        for j, (p, t, lv, s) in enumerate(zip(flat.parent[start:stop].tolist(), flat.token[start:stop].tolist(),
+                                              flat.level[start:stop].tolist(),
+                                              _scores_text(flat.score[start:stop]))):
+            lines.append(f'{{"tree":{i},"id":{j},"parent":{"null" if p < 0 else p},"word":{words[t]},'
+                         f'"level":{lv},"score":{"null" if s is None else s}}}\n')
+        f.write("".join(lines))
+        n += len(lines)
+    return n
+
+def write_markdown(flat: FlatTrees, f: IO[str], trees: Optional[Iterable[int]] = None) -> int:
+    """
+    Each tree as "# name" and a nested bullet list (depth-first), similarity
+    to parent in italics. Returns lines written.
+    """
+    words = flat.words
+    n = 0
+    for i in (range(len(flat)) if trees is None else trees):
+        start, stop = flat.rows(i)
+        token = flat.token[start:stop].tolist()
+        level = flat.level[start:stop].tolist()
+        scores = flat.score[start:stop].tolist()
+        lines = [f"# {flat.name(i)}\n"]
+        for j in _dfs_order(flat.parent[start:stop].tolist()):
+            s = scores[j]
+            sim = "" if s != s else f" *(sim: {s:.3f})*"
+            lines.append(f"{'  ' * level[j]}- **{words[token[j]]}**{sim}\n")
+        lines.append("\n")
+        f.write("".join(lines))
+        n += len(lines)
+    return n
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Convert and export flat tree files.")
+    ap.add_argument("path", nargs="?", default=None, help="Input .wtree file")
+    ap.add_argument("--from-batch", default=None, help="Read a batch.py JSON Lines file instead")
+    ap.add_argument("--out", default=None, help="Write the trees as .wtree")
+    ap.add_argument("--jsonl", default=None, help="Write one JSON line per node")
+    ap.add_argument("--md", default=None, help="Write Markdown")
+    args = ap.parse_args()
+
+    if args.from_batch:
+        writer = FlatTreeWriter()
+        with open(args.from_batch, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    writer.add_tree(rec["tree"], name=rec.get("root"))
+        flat = writer.finish()
+    elif args.path:
+        flat = FlatTrees.load(args.path)
+    else:
+        ap.error("give a .wtree path or --from-batch")
+
+    if args.out:
+        size = flat.save(args.out)
+        print(f"Saved {len(flat)} trees / {flat.n_nodes} nodes to {args.out} ({size / 1024:.1f} KB)")
+    if args.jsonl:
+        with open(args.jsonl, "w", encoding="utf-8") as f:
+            print(f"Wrote {write_jsonl(flat, f)} node lines to {args.jsonl}")
+    if args.md:
+        with open(args.md, "w", encoding="utf-8") as f:
+            write_markdown(flat, f)
+        print(f"Wrote Markdown to {args.md}")
@@ -12,32 +12,11 @@ wordForm.addEventListener('submit', (event) => {
 
     // Check if the user actually entered a word
     if (word) {
-        console.log(`Word submitted: "${word}". Attempting to send to backend...`);
-
-        // --- Use the Fetch API to send the word to the Flask backend ---
-        fetch('/api/word', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ word: word })
-        })
-        .then(response => {
-            console.log("Received initial response from /api/word");
-            if (!response.ok) {
-                console.error(`Backend responded with status: ${response.status}`);
-            } else {
-                console.log("Backend acknowledged the request successfully (Status:", response.status + ").");
-            }
-            // Proceed to redirect AFTER getting the initial response from fetch.
-            redirectToTreePage(word);
-        })
-        .catch(error => {
-            console.error('Error sending word to backend:', error);
-            // Still redirect.
-            redirectToTreePage(word);
-        });
+        console.log(`Word submitted: "${word}".`);
 
+        // The tree page streams the build from /api/word/stream and draws nodes as they
+        // arrive, so go there straight away instead of waiting for the whole tree here
+        redirectToTreePage(word);
     } else {
         wordInput.placeholder = "Please enter a word first!";
     }
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Precomputed k-nearest-neighbor graph for offline neighbor lookups.
+
+- For every vocabulary row: its top-K neighbors by cosine (query row
+  excluded), restricted to rows a HybridFilter config passes, best first
+- Stored CSR-style as <model>.kv.knn/: offsets (V+1,) int64, neighbors int32
+  and scores float32 (.npy, memory-mapped on load) + meta.json with K, the
+  filter config digest and the model fingerprint
+- Built offline in row chunks over a process pool; every worker memory-maps
+  the model and writes its rows straight into the output arrays
+- NeighborEngine.query_batch serves exact, masked queries for the graph's
+  filter config from it: a neighbor list is an array slice, no vocabulary
+  scan. A consumer reading past K falls back to a live scan (same ranking),
+  so trees are identical to the scan path
+
+Build:  python knn_graph.py --kv lexvec_300d.kv [--k 256] [--workers 8] [--no-spell]
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from neighbors import PrefixCandidateStream
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors
+
+GRAPH_SUFFIX = ".knn"
+
+def graph_dir_for(kv_path: str) -> str:
+    return kv_path + GRAPH_SUFFIX
+
+# =============================
+# Graph
+# =============================
+
+class KNNGraph:
+    """
+    offsets:   (V+1,) start of each row's list in `neighbors` / `scores`
+    neighbors: vocab rows, best first within each list
+    scores:    their cosines
+    """
+
+    def __init__(self, offsets: np.ndarray, neighbors: np.ndarray, scores: np.ndarray,
+                 meta: Optional[Dict[str, Any]] = None):
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.scores = scores
+        self.meta = meta or {}
+
+    @property
+    def k(self) -> int:
+        return int(self.meta.get("k", 0))
+
+    def row(self, r: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, stop = int(self.offsets[r]), int(self.offsets[r + 1])
+        return self.neighbors[start:stop], self.scores[start:stop]
+
+    def serves(self, mask) -> bool:
+        """True if lists were built for exactly this VerdictMask (or both unfiltered)."""
+        want = mask.meta.get("config") if mask is not None else None
+        return self.meta.get("filter") == want
+
+    def stream(self, engine, r: int, valid: Optional[np.ndarray] = None) -> "GraphCandidateStream":
+        return GraphCandidateStream(engine, self, r, valid=valid)
+
+    # ---- persistence ----
+
+    @classmethod
+    def create(cls, path: str, valid: Optional[np.ndarray], n: int, k: int,
+               meta: Dict[str, Any]) -> "KNNGraph":
+        """Allocate the on-disk arrays (every row gets min(K, candidates) slots)."""
+        os.makedirs(path, exist_ok=True)
+        n_valid = n if valid is None else int(valid.sum())
+        self_valid = np.ones(n, dtype=bool) if valid is None else valid
+        lengths = np.minimum(k, n_valid - self_valid.astype(np.int64))
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        total = int(offsets[-1])
+        open_memmap = np.lib.format.open_memmap
+        neighbors = open_memmap(os.path.join(path, "neighbors.npy"), mode="w+", dtype=np.int32, shape=(total,))
+        scores = open_memmap(os.path.join(path, "scores.npy"), mode="w+", dtype=np.float32, shape=(total,))
+        cls._write_meta(path, meta)
+        return cls(offsets, neighbors, scores, meta)
+
+    @staticmethod
+    def _write_meta(path: str, meta: Dict[str, Any]) -> None:
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, writable: bool = False) -> "KNNGraph":
+        mode = ("r+" if writable else "r") if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            np.load(os.path.join(path, "offsets.npy")),  # (V+1) int64; keep in RAM
+            np.load(os.path.join(path, "neighbors.npy"), mmap_mode=mode),
+            np.load(os.path.join(path, "scores.npy"), mmap_mode=mode),
+            meta,
+        )
+
+    @classmethod
+    def load_for(cls, kv_path: str, fingerprint: Optional[str], vocab_size: int) -> Optional["KNNGraph"]:
+        """Memory-map <kv>.knn/ if it is complete and was built for this exact file, else None."""
+        path = graph_dir_for(kv_path)
+        if not os.path.isfile(os.path.join(path, "meta.json")):
+            return None
+        graph = cls.load(path)
+        m = graph.meta
+        if m.get("fingerprint") != fingerprint or m.get("vocab_size") != vocab_size or not m.get("complete"):
+            print(f"Ignoring stale or unfinished k-NN graph {path} (rebuild with knn_graph.py)")
+            return None
+        return graph
+
+# =============================
+# Graph-backed candidate stream
+# =============================
+
+class GraphCandidateStream(PrefixCandidateStream):
+    """Neighbors of one row from the graph; past its K entries, a live scan."""
+
+    fallback_metric = "knn_graph_fallbacks_total"
+
+    def __init__(self, engine, graph: KNNGraph, r: int, valid: Optional[np.ndarray] = None):
+        rows, scores = graph.row(r)
+        # short list = every candidate row is in it
+        super().__init__(engine, r, rows, scores, len(rows) < graph.k, valid=valid)
+
+# =============================
+# Offline build
+# =============================
+
+# Per-worker state, set by _init_worker
+_WORKER: Dict[str, Any] = {}
+
+def _init_worker(kv_path: str, out_dir: str, valid: Optional[np.ndarray], k: int, batch: int) -> None:
+    from gensim.models import KeyedVectors
+    from neighbors import NeighborEngine
+
+    wv = KeyedVectors.load(kv_path, mmap="r")
+    _WORKER.update(engine=NeighborEngine(wv), graph=KNNGraph.load(out_dir, writable=True),
+                   valid=valid, k=k, batch=batch)
+
+def _build_rows(span: Tuple[int, int]) -> int:
+    """Fill the lists of rows [start, stop) in `batch`-row matrix products."""
+    engine, graph, valid = _WORKER["engine"], _WORKER["graph"], _WORKER["valid"]
+    k, batch = _WORKER["k"], _WORKER["batch"]
+    keys = engine.wv.index_to_key
+    start, stop = span
+    for lo in range(start, stop, batch):
+        rows = np.arange(lo, min(stop, lo + batch))
+        neg = -engine.score([keys[r] for r in rows.tolist()])
+        if valid is not None:
+            neg[:, ~valid] = np.inf
+        neg[np.arange(len(rows)), rows] = np.inf  # the query itself
+        kk = min(k, neg.shape[1] - 1)
+        top = np.argpartition(neg, kk - 1, axis=1)[:, :kk] if kk < neg.shape[1] else np.argsort(neg, axis=1)
+        top = np.take_along_axis(top, np.argsort(np.take_along_axis(neg, top, axis=1), axis=1), axis=1)
+        for i, r in enumerate(rows.tolist()):
+            a, b = int(graph.offsets[r]), int(graph.offsets[r + 1])
+            graph.neighbors[a:b] = top[i, : b - a]
+            graph.scores[a:b] = -neg[i, top[i, : b - a]]
+    graph.neighbors.flush()
+    graph.scores.flush()
+    return stop - start
+
+def build_graph(
+    kv_path: str,
+    k: int = 256,
+    word_filter=None,
+    workers: Optional[int] = None,
+    chunk: int = 4096,
+    batch: int = 64,
+    fingerprint: Optional[str] = None,
+) -> KNNGraph:
+    """
+    Compute and save <kv>.knn/. word_filter=None builds unfiltered lists; else
+    its verdict mask (saved to <kv>.verdicts/ too, so the server loads both).
+    batch rows are scored per matrix product: memory is batch * V * 4 bytes per worker.
+    """
+    from gensim.models import KeyedVectors
+    from filter_cache import VerdictMask, config_digest
+    from prune_vocab import filter_valid
+
+    t0 = time.perf_counter()
+    wv = KeyedVectors.load(kv_path, mmap="r")
+    n = len(wv.index_to_key)
+    valid = None
+    digest = None
+    if word_filter is not None:
+        valid = filter_valid(wv, word_filter, kv_path=kv_path, fingerprint=fingerprint)
+        digest = config_digest(word_filter.config_key())
+        mask = VerdictMask(np.packbits(valid), n, {"vocab_size": n, "valid": int(valid.sum()),
+                                                   "fingerprint": fingerprint, "config": digest})
+        mask.save(kv_path)
+
+    out = graph_dir_for(kv_path)
+    meta = {"k": k, "vocab_size": n, "dim": int(wv.vector_size), "filter": digest,
+            "fingerprint": fingerprint, "complete": False}
+    graph = KNNGraph.create(out, valid, n, k, meta)
+    del graph
+
+    spans = [(s, min(n, s + chunk)) for s in range(0, n, chunk)]
+    workers = workers or os.cpu_count() or 1
+    init_args = (kv_path, out, valid, k, batch)
+    if workers == 1:
+        _init_worker(*init_args)
+        done = sum(map(_build_rows, spans))
+        _WORKER.clear()
+    else:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=init_args) as pool:
+            done = sum(pool.imap_unordered(_build_rows, spans))
+
+    meta.update(complete=done == n, build_seconds=round(time.perf_counter() - t0, 3), workers=workers)
+    KNNGraph._write_meta(out, meta)
+    return KNNGraph.load(out)
+
+if __name__ == "__main__":
+    import argparse
+    from gensim.models import KeyedVectors
+    from main import HybridFilter
+    from registry import model_fingerprint
+
+    ap = argparse.ArgumentParser(description="Precompute the top-K filtered neighbors of every vocabulary row.")
+    ap.add_argument("--kv", required=True, help="Path to KeyedVectors .kv file")
+    ap.add_argument("--k", type=int, default=256, help="Neighbors kept per row")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all CPUs; 1 = in-process)")
+    ap.add_argument("--chunk", type=int, default=4096, help="Rows handed to a worker at a time")
+    ap.add_argument("--batch", type=int, default=64, help="Rows scored per matrix product")
+    ap.add_argument("--no-filter", action="store_true", help="Unfiltered lists (served only to unmasked queries)")
+    ap.add_argument("--lang", default="en", help="Language for pyspellchecker (if installed)")
+    ap.add_argument("--spell-distance", type=int, default=1, help="Edit distance for spellchecker")
+    ap.add_argument("--no-spell", action="store_true", help="Disable dictionary check even if available")
+    ap.add_argument("--allow-file", default=None, help="Path to newline-separated whitelist file")
+    ap.add_argument("--deny-file", default=None, help="Path to newline-separated blacklist file")
+    args = ap.parse_args()
+
+    def load_word_file(path: Optional[str]) -> set:
+        if not path: return set()
+        with open(path, "r", encoding="utf-8") as f:
+            return {line.strip().lower() for line in f if line.strip()}
+
+    word_filter = None if args.no_filter else HybridFilter(
+        allow=load_word_file(args.allow_file),
+        deny=load_word_file(args.deny_file),
+        language=args.lang,
+        spell_distance=args.spell_distance,
+        use_spell=not args.no_spell,
+        use_cache=False,
+    )
+    graph = build_graph(args.kv, k=args.k, word_filter=word_filter, workers=args.workers,
+                        chunk=args.chunk, batch=args.batch, fingerprint=model_fingerprint(args.kv))
+    size_mb = (graph.neighbors.nbytes + graph.scores.nbytes + graph.offsets.nbytes) / (1024 * 1024)
+    print(f"Saved k={graph.k} graph ({size_mb:.1f} MB) to {graph_dir_for(args.kv)} "
+          f"in {graph.meta['build_seconds']}s on {graph.meta['workers']} workers")
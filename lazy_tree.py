@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Expand-on-demand trees: serve a shallow tree, then grow single nodes per click.
+
+- A LazyTree keeps its TreeBuilder between requests, so the global used_norms
+  dedupe and the min_sim_to_root constraint carry over from one expansion to
+  the next
+- Expanding nodes in the eager build's order (depth-first, left to right)
+  yields exactly the tree build_similarity_tree would; any other order still
+  never repeats a word that is already in the tree
+- Nodes are addressed by their path of words from the root; each node says
+  whether it can still be expanded ("expandable")
+- Trees are per-session state in a bounded LRU (LAZY_TREES)
+"""
+
+import secrets
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from main import HybridFilter, TreeBuilder
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors
+
+# Request limits: levels a lazy tree may reach, levels one request may add
+MAX_DEPTH = 8
+MAX_STEP = 2
+
+class LazyTree:
+    def __init__(
+        self,
+        wv: "KeyedVectors",
+        root_word: str,
+        max_depth: int = MAX_DEPTH,
+        initial_depth: int = 2,
+        word_filter: Optional[HybridFilter] = None,
+        engine=None,
+        **params,
+    ):
+        """
+        max_depth:     levels including root the tree may grow to (like `depth`)
+        initial_depth: levels built up front (2 = root + its children)
+        params:        TreeBuilder parameters (breadth, min_sim_to_parent, ...)
+        """
+        self.builder = TreeBuilder(wv, root_word, word_filter=word_filter, engine=engine, **params)
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self.root = self._new_node(self.builder.root_token or root_word, 0)
+        if not self.builder.root_token:
+            self.root["expandable"] = False
+        self.expansions = 0
+        with self._lock:
+            self._grow(self.root, 0, initial_depth - 1)
+
+    def _new_node(self, token: str, level: int) -> Dict[str, Any]:
+        return {"word": token, "children": [], "expandable": level < self.max_depth - 1}
+
+    def _grow(self, node: Dict[str, Any], level: int, levels: int) -> None:
+        """Expand `node` (if not yet) and its descendants, `levels` deep, depth-first."""
+        if levels <= 0:
+            return
+        if node["expandable"]:
+            children = self.builder.choose_children(node["word"], level)
+            if levels > 1 and level + 1 < self.max_depth - 1:
+                # children are parents next: score them all in one matrix product
+                self.builder.prefetch([c for c, _ in children])
+            node["children"] = [self._new_node(c, level + 1) for c, _ in children]
+            node["expandable"] = False
+            self.expansions += 1
+        for child in node["children"]:
+            self._grow(child, level + 1, levels - 1)
+
+    def find(self, path: List[str]) -> Tuple[Dict[str, Any], int]:
+        """Node at `path` (words from the root, root included) and its level."""
+        if not path or path[0] != self.root["word"]:
+            raise LookupError(f"path must start at the root {self.root['word']!r}")
+        node = self.root
+        for level, word in enumerate(path[1:], start=1):
+            node = next((ch for ch in node["children"] if ch["word"] == word), None)
+            if node is None:
+                raise LookupError(f"no node {word!r} at level {level} of path {path}")
+        return node, len(path) - 1
+
+    def expand(self, path: List[str], levels: int = 1) -> Dict[str, Any]:
+        """Grow the node at `path` by up to `levels` levels; returns that node (subtree)."""
+        with self._lock:
+            node, level = self.find(path)
+            self._grow(node, level, levels)
+            return node
+
+    def size(self) -> int:
+        def count(node: Dict[str, Any]) -> int:
+            return 1 + sum(count(ch) for ch in node["children"])
+        return count(self.root)
+
+class LazyTreeStore:
+    """Bounded LRU of live LazyTrees, keyed by random ids."""
+
+    def __init__(self, max_items: int = 256):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, LazyTree]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, tree: LazyTree) -> str:
+        tid = secrets.token_hex(8)
+        with self._lock:
+            self._items[tid] = tree
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return tid
+
+    def get(self, tid: str) -> Optional[LazyTree]:
+        with self._lock:
+            tree = self._items.get(tid)
+            if tree is not None:
+                self._items.move_to_end(tid)
+            return tree
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+# One store per serving process (lazy trees are not shared between workers)
+LAZY_TREES = LazyTreeStore()
+
+def new_lazy_tree(word: str, initial_depth: int = 2, max_depth: int = MAX_DEPTH) -> Tuple[str, LazyTree]:
+    """LazyTree for `word` on the app's model/filter and TREE_PARAMS; returns (id, tree)."""
+    from main import FILTER_CONFIG, KV_PATH, TREE_PARAMS
+    from registry import REGISTRY
+
+    model = REGISTRY.get_model(KV_PATH)
+    params = {k: v for k, v in TREE_PARAMS.items() if k != "depth"}
+    tree = LazyTree(
+        model.wv, word, max_depth=max_depth, initial_depth=initial_depth,
+        word_filter=REGISTRY.get_filter(**FILTER_CONFIG), engine=model.engine, **params,
+    )
+    return LAZY_TREES.add(tree), tree
@@ -12,63 +12,154 @@ Run directly "in code" by editing CONFIG at bottom (default), or enable CLI by s
 """
 
 import json
+import math
 import re
 import os
 import asyncio
-import aiofiles
-from typing import List, Dict, Any, Optional, Tuple, Set
+import threading
+import time
+from importlib.util import find_spec
+from itertools import islice
+from typing import TYPE_CHECKING, List, Dict, Any, Iterator, Optional, Tuple, Set
 
-from gensim.models import KeyedVectors
+import numpy as np
+
+from neighbors import NeighborEngine, CandidateStream, CleanListMemo, get_engine
+from filter_cache import VERDICT_CACHE, VerdictLRU
+import metrics
+import edit_distance
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors  # imported where models are loaded (registry, run_cli)
+
+# Heavy optional dependencies are imported on first use (or by preload()), so
+# importing this module, the app, or a worker stays cheap. Availability is
+# checked with find_spec, which does not import anything.
 
 # -----------------------------
 # Optional pretty console output
 # -----------------------------
-try:
-    from colorama import Fore, Style, init as colorama_init
-    colorama_init(autoreset=True)
-    COLOR_ENABLED = True
-except Exception:
-    COLOR_ENABLED = False
-    class _N: RESET_ALL = ""
-    class _F: CYAN = ""
-    Fore = _F(); Style = _N()
+COLOR_ENABLED = find_spec("colorama") is not None
+_colors = None
+
+def _console_colors():
+    """(Fore, Style) from colorama, initialized on first use; None without colorama."""
+    global _colors, COLOR_ENABLED
+    if _colors is None and COLOR_ENABLED:
+        try:
+            from colorama import Fore, Style, init as colorama_init
+            colorama_init(autoreset=True)
+            _colors = (Fore, Style)
+        except Exception:
+            COLOR_ENABLED = False
+    return _colors
 
 # -----------------------------
 # Optional dictionary (spelling)
 # -----------------------------
-try:
-    from spellchecker import SpellChecker
-    SPELLCHECK_AVAILABLE = True
-except Exception:
-    SpellChecker = None
-    SPELLCHECK_AVAILABLE = False
+SPELLCHECK_AVAILABLE = find_spec("spellchecker") is not None
 
 # -----------------------------
 # Optional NLP lemmatization
 # -----------------------------
-try:
-    import nltk
-    from nltk.stem import WordNetLemmatizer
-    _lemmatizer = WordNetLemmatizer()
-    _NLTK_OK = True
-except Exception:
-    _lemmatizer = None
-    _NLTK_OK = False
+_NLTK_OK = find_spec("nltk") is not None  # until the WordNet load says otherwise
+_lemmatizer = None
+_lemmatizer_lock = threading.Lock()
+_lemmatizer_ready = threading.Event()
+
+def _load_lemmatizer() -> None:
+    """Import NLTK and load the WordNet corpus (one lemmatize call forces the lazy corpus load)."""
+    global _lemmatizer, _NLTK_OK
+    with _lemmatizer_lock:
+        if _lemmatizer_ready.is_set():
+            return
+        try:
+            if _NLTK_OK:
+                from nltk.stem import WordNetLemmatizer
+                lemmatizer = WordNetLemmatizer()
+                lemmatizer.lemmatize("trees", pos='n')
+                _lemmatizer = lemmatizer
+        except Exception:
+            _NLTK_OK = False  # no corpus: canonical_key falls back to suffix stemming, as before
+        finally:
+            _lemmatizer_ready.set()
+
+def lemmatizer_available() -> bool:
+    """True if WordNet lemmatization works here (waits for a background load in progress)."""
+    if not _lemmatizer_ready.is_set():
+        _load_lemmatizer()
+    return _NLTK_OK
 
 # -----------------------------
-# Optional fast edit distance
+# Optional fast edit distance (built-in edit_distance otherwise)
 # -----------------------------
-try:
-    from rapidfuzz.distance import Levenshtein
-    def _norm_sim(a: str, b: str) -> float:
-        return Levenshtein.normalized_similarity(a, b)  # 0..1
-    _RF_OK = True
-except Exception:
-    _RF_OK = False
-    def _norm_sim(a: str, b: str) -> float:
-        # Minimal fallback: crude similarity: 1.0 if containment, else ~0.0
-        a, b = a.lower(), b.lower()
-        return 1.0 if (a in b or b in a) else 0.0
+_RF_OK = find_spec("rapidfuzz") is not None
+_rapidfuzz = None
+
+def _rf():
+    """(Levenshtein, cdist) from rapidfuzz, imported on first use; None without it."""
+    global _rapidfuzz, _RF_OK
+    if _rapidfuzz is None and _RF_OK:
+        try:
+            from rapidfuzz.distance import Levenshtein
+            from rapidfuzz.process import cdist
+            _rapidfuzz = (Levenshtein, cdist)
+        except Exception:
+            _RF_OK = False
+    return _rapidfuzz
+
+def _norm_sim(a: str, b: str) -> float:
+    rf = _rf()
+    if rf is not None:
+        return rf[0].normalized_similarity(a, b)  # 0..1
+    return edit_distance.normalized_similarity(a, b)
+
+def _norm_sim_many(a: str, bs: List[str], score_cutoff: Optional[float] = None) -> np.ndarray:
+    """
+    _norm_sim(a, b) for every b (float32). The built-in fallback skips rows
+    that cannot reach score_cutoff (returned as 0.0); rapidfuzz scores all.
+    """
+    rf = _rf()
+    if rf is not None:
+        return rf[1]([a], bs, scorer=rf[0].normalized_similarity, dtype=np.float32)[0]
+    return edit_distance.normalized_similarity_many(a, bs, score_cutoff=score_cutoff)
+
+# -----------------------------
+# Preload hook (servers)
+# -----------------------------
+PRELOAD_STATS: Dict[str, float] = {}  # seconds per component, filled by preload()
+
+def preload(background: bool = True) -> Dict[str, float]:
+    """
+    Import every heavy dependency now instead of on the first request: gensim,
+    rapidfuzz, pyspellchecker, colorama, and the WordNet corpus. With
+    background=True, WordNet loads on a daemon thread (canonical_key waits
+    for it if a request gets there first). Returns PRELOAD_STATS.
+    """
+    def timed(name: str, fn) -> None:
+        t0 = time.perf_counter()
+        try:
+            fn()
+        finally:
+            PRELOAD_STATS[name] = round(time.perf_counter() - t0, 4)
+
+    def import_spellchecker():
+        if SPELLCHECK_AVAILABLE:
+            import spellchecker  # noqa: F401  (dictionary loads per HybridFilter)
+
+    def import_gensim():
+        import gensim.models  # noqa: F401
+
+    timed("gensim", import_gensim)
+    timed("rapidfuzz", _rf)
+    timed("spellchecker", import_spellchecker)
+    timed("colorama", _console_colors)
+    if background:
+        threading.Thread(target=timed, args=("wordnet", _load_lemmatizer),
+                         name="wordnet-preload", daemon=True).start()
+    else:
+        timed("wordnet", _load_lemmatizer)
+    return PRELOAD_STATS
 
 # =============================
 # Basic text utilities
@@ -115,17 +206,22 @@ class HybridFilter:
         language: str = "en",
         spell_distance: int = 1,
         use_spell: Optional[bool] = None,
+        use_cache: bool = True,
     ):
         """
         allow/deny: case-insensitive sets (lowercased inside).
         language: pyspellchecker language ('en', 'es', ...), if installed.
         use_spell: force-enable/disable spellcheck; default=True if available.
+        use_cache: memoize verdicts in the shared VERDICT_CACHE, keyed by this config.
         """
         self.allow = {a.lower() for a in (allow or set())}
         self.deny  = {d.lower() for d in (deny  or set())}
+        self.language = language
+        self.spell_distance = spell_distance
         self.use_spell = SPELLCHECK_AVAILABLE if use_spell is None else use_spell
 
         if self.use_spell and SPELLCHECK_AVAILABLE:
+            from spellchecker import SpellChecker
             try:
                 self.spell = SpellChecker(language=language, distance=spell_distance)
             except Exception:
@@ -135,22 +231,63 @@ class HybridFilter:
         else:
             self.spell = None
 
+        self._key = self.config_key()
+        self.cache: Optional[VerdictLRU] = VERDICT_CACHE if use_cache else None
+
+    @staticmethod
+    def make_config_key(
+        allow: Optional[Set[str]] = None,
+        deny: Optional[Set[str]] = None,
+        language: str = "en",
+        spell_distance: int = 1,
+        use_spell: Optional[bool] = None,
+    ) -> Tuple:
+        """Hashable key for a filter config (same args as __init__)."""
+        use_spell = SPELLCHECK_AVAILABLE if use_spell is None else use_spell
+        return (
+            frozenset(a.lower() for a in (allow or set())),
+            frozenset(d.lower() for d in (deny or set())),
+            language,
+            spell_distance,
+            bool(use_spell and SPELLCHECK_AVAILABLE),
+        )
+
+    def config_key(self) -> Tuple:
+        return HybridFilter.make_config_key(
+            self.allow, self.deny, self.language, self.spell_distance, self.use_spell
+        )
+
     def is_valid(self, word: str) -> bool:
         """
         Decision order: whitelist -> shape -> blacklist -> dictionary.
+        Memoized per (config, word); allow/deny are fixed at construction.
+        Every verdict is counted by result, cached or not.
         """
+        if self.cache is None:
+            reason, source = self.reject_reason(word), "computed"
+        else:
+            key = (self._key, word)
+            reason, source = self.cache.get(key), "cache"
+            if reason is None:
+                reason, source = self.reject_reason(word) or "", "computed"
+                self.cache.put(key, reason)
+        metrics.count("filter_verdicts_total", result=reason or "pass", source=source)
+        return not reason
+
+    def reject_reason(self, word: str) -> Optional[str]:
+        """Why `word` fails the filter ("shape", "deny", "spelling"), or None if it passes."""
         w = normalize(word)
 
         if w in self.allow:
-            return True
+            return None
         if not is_clean_word(w) or not is_probable_shape(w):
-            return False
+            return "shape"
         if w in self.deny:
-            return False
+            return "deny"
         if self.spell and len(w) > 3 and not w.isupper():
             if (w not in self.spell) and (self.spell.correction(w) != w):
-                return False
-        return True
+                return "spelling"
+        return None
 
 # =============================
 # Morphological canonicalization
@@ -170,6 +307,8 @@ def canonical_key(word: str) -> str:
     Prefer WordNet lemma if available; otherwise suffix stem.
     """
     w = normalize(word)
+    if not _lemmatizer_ready.is_set():
+        _load_lemmatizer()  # first call, or waits for preload()'s background load
     if _NLTK_OK and _lemmatizer:
         try:
             ln = _lemmatizer.lemmatize(w, pos='n')
@@ -179,24 +318,27 @@ def canonical_key(word: str) -> str:
             pass
     return _suffix_stem(w)
 
-def keep_best_per_family(cands, score_getter):
+def keep_best_per_family(cands, score_getter, family_of=None):
     """
     Keep only the top-scoring representative per canonical family.
     cands: iterable of (token, score) or tokens; score_getter(token)->float
+    family_of: token -> family key (default canonical_key; VocabTables.family_id
+    gives precomputed integer ids)
     """
+    family_of = family_of or canonical_key
+    items = []
     best = {}
     for item in cands:
         tok, sc = item if isinstance(item, tuple) else (item, score_getter(item))
-        fam = canonical_key(tok)
+        fam = family_of(tok)
+        items.append((tok, sc, fam))
         if fam not in best or sc > best[fam][1]:
             best[fam] = (tok, sc)
     # preserve first occurrence order of winning reps
     seen = set()
     out = []
-    for item in cands:
-        tok, sc = item if isinstance(item, tuple) else (item, score_getter(item))
-        fam = canonical_key(tok)
-        if fam in best and fam not in seen and best[fam][0] == tok:
+    for tok, sc, fam in items:
+        if fam not in seen and best[fam][0] == tok:
             out.append((tok, sc))
             seen.add(fam)
     return out
@@ -213,7 +355,17 @@ def near_duplicate_str(a: str, b: str, max_norm_sim: float = 0.84) -> bool:
         sim = 0.0
     return sim >= max_norm_sim
 
-def too_similar_by_embedding(wv: KeyedVectors, a: str, b: str, max_cos: float = 0.78) -> bool:
+def near_duplicate_many(a: str, cands: List[str], max_norm_sim: float = 0.84) -> np.ndarray:
+    """near_duplicate_str(a, c) for every c at once (one cdist / bit-parallel DP row)."""
+    if not cands:
+        return np.zeros(0, dtype=bool)
+    try:
+        sims = _norm_sim_many(a, cands, score_cutoff=max_norm_sim)
+    except Exception:
+        return np.array([near_duplicate_str(a, c, max_norm_sim) for c in cands], dtype=bool)
+    return sims >= max_norm_sim
+
+def too_similar_by_embedding(wv: "KeyedVectors", a: str, b: str, max_cos: float = 0.78) -> bool:
     """True if embeddings are too close (semantic duplicates)."""
     try:
         return float(wv.similarity(a, b)) >= max_cos
@@ -224,16 +376,23 @@ def too_similar_by_embedding(wv: KeyedVectors, a: str, b: str, max_cos: float =
 # Vector helpers
 # =============================
 
-def pick_token(wv: KeyedVectors, base: str) -> Optional[str]:
-    """Try variants to find an in-vocab token."""
+def pick_token(wv: "KeyedVectors", base: str, token_index=None) -> Optional[str]:
+    """
+    Try variants to find an in-vocab token.
+    Misses go to the prebuilt TokenIndex (token_index.py) when one is attached to
+    the model's engine: case-insensitive, POS-variant, then ranked substring match.
+    """
     for c in (base, base.lower(), base.title(), base.upper(),
               f"{base}|N", f"{base}.n", f"{base}_NOUN"):
         if c in wv.key_to_index:
             return c
+    token_index = token_index or get_engine(wv).tokens
+    if token_index is not None:
+        return token_index.resolve(base)
     hits = [t for t in wv.key_to_index if base.lower() in t.lower()]
     return hits[0] if hits else None
 
-def safe_sim(wv: KeyedVectors, a: str, b: str) -> Optional[float]:
+def safe_sim(wv: "KeyedVectors", a: str, b: str) -> Optional[float]:
     """Cosine similarity with graceful handling of OOV tokens."""
     try:
         return float(wv.similarity(a, b))
@@ -244,144 +403,513 @@ def safe_sim(wv: KeyedVectors, a: str, b: str) -> Optional[float]:
 # Retrieval with hybrid filter
 # =============================
 
-def get_clean_similar(
-    wv: KeyedVectors,
+def _clean_reach(target_count: int, expand_factor: int) -> Tuple[int, int]:
+    """(limit, chunk): same reach as the old most_similar(topn=...*multiplier) loop, capped at 6 passes."""
+    return max(10, target_count * expand_factor * 6), max(10, target_count * expand_factor)
+
+def clean_memo_key(root: str, word_filter: HybridFilter, target_count: int, expand_factor: int,
+                   ann_nprobe: Optional[int] = None, mask=None, tables=None) -> Tuple:
+    """CleanListMemo key of get_clean_similar: equal keys read the same clean list."""
+    limit, chunk = _clean_reach(target_count, expand_factor)
+    return (root, word_filter.config_key(), ann_nprobe, limit, chunk, mask is not None, tables is not None)
+
+def iter_clean_similar(
+    wv: "KeyedVectors",
     base: str,
     target_count: int = 10,
     expand_factor: int = 5,
     forbidden_norms: Optional[set] = None,
     word_filter: Optional[HybridFilter] = None,
-) -> List[Tuple[str, float]]:
+    engine: Optional[NeighborEngine] = None,
+    stream: Optional[CandidateStream] = None,
+    ann_nprobe: Optional[int] = None,
+    mask=None,
+    tables=None,
+    memo=None,
+) -> Iterator[Tuple[str, float]]:
     """
-    Get at least `target_count` filtered similar words.
-    Expands search if too few remain after filtering.
-    `forbidden_norms` prevents duplicates across the whole tree.
+    get_clean_similar one candidate at a time: filtered similar words best
+    first, read from the ranking only as far as the consumer pulls.
+    target_count/expand_factor set the reach of the search (as in
+    get_clean_similar), not a count; forbidden_norms is checked per yield.
+    close() the generator to finish the source.
     """
     root = pick_token(wv, base)
     if not root:
-        return []
+        return
 
-    base_norm = normalize(root)
-    seen_local = set()
-    result: List[Tuple[str, float]] = []
-    multiplier = 1
-    forbidden_norms = forbidden_norms or set()
+    keys = wv.index_to_key
+    if tables is not None:
+        norm_key = lambda row: int(tables.norm_ids[row])
+        norm_text = tables.norm_str
+        base_key = tables.norm_id(root)
+    else:
+        norm_key = lambda row: normalize(keys[row])
+        norm_text = lambda n: n
+        base_key = normalize(root)
+    base_norm = norm_text(base_key)
+    forbidden_norms = forbidden_norms if forbidden_norms is not None else set()
     word_filter = word_filter or HybridFilter()
+    engine = engine or get_engine(wv)
 
-    while len(result) < target_count:
-        temp = wv.most_similar(root, topn=max(10, target_count * expand_factor * multiplier))
-        for word, score in temp:
-            norm = normalize(word)
-            if (
-                norm not in seen_local
-                and norm not in forbidden_norms
-                and base_norm not in norm
-                and norm not in base_norm
-                and word_filter.is_valid(word)
-            ):
-                seen_local.add(norm)
-                result.append((word, score))
-                if len(result) >= target_count:
-                    break
-        multiplier += 1
-        if multiplier > 6:  # safety cap
-            break
+    limit, chunk = _clean_reach(target_count, expand_factor)
 
+    def clean_candidates() -> Iterator[Tuple[str, float, Any]]:
+        """Ranked neighbors passing every tree-independent check (first form per norm)."""
+        source = stream if stream is not None else engine.stream(root, nprobe=ann_nprobe, mask=mask)
+        seen_local = set()
+        rows = 0
+        try:
+            for row, score in source.iter_rows(limit=limit, chunk=chunk):
+                rows += 1
+                key = norm_key(row)
+                if key in seen_local:
+                    continue
+                norm = norm_text(key)
+                if base_norm in norm or norm in base_norm:
+                    continue
+                word = keys[row]
+                if not word_filter.is_valid(word):
+                    continue
+                seen_local.add(key)
+                yield word, score, key
+        finally:
+            # expansion passes = how often the ranking had to be extended
+            metrics.observe("clean_similar_passes", source.passes, buckets=metrics.PASS_BUCKETS)
+            metrics.count("clean_similar_rows_total", rows)
+
+    memo = memo if memo is not None else engine.clean_memo
+    if memo is not None:
+        # Shared across trees (batch mode); only used_norms below is per tree
+        memo_key = clean_memo_key(root, word_filter, target_count, expand_factor,
+                                  ann_nprobe=ann_nprobe, mask=mask, tables=tables)
+        candidates = memo.iter_clean(memo_key, clean_candidates)
+    else:
+        candidates = clean_candidates()
+
+    try:
+        for word, score, key in candidates:
+            if key not in forbidden_norms:
+                yield word, score
+    finally:
+        candidates.close()
+
+def get_clean_similar(
+    wv: "KeyedVectors",
+    base: str,
+    target_count: int = 10,
+    expand_factor: int = 5,
+    forbidden_norms: Optional[set] = None,
+    word_filter: Optional[HybridFilter] = None,
+    engine: Optional[NeighborEngine] = None,
+    stream: Optional[CandidateStream] = None,
+    ann_nprobe: Optional[int] = None,
+    mask=None,
+    tables=None,
+    memo=None,
+    reserve: int = 0,
+) -> List[Tuple[str, float]]:
+    """
+    Get at least `target_count` filtered similar words.
+    Expands search if too few remain after filtering.
+    `forbidden_norms` prevents duplicates across the whole tree.
+    `stream`: pre-scored neighbors of `base` (see NeighborEngine.query_batch);
+    expanding just reads further down it instead of re-running most_similar.
+    `ann_nprobe`: search the engine's approximate index instead (None = exact).
+    `mask`: VerdictMask for `word_filter`; rows it rejects are dropped before
+    ranking, so the expansion cap counts filter-passing neighbors only.
+    `tables`: VocabTables; norms are then integer ids (forbidden_norms too).
+    `memo`: CleanListMemo to use instead of the engine's (e.g. one per tree).
+    `reserve`: read this many more candidates than returned (into the memo).
+    """
+    candidates = iter_clean_similar(
+        wv, base, target_count=target_count, expand_factor=expand_factor, forbidden_norms=forbidden_norms,
+        word_filter=word_filter, engine=engine, stream=stream, ann_nprobe=ann_nprobe, mask=mask,
+        tables=tables, memo=memo,
+    )
+    result = list(islice(candidates, target_count + reserve))
+    candidates.close()  # finish the source now, so its pass count lands in this request's trace
     return result[:target_count]
 
 # =============================
 # Tree builder (with dedupe/diversity)
 # =============================
 
-def build_similarity_tree(
-    wv: KeyedVectors,
-    root_word: str,
-    depth: int = 4,
-    breadth: int = 4,
-    min_sim_to_parent: float = 0.32,
-    min_sim_to_root: float = 0.28,
-    extra_expand_factor: int = 6,
-    word_filter: Optional[HybridFilter] = None,
-) -> Dict[str, Any]:
+class AcceptanceStats:
     """
-    Build a tree where:
-      - depth: total levels including root (e.g., 4 => levels 0,1,2,3)
-      - breadth: number of children per node
-      - Each child ~ parent AND ~ root, and passes the hybrid spelling filter.
-    Returns: {"token": str, "score_to_parent": float|None, "children": [...]}
+    Per tree level, over every tree this process built: nodes expanded,
+    candidates checked and children accepted. choose_children sizes its
+    candidate chunks from the level's acceptance rate.
     """
-    word_filter = word_filter or HybridFilter()
-    root_token = pick_token(wv, root_word)
-    if not root_token:
-        return {"word": root_word, "children": []}
-
-    root_norm = normalize(root_token)
-    used_norms = {root_norm}  # Global dedupe
-
-    def choose_children(parent_token: str, level: int) -> List[Tuple[str, float]]:
-        pool_target = max(60, breadth * 12)
-        raw = get_clean_similar(
-            wv,
-            parent_token,
-            target_count=pool_target,
-            expand_factor=extra_expand_factor,
-            forbidden_norms=used_norms,
-            word_filter=word_filter,
-        )
 
-        # Collapse morphological families: keep top-scoring form per family
-        raw = keep_best_per_family(raw, score_getter=lambda t: t[1])
-
-        picked: List[Tuple[str, float]] = []
-        sibling_tokens: List[str] = []
+    def __init__(self, prior: float = 0.5, floor: float = 0.05):
+        self.prior = prior  # rate assumed for a level not seen yet
+        self.floor = floor  # lowest rate a chunk is sized for
+        self._levels: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def rate(self, level: int) -> float:
+        nodes, checked, accepted = self._levels.get(level, (0, 0, 0))
+        return max(self.floor, accepted / checked if checked else self.prior)
+
+    def record(self, level: int, checked: int, accepted: int) -> None:
+        with self._lock:
+            row = self._levels.setdefault(level, [0, 0, 0])
+            row[0] += 1
+            row[1] += checked
+            row[2] += accepted
+        metrics.count("tree_candidates_checked_total", checked, level=level)
+        metrics.count("tree_candidates_accepted_total", accepted, level=level)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                str(level): {
+                    "nodes": nodes,
+                    "checked": checked,
+                    "accepted": accepted,
+                    "acceptance": round(accepted / checked, 4) if checked else None,
+                    "checked_per_node": round(checked / nodes, 2) if nodes else None,
+                }
+                for level, (nodes, checked, accepted) in sorted(self._levels.items())
+            }
+
+ACCEPTANCE = AcceptanceStats()
+
+def record_pick(level: int, checked: int, accepted: int, pulled: int) -> None:
+    """Stats of one pick that is part of a tree (not of a speculative one)."""
+    ACCEPTANCE.record(level, checked, accepted)
+    metrics.observe("tree_pool_pulled", pulled, buckets=metrics.POOL_BUCKETS)
+
+class SiblingPicker:
+    """
+    Sibling selection fed one ranked chunk at a time: family collapse (first
+    form per family), similarity to parent and root, tree-wide dedupe and
+    diversity against the siblings already picked. Picks the same children
+    as checking the whole pool at once, since every check only looks at
+    candidates ranked above.
+    """
 
+    def __init__(self, builder: "TreeBuilder", parent_token: str, level: int, used_norms: set):
+        self.builder = builder
+        self.level = level
+        self.used_norms = used_norms
+        self.picked: List[Tuple[str, float]] = []
+        self.checked = 0
+        self.pulled = 0  # candidates read from the clean list (TreeBuilder.select_children)
+        self._families: set = set()
+        self._siblings: List[Tuple[str, np.ndarray]] = []  # picked words and unit vectors
+        engine = builder.engine
+        self._parent_unit = engine.unit([parent_token])[0]
+        self._root_unit = engine.unit([builder.root_token])[0] if level >= 1 else None
+
+    @property
+    def full(self) -> bool:
+        return len(self.picked) >= self.builder.breadth
+
+    def offer(self, raw: List[Tuple[str, float]]) -> None:
+        """Check the next ranked candidates, picking until `breadth` children are accepted."""
+        builder = self.builder
+        family_of, norm_of, word_filter = builder.family_of, builder.norm_of, builder.word_filter
+        used_norms = self.used_norms
+        cands = []
         for cand, _ in raw:
-            c_norm = normalize(cand)
+            fam = family_of(cand)
+            if fam not in self._families:  # ranked input: the first form is the family's best
+                self._families.add(fam)
+                cands.append(cand)
+        if not cands or self.full:
+            return
+
+        # All cosine checks for the chunk as matrix products over unit vectors
+        unit = builder.engine.unit(cands)
+        sim_parent = unit @ self._parent_unit
+        sim_root = unit @ self._root_unit if self._root_unit is not None else None
+        # Sibling diversity: flags candidates too close to any already-picked sibling
+        dup = np.zeros(len(cands), dtype=bool)
+        for word, vec in self._siblings:
+            dup |= near_duplicate_many(word, cands, max_norm_sim=0.84)
+            dup |= (unit @ vec) >= 0.78
+
+        for i, cand in enumerate(cands):
+            self.checked += 1
+            c_norm = norm_of(cand)
             if c_norm in used_norms:
                 continue
             if not word_filter.is_valid(cand):
                 continue
 
-            sp = safe_sim(wv, parent_token, cand)
-            if sp is None or sp < min_sim_to_parent:
+            sp = float(sim_parent[i])
+            if sp < builder.min_sim_to_parent:
                 continue
 
-            if level >= 1:
-                sr = safe_sim(wv, root_token, cand)
-                if sr is None or sr < min_sim_to_root:
-                    continue
+            if sim_root is not None and float(sim_root[i]) < builder.min_sim_to_root:
+                continue
 
-            # Sibling diversity: reject near-duplicates of already-picked siblings
-            is_dup = False
-            for sib in sibling_tokens:
-                if near_duplicate_str(cand, sib, max_norm_sim=0.84) or \
-                   too_similar_by_embedding(wv, cand, sib, max_cos=0.78):
-                    is_dup = True
-                    break
-            if is_dup:
+            if dup[i]:
                 continue
 
-            picked.append((cand, float(sp)))   # store sim-to-parent
-            sibling_tokens.append(cand)
+            self.picked.append((cand, sp))   # store sim-to-parent
             used_norms.add(c_norm)
 
-            if len(picked) >= breadth:
+            if self.full:
                 break
 
-        return picked
+            # One batched edit-distance row + one cosine column against the new sibling
+            dup |= near_duplicate_many(cand, cands, max_norm_sim=0.84)
+            dup |= (unit @ unit[i]) >= 0.78
+            self._siblings.append((cand, unit[i]))
+
+class TreeBuilder:
+    """
+    State shared by every node of one tree: the global used_norms dedupe, the
+    root token (for min_sim_to_root), filter/engine/vocab tables, and neighbor
+    streams prefetched for parents-to-be. iter_similarity_tree drives it
+    depth-first; lazy_tree.LazyTree drives it one expansion at a time.
+    """
+
+    def __init__(
+        self,
+        wv: "KeyedVectors",
+        root_word: str,
+        breadth: int = 4,
+        min_sim_to_parent: float = 0.32,
+        min_sim_to_root: float = 0.28,
+        extra_expand_factor: int = 6,
+        word_filter: Optional[HybridFilter] = None,
+        engine: Optional[NeighborEngine] = None,
+        ann_nprobe: Optional[int] = None,
+    ):
+        self.wv = wv
+        self.breadth = breadth
+        self.min_sim_to_parent = min_sim_to_parent
+        self.min_sim_to_root = min_sim_to_root
+        self.extra_expand_factor = extra_expand_factor
+        self.word_filter = word_filter or HybridFilter()
+        self.engine = engine or get_engine(wv)
+        self.ann_nprobe = ann_nprobe
+        self.root_token = pick_token(wv, root_word)
+
+        # Precomputed per-vocab norm/family ids (vocab_tables.py) when the model has them
+        self.tables = self.engine.tables
+        self.norm_of = self.tables.norm_id if self.tables is not None else normalize
+        self.family_of = self.tables.family_id if self.tables is not None else canonical_key
+
+        self.used_norms = {self.norm_of(self.root_token)} if self.root_token else set()  # Global dedupe
+        self.streams: Dict[str, CandidateStream] = {}  # prefetched neighbors of pending parents
+        self.mask = self.engine.mask_for(self.word_filter)  # precomputed verdicts (filter_cache.py), if any
+        self.memo = self.engine.clean_memo  # clean neighbor lists (parallel_tree.py sets a per-tree one)
+
+    def prefetch(self, parents: List[str]) -> None:
+        """Score the neighbor lists of future parents in one matrix product."""
+        parents = [p for p in parents if p not in self.streams]  # scored ahead (parallel warm-up)
+        memo = self.memo
+        if memo is not None:
+            # already known (another tree, or parallel warm-up): their clean lists come from the memo
+            parents = [p for p in parents if not memo.covers(p)]
+        with metrics.stage("neighbor_scan"):
+            self.streams.update(self.engine.query_batch(parents, nprobe=self.ann_nprobe, mask=self.mask))
+
+    @property
+    def pool_target(self) -> int:
+        return max(60, self.breadth * 12)
+
+    def memo_key(self, token: str) -> Tuple:
+        """Key of the clean list choose_children(token, ...) reads from the memo."""
+        return clean_memo_key(token, self.word_filter, self.pool_target, self.extra_expand_factor,
+                              ann_nprobe=self.ann_nprobe, mask=self.mask, tables=self.tables)
+
+    def chunk_size(self, level: int, needed: int) -> int:
+        """Candidates to pull for `needed` more children: enough at this level's acceptance rate."""
+        return max(needed, math.ceil(needed / ACCEPTANCE.rate(level)))
+
+    def select_children(self, parent_token: str, level: int, used_norms: Optional[set] = None,
+                        stream: Optional[CandidateStream] = None, memo=None,
+                        reserve: int = 0) -> SiblingPicker:
+        """
+        Pick up to `breadth` children of a node at `level`, claiming their norms
+        in `used_norms` (default: the tree's). Candidates come from the clean
+        neighbor list in chunks sized by the level's acceptance rate, and
+        stop at `breadth` accepted or pool_target read. stream/memo override
+        the prefetched stream and the builder's memo; reserve reads that many
+        more candidates into the memo (parallel_tree.py). Records no stats:
+        returns the picker (picked, checked, pulled).
+        """
+        used_norms = self.used_norms if used_norms is None else used_norms
+        pool_target = self.pool_target
+        candidates = iter_clean_similar(
+            self.wv,
+            parent_token,
+            target_count=pool_target,
+            expand_factor=self.extra_expand_factor,
+            forbidden_norms=used_norms,
+            word_filter=self.word_filter,
+            engine=self.engine,
+            stream=stream if stream is not None else self.streams.pop(parent_token, None),
+            ann_nprobe=self.ann_nprobe,
+            mask=self.mask,
+            tables=self.tables,
+            memo=memo if memo is not None else self.memo,
+        )
+        picker = SiblingPicker(self, parent_token, level, used_norms)
+        try:
+            while picker.pulled < pool_target and not picker.full:
+                want = min(pool_target - picker.pulled, self.chunk_size(level, self.breadth - len(picker.picked)))
+                with metrics.stage("get_clean_similar"):
+                    chunk = list(islice(candidates, want))
+                picker.pulled += len(chunk)
+                with metrics.stage("sibling_diversity"):
+                    picker.offer(chunk)
+                if len(chunk) < want:
+                    break
+            if reserve:
+                with metrics.stage("get_clean_similar"):
+                    for _ in islice(candidates, reserve):
+                        pass
+        finally:
+            candidates.close()
+        return picker
+
+    def choose_children(self, parent_token: str, level: int, used_norms: Optional[set] = None,
+                        stream: Optional[CandidateStream] = None, memo=None) -> List[Tuple[str, float]]:
+        """select_children() for a node of the tree: its pick counts in ACCEPTANCE."""
+        picker = self.select_children(parent_token, level, used_norms=used_norms, stream=stream, memo=memo)
+        record_pick(level, picker.checked, len(picker.picked), picker.pulled)
+        return picker.picked
+
+    def pick_diverse(self, parent_token: str, raw: List[Tuple[str, float]], level: int,
+                     used_norms: Optional[set] = None) -> List[Tuple[str, float]]:
+        """Sibling selection over a whole ranked candidate pool (see SiblingPicker)."""
+        picker = SiblingPicker(self, parent_token, level, self.used_norms if used_norms is None else used_norms)
+        if raw:
+            picker.offer(raw)
+        return picker.picked
+
+def iter_similarity_tree(
+    wv: "KeyedVectors",
+    root_word: str,
+    depth: int = 4,
+    breadth: int = 4,
+    min_sim_to_parent: float = 0.32,
+    min_sim_to_root: float = 0.28,
+    extra_expand_factor: int = 6,
+    word_filter: Optional[HybridFilter] = None,
+    engine: Optional[NeighborEngine] = None,
+    ann_nprobe: Optional[int] = None,
+    workers: int = 1,
+    executor=None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Build a tree where:
+      - depth: total levels including root (e.g., 4 => levels 0,1,2,3)
+      - breadth: number of children per node
+      - Each child ~ parent AND ~ root, and passes the hybrid spelling filter.
+    Neighbor lists for each group of siblings are scored in one batched product.
+    ann_nprobe: if the engine has an approximate index, probe this many clusters
+      per query (higher = better recall, slower); None = exact search.
+    Yields one event per node as soon as it is chosen, in build (DFS) order:
+      {"id": int, "parent": int|None, "word": str, "level": int,
+       "score": float|None, "index": int, "siblings": int}
+    All children of a node are yielded together, before any grandchild; the
+    root is id 0. build_similarity_tree() assembles these into the nested dict.
+    workers > 1 (or an executor, e.g. parallel_tree.process_executor()): the
+      candidate pools of each level are computed concurrently first (see
+      parallel_tree.py); the tree is the same, events start after that phase.
+    """
+    builder = TreeBuilder(
+        wv, root_word, breadth=breadth, min_sim_to_parent=min_sim_to_parent,
+        min_sim_to_root=min_sim_to_root, extra_expand_factor=extra_expand_factor,
+        word_filter=word_filter, engine=engine, ann_nprobe=ann_nprobe,
+    )
+    root_token = builder.root_token
+    if not root_token:
+        yield {"id": 0, "parent": None, "word": root_word, "level": 0, "score": None, "index": 0, "siblings": 1}
+        return
+
+    choose_children = builder.choose_children
+    if workers > 1 or executor is not None:
+        from parallel_tree import LevelPlan
+        with metrics.stage("parallel_pools"):
+            choose_children = LevelPlan(builder, depth).warm(workers=workers, executor=executor).choose_children
 
-    def build_node(token: str, score: Optional[float], level: int) -> Dict[str, Any]:
-        node = {"word": token, "children": []}
+    next_id = [1]
+
+    def build_node(token: str, node_id: int, level: int) -> Iterator[Dict[str, Any]]:
         if level >= depth - 1:
-            return node
+            return
 
         children = choose_children(token, level)
-        for child_token, child_score in children:
-            node["children"].append(build_node(child_token, child_score, level + 1))
-        return node
+        if level + 1 < depth - 1:
+            # children are parents next: score them all in one matrix product
+            builder.prefetch([c for c, _ in children])
+        child_ids = []
+        for i, (child_token, child_score) in enumerate(children):
+            child_ids.append(next_id[0])
+            next_id[0] += 1
+            yield {"id": child_ids[-1], "parent": node_id, "word": child_token, "level": level + 1,
+                   "score": child_score, "index": i, "siblings": len(children)}
+        for (child_token, _), child_id in zip(children, child_ids):
+            yield from build_node(child_token, child_id, level + 1)
+
+    yield {"id": 0, "parent": None, "word": root_token, "level": 0, "score": None, "index": 0, "siblings": 1}
+    yield from build_node(root_token, 0, 0)
+
+def attach_node(nodes: Dict[int, Dict[str, Any]], event: Dict[str, Any]) -> Dict[str, Any]:
+    """Add one iter_similarity_tree() event to `nodes` (id -> node); returns the new node."""
+    node = {"word": event["word"], "children": []}
+    nodes[event["id"]] = node
+    if event["parent"] is not None:
+        node["score"] = event["score"]
+        nodes[event["parent"]]["children"].append(node)
+    return node
+
+def tree_events(tree: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Replay a finished tree as iter_similarity_tree() events (the same events that built it)."""
+    next_id = 1
+
+    def walk(node: Dict[str, Any], node_id: int, level: int):
+        nonlocal next_id
+        children = node.get("children", [])
+        child_ids = list(range(next_id, next_id + len(children)))
+        next_id += len(children)
+        for i, (child, child_id) in enumerate(zip(children, child_ids)):
+            yield {"id": child_id, "parent": node_id, "word": child["word"], "level": level + 1,
+                   "score": child.get("score"), "index": i, "siblings": len(children)}
+        for child, child_id in zip(children, child_ids):
+            yield from walk(child, child_id, level + 1)
+
+    yield {"id": 0, "parent": None, "word": tree["word"], "level": 0, "score": None, "index": 0, "siblings": 1}
+    yield from walk(tree, 0, 0)
 
-    tree = build_node(root_token, None, 0)
-    return tree
+def build_similarity_tree(
+    wv: "KeyedVectors",
+    root_word: str,
+    depth: int = 4,
+    breadth: int = 4,
+    min_sim_to_parent: float = 0.32,
+    min_sim_to_root: float = 0.28,
+    extra_expand_factor: int = 6,
+    word_filter: Optional[HybridFilter] = None,
+    engine: Optional[NeighborEngine] = None,
+    ann_nprobe: Optional[int] = None,
+    workers: int = 1,
+    executor=None,
+) -> Dict[str, Any]:
+    """
+    Whole-tree form of iter_similarity_tree() (same parameters).
+    Returns: {"word": str, "children": [...]}; each child also has "score" (similarity to its parent)
+    """
+    nodes: Dict[int, Dict[str, Any]] = {}
+    with metrics.stage("build_similarity_tree"):
+        for event in iter_similarity_tree(
+            wv, root_word, depth=depth, breadth=breadth,
+            min_sim_to_parent=min_sim_to_parent, min_sim_to_root=min_sim_to_root,
+            extra_expand_factor=extra_expand_factor, word_filter=word_filter,
+            engine=engine, ann_nprobe=ann_nprobe, workers=workers, executor=executor,
+        ):
+            attach_node(nodes, event)
+    metrics.count("tree_nodes_total", len(nodes))
+    return nodes[0]
 
 # =============================
 # Pretty print & export
@@ -393,7 +921,8 @@ def print_tree(node: Dict[str, Any], prefix: str = "", is_last: bool = True) ->
     score = node.get("")
     connector = "└── " if is_last else "├── "
     sim_str = f" ({score:.3f})" if isinstance(score, (int, float)) else ""
-    label = f"{Fore.CYAN}{token}{Style.RESET_ALL}" if COLOR_ENABLED else token
+    colors = _console_colors()
+    label = f"{colors[0].CYAN}{token}{colors[1].RESET_ALL}" if colors else token
     print(prefix + connector + label + sim_str)
 
     children = node.get("children", [])
@@ -401,24 +930,10 @@ def print_tree(node: Dict[str, Any], prefix: str = "", is_last: bool = True) ->
         next_prefix = prefix + ("    " if is_last else "│   ")
         print_tree(child, next_prefix, i == len(children) - 1)
 
-def to_markdown(node: Dict[str, Any], depth: int = 0) -> List[str]:
-    lines = []
-    indent = "  " * depth
-    score = f" *(sim: {node['score_to_parent']:.3f})*" if isinstance(node.get("score_to_parent"), (int, float)) else ""
-    lines.append(f"{indent}- **{node['token']}**{score}")
-    for ch in node.get("children", []):
-        lines.extend(to_markdown(ch, depth + 1))
-    return lines
-
-def simplify_tree_for_json(node: Dict[str, Any]) -> Dict[str, Any]:
-    return {
-        "Id": 1,
-        "word": node.get("token", ""),
-        "children":[simplify_tree_for_json(ch) for ch in node.get("children", [])]
-    }
-
 async def save_tree_json(tree: Dict[str, Any], path: str) -> None:
-    jsonString = json.dumps(tree, ensure_ascii=False, indent=2)
+    import aiofiles
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    jsonString = json.dumps(tree, ensure_ascii=False, separators=(",", ":"))  # compact: no indent
     async with aiofiles.open(path, "w", encoding="utf-8") as f:
         await f.write(jsonString)
 
@@ -428,57 +943,93 @@ async def save_tree_json(tree: Dict[str, Any], path: str) -> None:
 
 USE_CLI = False  # set True to enable argparse CLI
 
-async def run_in_code(word: str):
-    print("main.py was run")
+# Shared by run_in_code and the app's startup warm-up (see registry.py)
+KV_PATH = "lexvec_300d.kv"
+FILTER_CONFIG: Dict[str, Any] = {
+    # Optional custom allow/deny (domain terms etc.)
+    "allow": set(),
+    "deny": set(),
+    "language": "en",
+    "spell_distance": 1,
+    "use_spell": True,  # set False to skip dictionary checks
+}
+
+# Tree shape; edit these values to run directly from code (no CLI)
+TREE_PARAMS: Dict[str, Any] = {
+    "depth": 4,
+    "breadth": 4,
+    "min_sim_to_parent": 0.32,
+    "min_sim_to_root": 0.28,
+    "ann_nprobe": None,  # e.g. 32 to use <KV_PATH>.ivf (approximate, faster); None = exact
+}
+
+def build_tree_for_word(word: str) -> Dict[str, Any]:
     """
-    Edit these values to run directly from code (no CLI).
+    Build (or fetch from the tree cache) the tree for `word` with TREE_PARAMS.
+    Synchronous and CPU-bound: the server runs it on workers.BUILD_POOL.
     """
-    KV_PATH   = "lexvec_300d.kv"
-    ROOTS     = word # <- any string
-    DEPTH     = 4
-    BREADTH   = 4
-    MIN_SIM_PARENT = 0.32
-    MIN_SIM_ROOT   = 0.28
-
-    # Optional custom allow/deny (domain terms etc.)
-    ALLOW = {}
-    DENY  = set()
+    from registry import REGISTRY
+    from tree_cache import TREE_CACHE
+
+    # Loaded once per process; later calls reuse the same mmap'd vectors/filter
+    with metrics.stage("model_load"):
+        model = REGISTRY.get_model(KV_PATH)
+        word_filter = REGISTRY.get_filter(**FILTER_CONFIG)
+
+    print(f"\n=== Root: {word} ===")
+    # Popular roots come straight from the tree cache (memory, then disk)
+    tree, cached = TREE_CACHE.get_or_build(
+        model.wv, word, model.fingerprint, word_filter=word_filter, **TREE_PARAMS
+    )
+    print(f"Tree cache {'hit' if cached else 'miss'}")
+    print_tree(tree)
+    return tree
 
-    print(f"Loading vectors: {KV_PATH}")
-    wv = KeyedVectors.load(KV_PATH, mmap="r")
+def stream_tree_for_word(word: str) -> Iterator[Dict[str, Any]]:
+    """build_tree_for_word() one node event at a time (see iter_similarity_tree)."""
+    from registry import REGISTRY
+    from tree_cache import TREE_CACHE
 
-    word_filter = HybridFilter(
-        allow=ALLOW,
-        deny=DENY,
-        language="en",
-        spell_distance=1,
-        use_spell=True  # set False to skip dictionary checks
+    model = REGISTRY.get_model(KV_PATH)
+    word_filter = REGISTRY.get_filter(**FILTER_CONFIG)
+    yield from TREE_CACHE.iter_or_build(
+        model.wv, word, model.fingerprint, word_filter=word_filter, **TREE_PARAMS
     )
 
-    all_trees: Dict[str, Any] = {}
-    print(f"\n=== Root: {ROOTS} ===")
-    tree = build_similarity_tree(
-        wv=wv,
-        root_word=ROOTS,
-        depth=DEPTH,
-        breadth=BREADTH,
-        min_sim_to_parent=MIN_SIM_PARENT,
-        min_sim_to_root=MIN_SIM_ROOT,
-        word_filter=word_filter,
-    )
-    all_trees[ROOTS] = tree
-    print_tree(tree)
-    await save_tree_json(tree, "trees.json")
-    simplified_trees = {
-                        root: simplify_tree_for_json(tree)
-                        for root, tree in all_trees.items()
-                        }
-    print(simplified_trees)
-    # with open("trees.json", "w", encoding="utf-8") as f:
-    #     json.dump(simplified_trees, f, indent=2, ensure_ascii=False)
-        # os.fsync(f.fileno())
-    # os.sync()
-    print("\nSaved all trees to trees.json")
+async def run_in_code(
+    word: str,
+    export: bool = False,
+    timeout: Optional[float] = None,
+    trace: Optional["metrics.Trace"] = None,
+) -> Dict[str, Any]:
+    """
+    Build the tree for `word` on the bounded worker pool without blocking the
+    event loop. Raises workers.PoolSaturated when the queue is full and
+    asyncio.TimeoutError after `timeout` (default: the pool's).
+    Returns the tree; export=True also writes it to result_store.EXPORT_DIR/<result id>.json
+    (the id /api/word returns), so concurrent exports never overwrite each other.
+    Stage timings/counters go to metrics.METRICS, and also into `trace` if given.
+    """
+    print("main.py was run")
+    from workers import BUILD_POOL
+
+    submitted = time.time()
+    tree, build_trace = await BUILD_POOL.run(metrics.traced, build_tree_for_word, word, timeout=timeout)
+    build_trace.add_stage("queue_wait", max(0.0, build_trace.started_at - submitted))
+    if export:
+        from result_store import content_id, encode_json, export_path
+
+        t0 = time.perf_counter()
+        path = export_path(content_id(encode_json(tree)))
+        await save_tree_json(tree, path)
+        build_trace.add_stage("export", time.perf_counter() - t0)
+        print(f"\nSaved tree to {path}")
+    build_trace.add_stage("run_in_code", time.time() - submitted)
+
+    metrics.METRICS.merge(build_trace)
+    if trace is not None:
+        trace.merge(build_trace)
+    return tree
 
 # =============================
 # Optional CLI (flip USE_CLI=True)
@@ -500,12 +1051,23 @@ def run_cli():
     ap.add_argument("--deny", default="", help="Comma-separated blacklist words")
     ap.add_argument("--allow-file", default=None, help="Path to newline-separated whitelist file")
     ap.add_argument("--deny-file", default=None, help="Path to newline-separated blacklist file")
+    ap.add_argument("--ann-nprobe", type=int, default=None,
+                    help="Use the approximate index (<kv>.ivf, see ann_index.py) probing N clusters")
     ap.add_argument("--json", default=None, help="Save combined trees to JSON file")
+    ap.add_argument("--jsonl", default=None,
+                    help="Batch mode: build roots on a process pool, one JSON line per tree (see batch.py)")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes for --jsonl (default: all CPUs)")
     ap.add_argument("--md", default=None, help="Save combined trees to Markdown file")
+    ap.add_argument("--flat", default=None, help="Save combined trees as a flat binary .wtree file (see flat_tree.py)")
     args = ap.parse_args()
 
+    from gensim.models import KeyedVectors
+
     print(f"Loading vectors: {args.kv}")
     wv = KeyedVectors.load(args.kv, mmap="r")
+    if args.ann_nprobe:
+        from ann_index import IVFIndex, index_dir_for
+        get_engine(wv).ann = IVFIndex.load(index_dir_for(args.kv), mmap=True)
 
     def parse_csv_arg(val: Optional[str]) -> Set[str]:
         if not val: return set()
@@ -531,35 +1093,68 @@ def run_cli():
         use_spell=not args.no_spell
     )
 
-    all_trees: Dict[str, Any] = {}
-    print(f"\n=== Root: {root} ===")
-    tree = build_similarity_tree(
-        wv=wv,
-        root_word=root,
-        depth=args.depth,
-        breadth=args.breadth,
-        min_sim_to_parent=args.min_sim_parent,
-        min_sim_to_root=args.min_sim_root,
-        word_filter=word_filter,
-    )
-    all_trees[root] = tree
-    print_tree(tree)
+    if args.jsonl:
+        # Batch mode: process pool + shared neighbor memo, one JSON line per root
+        from batch import build_batch
+        filter_config = dict(allow=allow, deny=deny, language=args.lang,
+                             spell_distance=args.spell_distance, use_spell=not args.no_spell)
+        summary = build_batch(
+            args.roots, args.jsonl, args.kv, filter_config=filter_config, workers=args.workers,
+            depth=args.depth, breadth=args.breadth, min_sim_to_parent=args.min_sim_parent,
+            min_sim_to_root=args.min_sim_root, ann_nprobe=args.ann_nprobe,
+        )
+        print(f"\nSaved {summary['roots']} trees to {args.jsonl}: {summary}")
+        return
+
+    # Roots in one run share their filtered neighbor lists
+    engine = get_engine(wv)
+    engine.clean_memo = CleanListMemo()
 
-    if args.json:
-        with open(args.json, "w", encoding="utf-8") as f:
-            json.dump(all_trees, f, indent=2)
-        print(f"\nSaved JSON to {args.json}")
+    from flat_tree import FlatTreeWriter, write_markdown
 
+    # Trees are kept only as flat arrays (with scores); --json is written as each tree finishes
+    writer = FlatTreeWriter()
+    json_out = open(args.json, "w", encoding="utf-8") if args.json else None
+    try:
+        if json_out:
+            json_out.write("{")
+        for n, root in enumerate(args.roots):
+            print(f"\n=== Root: {root} ===")
+            nodes: Dict[int, Dict[str, Any]] = {}
+            events = iter_similarity_tree(
+                wv=wv,
+                root_word=root,
+                depth=args.depth,
+                breadth=args.breadth,
+                min_sim_to_parent=args.min_sim_parent,
+                min_sim_to_root=args.min_sim_root,
+                word_filter=word_filter,
+                engine=engine,
+                ann_nprobe=args.ann_nprobe,
+            )
+            for event in writer.record(events, name=root):
+                attach_node(nodes, event)
+            print_tree(nodes[0])
+            if json_out:
+                json_out.write(("," if n else "") + json.dumps(root, ensure_ascii=False) + ":"
+                               + json.dumps(nodes[0], ensure_ascii=False, separators=(",", ":")))
+        if json_out:
+            json_out.write("}")
+            print(f"\nSaved JSON to {args.json}")
+    finally:
+        if json_out:
+            json_out.close()
+
+    flat = writer.finish()
     if args.md:
-        lines = []
-        for root, tree in all_trees.items():
-            lines.append(f"# {root}")
-            lines += to_markdown(tree)
-            lines.append("")
         with open(args.md, "w", encoding="utf-8") as f:
-            f.write("\n".join(lines))
+            write_markdown(flat, f)
         print(f"Saved Markdown to {args.md}")
 
+    if args.flat:
+        size = flat.save(args.flat)
+        print(f"Saved {len(flat)} trees ({flat.n_nodes} nodes, {size / 1024:.1f} KB) to {args.flat}")
+
 # =============================
 # Main
 # =============================
@@ -568,4 +1163,4 @@ if __name__ == "__main__":
     if USE_CLI:
         run_cli()
     else:
-        asyncio.run(run_in_code("brain"))
+        asyncio.run(run_in_code("brain", export=True))
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Timers and counters for the tree pipeline, served as Prometheus text at /metrics.
+
+- stage(name): times a block into tree_stage_seconds{stage=name} (histogram;
+  stages nest, so e.g. build includes get_clean_similar)
+- count(name, n, **labels) / observe(name, value, **labels): counters / histograms
+- Instruments record into the active Trace when there is one (per request,
+  via contextvars), else straight into the process-wide METRICS
+- traced(fn, *args) runs fn under a fresh Trace and returns (result, trace).
+  Traces pickle as plain data, so builds on pool threads or worker
+  processes hand their samples back and the server merges them into METRICS;
+  thread tasks run via contextvars.copy_context().run record into the
+  caller's Trace directly (Trace is thread-safe)
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+STAGE_SECONDS = "tree_stage_seconds"
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PASS_BUCKETS = (1, 2, 3, 4, 5, 6, 8)
+POOL_BUCKETS = (4, 8, 12, 16, 24, 32, 48, 64, 96)
+
+_HELP = {
+    STAGE_SECONDS: ("histogram", "Time spent per pipeline stage (nested stages are included in their parent)"),
+    "clean_similar_passes": ("histogram", "Ranking extension passes per get_clean_similar call"),
+    "clean_similar_rows_total": ("counter", "Neighbor rows read by get_clean_similar"),
+    "filter_verdicts_total": ("counter", "HybridFilter verdicts (cached or not), by result and source (cache/computed)"),
+    "knn_graph_fallbacks_total": ("counter", "Graph neighbor lists read past K (live scan opened)"),
+    "knn_graph_lookups_total": ("counter", "Query rows served from the precomputed k-NN graph"),
+    "neighbor_cache_fallbacks_total": ("counter", "Shared-cache neighbor lists read past K (live scan opened)"),
+    "neighbor_cache_lookups_total": ("counter", "Shared neighbor-list cache lookups by result"),
+    "neighbor_queries_total": ("counter", "Query rows scored against the vocabulary"),
+    "parallel_tree_pools_total": ("counter", "Parallel builds: pools computed ahead; per node, pick reused, redone on a warm pool, or missed"),
+    "tree_cache_lookups_total": ("counter", "Tree cache lookups by result"),
+    "tree_candidates_accepted_total": ("counter", "Candidates accepted as children, by tree level"),
+    "tree_candidates_checked_total": ("counter", "Candidates checked for sibling selection, by tree level"),
+    "tree_nodes_total": ("counter", "Nodes in built or served trees"),
+    "tree_pool_pulled": ("histogram", "Clean candidates read per node before its children were settled"),
+    "tree_requests_total": ("counter", "Tree requests by outcome"),
+}
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+def _key(name: str, labels: Dict[str, Any]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = SECONDS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.sum += other.sum
+        self.count += other.count
+
+class Samples:
+    """Counters and histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self.counters: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Histogram] = {}
+
+    def count(self, name: str, n: float = 1, **labels) -> None:
+        k = _key(name, labels)
+        self.counters[k] = self.counters.get(k, 0) + n
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels) -> None:
+        k = _key(name, labels)
+        h = self.histograms.get(k)
+        if h is None:
+            h = self.histograms[k] = Histogram(buckets)
+        h.observe(value)
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.observe(STAGE_SECONDS, seconds, stage=name)
+
+    def merge(self, other: "Samples") -> None:
+        for k, v in other.counters.items():
+            self.counters[k] = self.counters.get(k, 0) + v
+        for k, h in other.histograms.items():
+            mine = self.histograms.get(k)
+            if mine is None:
+                mine = self.histograms[k] = Histogram(h.buckets)
+            mine.merge(h)
+
+class LockedSamples(Samples):
+    """Samples several threads may record into at once (the lock is not pickled)."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: float = 1, **labels) -> None:
+        with self._lock:
+            super().count(name, n, **labels)
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels) -> None:
+        with self._lock:
+            super().observe(name, value, buckets, **labels)
+
+    def merge(self, other: Samples) -> None:
+        with self._lock:
+            super().merge(other)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {k: v for k, v in self.__dict__.items() if k != "_lock"}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+class Trace(LockedSamples):
+    """
+    Samples of one request; started_at is wall-clock so it compares across processes.
+    Thread-safe: pool tasks run in a copy of the request's context record into it directly.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.started_at = time.time()
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Compact per-request view: calls and total ms per stage, other histograms as count/sum, counters."""
+        flat = lambda name, labels: name + "".join(f"[{v}]" for _, v in labels)
+        stages, observed = {}, {}
+        for (name, labels), h in self.histograms.items():
+            if name == STAGE_SECONDS:
+                stages[dict(labels)["stage"]] = {"calls": h.count, "ms": round(h.sum * 1000.0, 3)}
+            else:
+                observed[flat(name, labels)] = {"count": h.count, "sum": round(h.sum, 3)}
+        counters = {flat(name, labels): v for (name, labels), v in self.counters.items()}
+        return {"stages": stages, "observed": observed, "counters": counters}
+
+class Metrics(LockedSamples):
+    """Process-wide totals (thread-safe), rendered in the Prometheus text format."""
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        def fmt_labels(labels, extra=()) -> str:
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        declared = set()
+
+        def declare(name: str, kind: str) -> None:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {_HELP.get(name, (kind, name))[1]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), v in sorted(self.counters.items()):
+                declare(name, "counter")
+                lines.append(f"{name}{fmt_labels(labels)} {v:g}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                declare(name, "histogram")
+                running = 0
+                for bound, c in zip(h.buckets, h.counts):
+                    running += c
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', f'{bound:g}')])} {running}")
+                lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {h.sum:.6f}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {h.count}")
+        for name, v in sorted((gauges or {}).items()):
+            if v is None:
+                continue
+            declare(name, "gauge")
+            lines.append(f"{name} {float(v):g}")
+        return "\n".join(lines) + "\n"
+
+# One registry per serving process
+METRICS = Metrics()
+
+_ACTIVE: ContextVar[Optional[Trace]] = ContextVar("tree_trace", default=None)
+
+def _sink() -> Samples:
+    return _ACTIVE.get() or METRICS
+
+def count(name: str, n: float = 1, **labels) -> None:
+    _sink().count(name, n, **labels)
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels) -> None:
+    _sink().observe(name, value, buckets, **labels)
+
+def merge(samples: Samples) -> None:
+    """Add samples recorded elsewhere (e.g. a worker process's Trace) to the active sink."""
+    _sink().merge(samples)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _sink().add_stage(name, time.perf_counter() - t0)
+
+@contextmanager
+def tracing() -> Iterator[Trace]:
+    """Collect everything recorded in this context into a new Trace (not into METRICS)."""
+    trace = Trace()
+    token = _ACTIVE.set(trace)
+    try:
+        yield trace
+    finally:
+        _ACTIVE.reset(token)
+
+def traced(fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, Trace]:
+    """Pool task wrapper: (fn(*args, **kwargs), its Trace)."""
+    with tracing() as trace:
+        result = fn(*args, **kwargs)
+    return result, trace
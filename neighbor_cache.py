@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Neighbor lists shared by every worker process: whatever one worker scans,
+the others read back instead of scanning again.
+
+- Entry = one vocabulary row's exact top-K neighbors (query row excluded,
+  unfiltered, best first): int32 rows + float32 cosines, K fixed per cache
+- Stored as <model>.kv.nbcache/: fixed-size .npy arrays memory-mapped
+  read-write (MAP_SHARED, so a write is visible to every process at once) +
+  meta.json with K, the slot layout and the model fingerprint; a cache made
+  for another vector file is reset on open. --shm puts the arrays in
+  /dev/shm (RAM) and links them from <model>.kv.nbcache
+- Set-associative: row r lives in one of `ways` slots of set r % sets, LRU
+  within the set (per-slot last-use stamps)
+- Reads are lock-free (tag checked before and after copying the list);
+  writers serialize on a file lock
+- NeighborEngine.query_batch serves exact queries from it when attached
+  (filter masks are applied on read, so every filter config shares the
+  lists); reading past K opens a live scan, so trees are identical
+- Hit rates: per-process counters plus approximate totals over all
+  processes (lock-free increments in the shared file), see stats()
+
+Create:  python neighbor_cache.py --kv lexvec_300d.kv [--entries 65536] [--k 512] [--shm]
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+from neighbors import CandidateStream, PrefixCandidateStream
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers then serialize within one process only
+    fcntl = None
+
+CACHE_SUFFIX = ".nbcache"
+FORMAT_VERSION = 1
+
+# counters (shared across processes): hits, misses, stores, evictions
+_HITS, _MISSES, _STORES, _EVICTIONS = range(4)
+
+def cache_dir_for(kv_path: str) -> str:
+    return kv_path + CACHE_SUFFIX
+
+class CachedCandidateStream(PrefixCandidateStream):
+    """Neighbors of one row from a cached list; past its K entries, a live scan."""
+
+    fallback_metric = "neighbor_cache_fallbacks_total"
+
+# =============================
+# Cache
+# =============================
+
+class SharedNeighborCache:
+    """
+    tags:     (sets, ways) int64, vocab row + 1 held by each slot (0 = empty)
+    stamps:   (sets, ways) int64, last use (monotonic ns) for LRU eviction
+    lengths:  (sets, ways) int32, entries of each slot's list (< K: the whole vocabulary)
+    rows:     (sets, ways, K) int32 neighbor rows, best first
+    scores:   (sets, ways, K) float32 cosines
+    counters: (4,) int64 hits, misses, stores, evictions over all processes
+    """
+
+    _ARRAYS = ("tags", "stamps", "lengths", "rows", "scores", "counters")
+
+    def __init__(self, path: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.path = path
+        self.meta = meta
+        for name in self._ARRAYS:
+            setattr(self, name, arrays[name])
+        self.sets, self.ways = self.tags.shape
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def k(self) -> int:
+        return int(self.meta["k"])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self._ARRAYS)
+
+    # ---- persistence ----
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(path: str) -> Iterator[None]:
+        """Cross-process lock on <path>/lock (a fresh descriptor each time, so forked workers never share it)."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(path, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @classmethod
+    def _create_files(cls, path: str, meta: Dict[str, Any]) -> None:
+        """
+        Write empty arrays next to the old ones and rename them into place:
+        processes still mapping the old files keep valid (stale) pages instead
+        of faulting on a truncated file. Caller holds the file lock.
+        """
+        sets, ways, k = meta["sets"], meta["ways"], meta["k"]
+        shapes = {
+            "tags": ((sets, ways), np.int64),
+            "stamps": ((sets, ways), np.int64),
+            "lengths": ((sets, ways), np.int32),
+            "rows": ((sets, ways, k), np.int32),
+            "scores": ((sets, ways, k), np.float32),
+            "counters": ((4,), np.int64),
+        }
+        for name, (shape, dtype) in shapes.items():
+            final = os.path.join(path, f"{name}.npy")
+            tmp = f"{final}.{os.getpid()}.tmp"
+            arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)  # zero-filled
+            arr.flush()
+            del arr
+            os.replace(tmp, final)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: str) -> "SharedNeighborCache":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r+") for name in cls._ARRAYS}
+        return cls(path, arrays, meta)
+
+    @staticmethod
+    def _layout(entries: int, ways: int) -> Tuple[int, int]:
+        ways = max(1, min(ways, entries))
+        return max(1, -(-entries // ways)), ways
+
+    @classmethod
+    def create(cls, path: str, k: int = 512, entries: int = 65536, ways: int = 8,
+               fingerprint: Optional[str] = None, vocab_size: Optional[int] = None) -> "SharedNeighborCache":
+        """Create (or reset) an empty cache of `entries` lists of K neighbors at path."""
+        os.makedirs(path, exist_ok=True)
+        sets, ways = cls._layout(entries, ways)
+        meta = {"version": FORMAT_VERSION, "k": k, "sets": sets, "ways": ways,
+                "fingerprint": fingerprint, "vocab_size": vocab_size, "created": time.time()}
+        with cls._file_lock(path):
+            cls._create_files(path, meta)
+        return cls.load(path)
+
+    @classmethod
+    def load_for(cls, kv_path: str, fingerprint: Optional[str], vocab_size: int) -> Optional["SharedNeighborCache"]:
+        """
+        Map <kv>.nbcache/ if it exists (None otherwise). A cache filled for
+        another vector file is emptied first, keeping its size and K.
+        """
+        path = cache_dir_for(kv_path)
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.isfile(meta_path):
+            return None
+        with cls._file_lock(path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if (meta.get("version") != FORMAT_VERSION or meta.get("fingerprint") != fingerprint
+                    or meta.get("vocab_size") != vocab_size):
+                print(f"Resetting neighbor cache {path} (made for another model)")
+                meta.update(version=FORMAT_VERSION, fingerprint=fingerprint, vocab_size=vocab_size,
+                            created=time.time())
+                cls._create_files(path, meta)
+            return cls.load(path)
+
+    # ---- entries ----
+
+    def _slot(self, r: int) -> Tuple[int, Optional[int]]:
+        """(set, way holding row r or None)."""
+        s = r % self.sets
+        hit = np.flatnonzero(self.tags[s] == r + 1)
+        return s, (int(hit[0]) if len(hit) else None)
+
+    def get(self, r: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Copy of row r's (neighbor rows, scores), or None. Lock-free."""
+        s, w = self._slot(r)
+        if w is None:
+            return None
+        n = int(self.lengths[s, w])
+        rows = np.array(self.rows[s, w, :n], dtype=np.int64)
+        scores = np.array(self.scores[s, w, :n])
+        if self.tags[s, w] != r + 1:  # evicted while we copied
+            return None
+        self.stamps[s, w] = time.monotonic_ns()
+        return rows, scores
+
+    def put(self, r: int, rows: np.ndarray, scores: np.ndarray) -> None:
+        """Store row r's list (its first K entries), evicting the set's least recently used slot."""
+        n = min(len(rows), self.k)
+        with self._lock, self._file_lock(self.path):
+            s, w = self._slot(r)
+            if w is not None:  # another process stored it meanwhile (same list)
+                return
+            tags = self.tags[s]
+            empty = np.flatnonzero(tags == 0)
+            if len(empty):
+                w = int(empty[0])
+            else:
+                w = int(np.argmin(self.stamps[s]))
+                self.evictions += 1
+                self.counters[_EVICTIONS] += 1
+            self.tags[s, w] = 0  # readers of the old row now miss
+            self.rows[s, w, :n] = rows[:n]
+            self.scores[s, w, :n] = scores[:n]
+            self.lengths[s, w] = n
+            self.stamps[s, w] = time.monotonic_ns()
+            self.tags[s, w] = r + 1
+        self.stores += 1
+        self.counters[_STORES] += 1
+
+    def streams(self, engine, tokens: Sequence[str], valid: Optional[np.ndarray] = None) -> Dict[str, CandidateStream]:
+        """
+        Exact streams for in-vocab tokens: cached lists where present, one
+        unfiltered scan for the rest (stored for every process). `valid`
+        drops filter-rejected rows from the lists and masks any live scan.
+        """
+        key_to_index = engine.wv.key_to_index
+        k = self.k
+        lists: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        missing: List[str] = []
+        for t in tokens:
+            got = self.get(key_to_index[t])
+            if got is None:
+                missing.append(t)
+            else:
+                lists[t] = got
+        hits = len(tokens) - len(missing)
+        self.hits += hits
+        self.misses += len(missing)
+        self.counters[_HITS] += hits
+        self.counters[_MISSES] += len(missing)
+        if hits:
+            metrics.count("neighbor_cache_lookups_total", hits, result="hit")
+        if missing:
+            metrics.count("neighbor_cache_lookups_total", len(missing), result="miss")
+            for t, stream in engine.scan(missing).items():
+                rows, scores = stream.take_rows(k)
+                self.put(key_to_index[t], rows, scores)
+                lists[t] = rows, scores
+        out: Dict[str, CandidateStream] = {}
+        for t in tokens:
+            rows, scores = lists[t]
+            complete = len(rows) < k  # short list = the whole vocabulary
+            if valid is not None:
+                keep = valid[rows]
+                rows, scores = rows[keep], scores[keep]
+            out[t] = CachedCandidateStream(engine, key_to_index[t], rows, scores, complete, valid=valid)
+        return out
+
+    def clear(self) -> None:
+        with self._lock, self._file_lock(self.path):
+            self.tags[:] = 0
+            self.stamps[:] = 0
+            self.lengths[:] = 0
+            self.counters[:] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        shared_hits, shared_misses = int(self.counters[_HITS]), int(self.counters[_MISSES])
+        shared = shared_hits + shared_misses
+        return {
+            "path": self.path,
+            "k": self.k,
+            "capacity": self.sets * self.ways,
+            "entries": int(np.count_nonzero(self.tags)),
+            "mb": round(self.nbytes / (1024 * 1024), 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            # every process, approximate: concurrent increments can be lost
+            "all_processes": {
+                "hits": shared_hits,
+                "misses": shared_misses,
+                "stores": int(self.counters[_STORES]),
+                "evictions": int(self.counters[_EVICTIONS]),
+                "hit_rate": round(shared_hits / shared, 4) if shared else None,
+            },
+        }
+
+# =============================
+# Create CLI
+# =============================
+
+if __name__ == "__main__":
+    import argparse
+    from gensim.models import KeyedVectors
+    from registry import model_fingerprint
+
+    ap = argparse.ArgumentParser(description="Create the shared neighbor-list cache of a .kv model.")
+    ap.add_argument("--kv", required=True, help="Path to KeyedVectors .kv file")
+    ap.add_argument("--entries", type=int, default=65536, help="Neighbor lists kept (LRU beyond that)")
+    ap.add_argument("--k", type=int, default=512, help="Neighbors per list")
+    ap.add_argument("--ways", type=int, default=8, help="Slots per set (LRU runs within a set)")
+    ap.add_argument("--shm", action="store_true", help="Keep the arrays in /dev/shm and link them from the model")
+    ap.add_argument("--remove", action="store_true", help="Delete the cache instead")
+    args = ap.parse_args()
+
+    path = cache_dir_for(args.kv)
+    if args.remove or args.shm:
+        target = os.path.realpath(path)
+        if os.path.islink(path):
+            os.remove(path)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        if args.remove:
+            print(f"Removed {path}")
+            raise SystemExit(0)
+        shm_dir = os.path.join("/dev/shm", f"{os.path.basename(os.path.abspath(args.kv))}{CACHE_SUFFIX}")
+        os.makedirs(shm_dir, exist_ok=True)
+        os.symlink(shm_dir, path)
+    wv = KeyedVectors.load(args.kv, mmap="r")
+    cache = SharedNeighborCache.create(path, k=args.k, entries=args.entries, ways=args.ways,
+                                       fingerprint=model_fingerprint(args.kv), vocab_size=len(wv.index_to_key))
+    where = f" (in {os.path.realpath(path)})" if os.path.islink(path) else ""
+    print(f"Created {cache.sets * cache.ways} x K={cache.k} neighbor cache "
+          f"({cache.nbytes / (1024 * 1024):.1f} MB) at {path}{where}")
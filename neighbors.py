@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Batched nearest-neighbor engine over a KeyedVectors matrix.
+
+- Scores many query tokens against the whole vocabulary in ONE matrix product
+  (vectors @ Q.T, scaled by cached inverse norms = cosine, same as most_similar)
+- Top-k via argpartition, sorted only inside the selected block
+- Each query gets a CandidateStream: a lazily extendable ranking built from its
+  cached score row, so asking for more neighbors never re-scans the vectors
+- Optional approximate index (ann_index.IVFIndex): pass nprobe to trade recall for speed
+- Optional VerdictMask (filter_cache.py): filter-rejected rows never enter the ranking
+- Optional CleanListMemo: filtered neighbor lists shared by every tree built
+  on the engine (batch mode)
+- Optional compact_store.CompactVectors: the exact scan runs on int8/float16
+  rows and the top candidates are rescored against the float32 vectors
+- Optional knn_graph.KNNGraph: precomputed neighbor lists replace the scan
+  for exact queries with the filter config the graph was built for
+- Optional neighbor_cache.SharedNeighborCache: exact neighbor lists cached in
+  a memory-mapped file shared by every worker process
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+from filter_cache import VerdictMask, config_digest
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors
+
+# =============================
+# Ranked candidate stream
+# =============================
+
+class CandidateStream:
+    """
+    Neighbors of one query token in descending cosine order.
+    Holds the query's full score row; extending the ranking only re-partitions
+    that row (O(V)), never the vector matrix (O(V*d)).
+    """
+
+    def __init__(self, keys: List[str], scores: np.ndarray, exclude: int, valid: Optional[np.ndarray] = None):
+        self._keys = keys
+        self._scores = scores
+        self._exclude = exclude
+        self._order = np.empty(0, dtype=np.int64)
+        self._size = len(scores)
+        self.passes = 0  # ranking extensions issued by iter_rows
+        if valid is not None:
+            # masked rows sink to -inf and are never handed out
+            scores[~valid] = -np.inf
+            self._size = int(valid.sum()) + (0 if valid[exclude] else 1)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    @property
+    def exhausted(self) -> bool:
+        return len(self._order) >= self._size - 1
+
+    def _grow(self, k: int) -> None:
+        n = len(self._scores)
+        k = min(k + 1, self._size, n)  # +1: the query itself is dropped below
+        neg = -self._scores
+        if k >= n:
+            idx = np.argsort(neg)
+        else:
+            idx = np.argpartition(neg, k)[:k]
+            idx = idx.take(np.argsort(neg.take(idx)))
+        idx = idx[idx != self._exclude]
+        self._order = idx[np.isfinite(self._scores[idx])]
+
+    def take_rows(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-n (vocab rows, scores) (fewer if the vocabulary runs out)."""
+        if n > len(self._order) and not self.exhausted:
+            self._grow(max(n, 2 * len(self._order)))
+        idx = self._order[:n]
+        return idx, self._scores[idx]
+
+    def take(self, n: int) -> List[Tuple[str, float]]:
+        """Top-n (token, score) pairs (fewer if the vocabulary runs out)."""
+        rows, scores = self.take_rows(n)
+        return [(self._keys[i], float(s)) for i, s in zip(rows.tolist(), scores.tolist())]
+
+    def iter_rows(self, limit: Optional[int] = None, chunk: int = 64) -> Iterator[Tuple[int, float]]:
+        """Yield (row, score) best-first, growing the ranking in doubling chunks."""
+        pos = 0
+        want = chunk
+        while limit is None or pos < limit:
+            if limit is not None:
+                want = min(want, limit)
+            self.passes += 1
+            rows, scores = self.take_rows(want)
+            if pos >= len(rows):
+                return
+            yield from zip(rows[pos:].tolist(), scores[pos:].tolist())
+            pos = len(rows)
+            want *= 2
+
+    def iter(self, limit: Optional[int] = None, chunk: int = 64) -> Iterator[Tuple[str, float]]:
+        """Yield (token, score) best-first."""
+        keys = self._keys
+        for row, score in self.iter_rows(limit=limit, chunk=chunk):
+            yield keys[row], score
+
+class PrefixCandidateStream(CandidateStream):
+    """
+    A stored best-first prefix of one row's ranking (k-NN graph list, shared
+    cache entry). Reading past it opens a live scan for the row and
+    continues from it (the prefix is that scan's head, so nothing is reordered).
+    """
+
+    fallback_metric = "neighbor_prefix_fallbacks_total"
+
+    def __init__(self, engine, r: int, rows: np.ndarray, scores: np.ndarray, complete: bool,
+                 valid: Optional[np.ndarray] = None):
+        super().__init__(engine.wv.index_to_key, np.empty(0, dtype=np.float32), r)
+        self._engine = engine
+        self._valid = valid
+        self._order, self._scores = rows, scores
+        self._live: Optional[CandidateStream] = None
+        self._complete = complete  # the prefix is the whole ranking
+
+    @property
+    def exhausted(self) -> bool:
+        return self._complete if self._live is None else self._live.exhausted
+
+    def take_rows(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._live is None and n > len(self._order) and not self._complete:
+            metrics.count(self.fallback_metric)
+            token = self._keys[self._exclude]
+            self._live = self._engine.scan([token], self._valid)[token]
+        if self._live is not None:
+            return self._live.take_rows(n)
+        return self._order[:n], self._scores[:n]
+
+    def iter_rows(self, limit: Optional[int] = None, chunk: int = 64):
+        # first chunk never larger than the prefix, so short reads stay in it
+        return super().iter_rows(limit=limit, chunk=min(chunk, len(self._order)) or chunk)
+
+# =============================
+# Memoized clean neighbor lists
+# =============================
+
+class CleanListMemo:
+    """
+    Tree-independent prefix of get_clean_similar, per (token, filter, search) key:
+    neighbors in rank order that pass the filter, first form per norm, as
+    (word, score, norm key). Each tree applies its own used_norms on top, so
+    results are identical to unmemoized calls.
+
+    Only the consumed prefix is kept (no score rows); a caller that needs more
+    re-opens the source and skips what is already stored. Bounded LRU.
+    """
+
+    def __init__(self, max_items: int = 20000):
+        self.max_items = max_items
+        self._items: "OrderedDict[Hashable, List[Tuple[str, float, Any]]]" = OrderedDict()
+        self._complete: set = set()
+        self._tokens: Dict[str, int] = {}  # token -> live entries, for prefetch skipping
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reopened = 0
+
+    def _evict(self) -> None:
+        """Drop least recently used entries over max_items (caller holds the lock)."""
+        while len(self._items) > self.max_items:
+            old, _ = self._items.popitem(last=False)
+            self._complete.discard(old)
+            left = self._tokens.pop(old[0]) - 1
+            if left:
+                self._tokens[old[0]] = left
+
+    def covers(self, token: str) -> bool:
+        return token in self._tokens
+
+    def iter_clean(self, key: Tuple, make_source: Callable[[], Iterator[Tuple[str, float, Any]]]):
+        """Yield the clean list for `key` (key[0] must be the token), extending it on demand."""
+        with self._lock:
+            items = self._items.get(key)
+            if items is None:
+                self.misses += 1
+                items = self._items[key] = []
+                self._tokens[key[0]] = self._tokens.get(key[0], 0) + 1
+                self._evict()
+            else:
+                self.hits += 1
+                self._items.move_to_end(key)
+        i = 0
+        source = None
+        while True:
+            if i < len(items):
+                yield items[i]
+                i += 1
+                continue
+            if key in self._complete:
+                return
+            if source is None:
+                source = make_source()
+                if i:
+                    self.reopened += 1
+                for _ in range(i):  # already stored
+                    next(source, None)
+            item = next(source, None)
+            if item is None:
+                self._complete.add(key)
+                return
+            if len(items) == i:  # another consumer may have appended it meanwhile
+                items.append(item)
+            yield items[i]
+            i += 1
+
+    def entries(self) -> List[Tuple[Hashable, List[Tuple[str, float, Any]], bool]]:
+        """(key, stored prefix, complete) for every entry, e.g. to ship a worker's lists to its parent."""
+        with self._lock:
+            return [(key, list(items), key in self._complete) for key, items in self._items.items()]
+
+    def seed(self, key: Tuple, items: List[Tuple[str, float, Any]], complete: bool = False) -> None:
+        """Store a prefix computed elsewhere (same key => same list); keeps the longer of the two."""
+        with self._lock:
+            have = self._items.get(key)
+            if have is None:
+                self._tokens[key[0]] = self._tokens.get(key[0], 0) + 1
+            elif len(have) >= len(items) and not complete:
+                return
+            self._items[key] = list(items)
+            self._items.move_to_end(key)
+            if complete:
+                self._complete.add(key)
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._items), "hits": self.hits, "misses": self.misses,
+                "reopened": self.reopened}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+# =============================
+# Engine
+# =============================
+
+class NeighborEngine:
+    """Cosine top-k for batches of in-vocab tokens."""
+
+    def __init__(self, wv: "KeyedVectors", ann=None):
+        self.wv = wv
+        self.ann = ann        # optional IVFIndex, used when a query passes nprobe
+        self.tokens = None    # optional TokenIndex for pick_token misses
+        self.masks: Dict[str, VerdictMask] = {}  # filter config digest -> VerdictMask
+        self.tables = None    # optional VocabTables (norm / family ids per row)
+        self.clean_memo: Optional[CleanListMemo] = None  # optional, shared across trees
+        self.compact = None   # optional CompactVectors for the exact-path scan
+        self.knn = None       # optional KNNGraph (precomputed neighbor lists)
+        self.shared = None    # optional SharedNeighborCache (lists cached across processes)
+        self._inv = None
+        self.scans = 0        # matrix products issued
+        self.queries = 0      # query rows scored
+        self.rescored = 0     # float32 rows rescored after compact scans
+
+    @property
+    def _inv_norms(self) -> np.ndarray:
+        """Inverse row norms, from the compact store when attached (no full-matrix read)."""
+        if self._inv is None:
+            if self.compact is not None:
+                norms = np.asarray(self.compact.norms, dtype=np.float32)
+            else:
+                self.wv.fill_norms()
+                norms = np.asarray(self.wv.norms, dtype=np.float32)
+            with np.errstate(divide="ignore"):
+                self._inv = np.where(norms > 0, 1.0 / norms, 0.0).astype(np.float32)
+        return self._inv
+
+    def unit(self, tokens: Sequence[str]) -> np.ndarray:
+        """Unit-length vectors for in-vocab tokens, shape (len(tokens), d)."""
+        idx = np.fromiter((self.wv.key_to_index[t] for t in tokens), dtype=np.int64, count=len(tokens))
+        return np.asarray(self.wv.vectors[idx], dtype=np.float32) * self._inv_norms[idx, None]
+
+    def score(self, tokens: Sequence[str]) -> np.ndarray:
+        """Cosine of every vocab row to each token, shape (len(tokens), V)."""
+        q = self.unit(tokens)
+        sims = (self.wv.vectors @ q.T).T
+        sims *= self._inv_norms
+        self.scans += 1
+        self.queries += len(tokens)
+        return sims
+
+    def score_rows(self, q: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Cosine of a unit query to selected vocab rows only."""
+        return (np.asarray(self.wv.vectors[rows], dtype=np.float32) @ q) * self._inv_norms[rows]
+
+    def mask_for(self, word_filter) -> Optional[VerdictMask]:
+        """Precomputed verdicts for this filter's config, if one was attached."""
+        if not self.masks or word_filter is None:
+            return None
+        return self.masks.get(config_digest(word_filter.config_key()))
+
+    def query_batch(
+        self,
+        tokens: Sequence[str],
+        nprobe: Optional[int] = None,
+        mask: Optional[VerdictMask] = None,
+    ) -> Dict[str, CandidateStream]:
+        """
+        One matrix product for all tokens (e.g. every parent at a tree level).
+        nprobe: use the approximate index (if loaded) probing that many clusters.
+        mask: drop rows the filter rejects before ranking.
+        """
+        tokens = list(dict.fromkeys(t for t in tokens if t in self.wv.key_to_index))
+        if not tokens:
+            return {}
+        metrics.count("neighbor_queries_total", len(tokens))
+        valid = mask.valid if mask is not None else None
+        if nprobe and self.ann is not None:
+            q = self.unit(tokens)
+            self.queries += len(tokens)
+            return {
+                t: self.ann.stream(self, q[i], self.wv.key_to_index[t], nprobe, valid=valid)
+                for i, t in enumerate(tokens)
+            }
+        if self.knn is not None and self.knn.serves(mask):
+            metrics.count("knn_graph_lookups_total", len(tokens))
+            return {t: self.knn.stream(self, self.wv.key_to_index[t], valid=valid) for t in tokens}
+        if self.shared is not None:
+            return self.shared.streams(self, tokens, valid=valid)
+        return self.scan(tokens, valid)
+
+    def scan(self, tokens: List[str], valid: Optional[np.ndarray] = None) -> Dict[str, CandidateStream]:
+        """Exact streams for in-vocab tokens from one scan of the vocabulary (compact rows if attached)."""
+        if self.compact is not None:
+            return self._query_compact(tokens, valid)
+        sims = self.score(tokens)
+        keys = self.wv.index_to_key
+        return {
+            t: CandidateStream(keys, sims[i], self.wv.key_to_index[t], valid=valid)
+            for i, t in enumerate(tokens)
+        }
+
+    def _query_compact(self, tokens: List[str], valid: Optional[np.ndarray]) -> Dict[str, CandidateStream]:
+        from compact_store import RescoredStream
+
+        q = self.unit(tokens)
+        sims = self.compact.score(q)
+        err = self.compact.error_bound(q)
+        self.scans += 1
+        self.queries += len(tokens)
+        keys = self.wv.index_to_key
+        out = {}
+        for i, t in enumerate(tokens):
+            approx = CandidateStream(keys, sims[i], self.wv.key_to_index[t], valid=valid)
+            out[t] = RescoredStream(self, approx, q[i], err[i])
+        return out
+
+    def stream(
+        self, token: str, nprobe: Optional[int] = None, mask: Optional[VerdictMask] = None
+    ) -> Optional[CandidateStream]:
+        return self.query_batch([token], nprobe=nprobe, mask=mask).get(token)
+
+    def most_similar(self, token: str, topn: int = 10, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Drop-in for wv.most_similar(token, topn=...)."""
+        s = self.stream(token, nprobe=nprobe)
+        return s.take(topn) if s is not None else []
+
+_ENGINES: "weakref.WeakKeyDictionary[KeyedVectors, NeighborEngine]" = weakref.WeakKeyDictionary()
+
+def get_engine(wv: "KeyedVectors") -> NeighborEngine:
+    """Shared engine per KeyedVectors object (norms computed once)."""
+    eng = _ENGINES.get(wv)
+    if eng is None:
+        eng = NeighborEngine(wv)
+        _ENGINES[wv] = eng
+    return eng
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Parallel tree builds: candidate pools for a whole level at once, then the
+serial depth-first pass over them (trees identical to workers=1; scores can
+differ in the last float32 bit, as products of other batch sizes).
+
+- Level by level, the frontier (the root, then the nodes expected on the
+  next level, then their runners-up) is scored in one batched product: the
+  serial build runs one product per sibling group, and a product costs
+  about the same for 4 queries as for 24, so the plan issues far fewer.
+  Thread mode scores the whole level in the calling thread (BLAS spreads
+  it over the cores) and splits only the picks into tasks; process mode
+  (process_executor(): workers memory-map the model through the registry,
+  as in batch.py) gives each worker a contiguous chunk to score and pick
+- A pick reads the node's clean neighbor list (the tree-independent part
+  of get_clean_similar, see CleanListMemo) and chooses its speculative
+  children against the norms claimed up to the previous level, stopping
+  early exactly as the serial pick does (TreeBuilder.select_children).
+  Below the root, SPARE_ROUNDS more picks give runners-up, which join the
+  next level's product. The last level with children (whose children are
+  leaves) is only scored, in thread mode, and the depth-first pass picks
+  from those streams
+- Merge, in depth-first priority order (frontier order is the order the
+  serial build visits those nodes): the lists go into the tree's
+  CleanListMemo, and a speculative child whose norm an earlier node of the
+  same level already took is dropped; the survivors are the next frontier.
+  Thread tasks also hand over their streams, so a depth-first pick that
+  reads past a stored list extends it without a new scan
+- The depth-first pass (iter_similarity_tree) then runs over the warm memo
+  and applies used_norms exactly as the serial build does, so the result
+  is the serial tree by construction; speculation only decides which lists
+  are ready in advance. A node it missed is scored with its siblings, as
+  in the serial build (parallel_tree_pools_total{result="missed"})
+- Speculative picks record no acceptance stats; a pick the tree reuses
+  records them then
+- Scaling: in thread mode only the batched products (BLAS, GIL released)
+  run on several cores; the picks are pure Python and hold the GIL, so
+  thread mode mostly wins by issuing fewer, larger products (1.1-1.2x over
+  serial on one core, benchmarks/parallel_tree.py). Picks scale with cores only in
+  process mode, which pays a model load per worker and pickled results, so
+  it suits long-running pools (process_executor() reused across builds)
+"""
+
+import contextvars
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import metrics
+from main import FILTER_CONFIG, TreeBuilder, record_pick
+from neighbors import CleanListMemo
+
+Children = List[Tuple[str, float]]
+Pick = Tuple[int, int]  # candidates pulled, checked
+
+# Runners-up picked per parent (rounds of `breadth`, each excluding the ones before) whose lists
+# are scored with the next level: the depth-first pass often gives a child's norm to an earlier
+# subtree, and then picks from these
+SPARE_ROUNDS = 2
+
+# Per-process state of process_executor() workers, set by _init_worker
+_WORKER: Dict[str, Any] = {}
+
+def _init_worker(kv_path: str, filter_config: Dict[str, Any]) -> None:
+    from registry import REGISTRY
+
+    model = REGISTRY.get_model(kv_path)
+    _WORKER.update(wv=model.wv, engine=model.engine, word_filter=REGISTRY.get_filter(**filter_config))
+
+def process_executor(kv_path: str, filter_config: Optional[Dict[str, Any]] = None,
+                     workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Process pool for build_similarity_tree(..., executor=...). The workers'
+    model and filter must be the caller's (same registry model, so the same
+    vocab tables and verdict mask): pools whose memo key differs from the
+    tree's are dropped and those nodes are read on the spot.
+    """
+    filter_config = dict(FILTER_CONFIG if filter_config is None else filter_config)
+    return ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(kv_path, filter_config))
+
+def _builder_params(builder: TreeBuilder) -> Dict[str, Any]:
+    return {
+        "breadth": builder.breadth,
+        "min_sim_to_parent": builder.min_sim_to_parent,
+        "min_sim_to_root": builder.min_sim_to_root,
+        "extra_expand_factor": builder.extra_expand_factor,
+        "ann_nprobe": builder.ann_nprobe,
+    }
+
+def _level_task(builder: Optional[TreeBuilder], root_word: str, params: Dict[str, Any], tokens: List[str],
+                level: int, claimed: FrozenSet[Any], reserve: int, spare_for: Set[str],
+                streams: Optional[Dict[str, Any]] = None) -> List[Tuple[Any, list, bool, Children, Pick, Children]]:
+    """
+    Per token of one chunk of a level: its memo entry (key, clean list,
+    complete), its children picked against `claimed`, the pick's (pulled,
+    checked), runners-up (for tokens in spare_for) and, in this process,
+    its scored stream. `streams`: the chunk already scored (thread tasks);
+    otherwise the task scores it. Each list runs `reserve` candidates past
+    what the pick read (process workers, whose streams stay behind).
+    """
+    remote = builder is None
+    if remote:  # process worker: same tree parameters, this process's model and filter
+        builder = TreeBuilder(_WORKER["wv"], root_word, word_filter=_WORKER["word_filter"],
+                              engine=_WORKER["engine"], **params)
+    if streams is None:
+        with metrics.stage("neighbor_scan"):
+            streams = builder.engine.query_batch(tokens, nprobe=builder.ann_nprobe, mask=builder.mask)
+    out = []
+    for token in tokens:
+        memo = CleanListMemo(max_items=1)
+        used = set(claimed)
+        picker = builder.select_children(token, level, used_norms=used,
+                                         stream=streams.get(token), memo=memo, reserve=reserve)
+        (key, items, complete), = memo.entries()
+        # runners-up: what the node picks if its first choices are taken elsewhere in the tree
+        spare: Children = []
+        for _ in range(SPARE_ROUNDS if token in spare_for else 0):
+            more = builder.select_children(token, level, used_norms=used, stream=streams.get(token),
+                                           memo=memo).picked
+            if not more:
+                break
+            spare.extend(more)
+        out.append((key, items, complete, picker.picked, (picker.pulled, picker.checked), spare))
+    if remote:
+        return out
+    return [entry + (streams.get(token),) for token, entry in zip(tokens, out)]
+
+def _done(result: Any) -> Future:
+    future: Future = Future()
+    future.set_result(result)
+    return future
+
+def _chunks(items: List[str], n: int) -> List[List[str]]:
+    """n contiguous, near-equal chunks (fewer if there are fewer items)."""
+    n = max(1, min(n, len(items)))
+    size, extra = divmod(len(items), n)
+    out, start = [], 0
+    for i in range(n):
+        stop = start + size + (i < extra)
+        out.append(items[start:stop])
+        start = stop
+    return out
+
+# =============================
+# Plan
+# =============================
+
+class LevelPlan:
+    """
+    Pools and speculative picks of one tree, built level by level (warm());
+    choose_children() then serves the depth-first pass.
+
+    A pick depends on used_norms only through which norms of the clean-list
+    prefix it read are in it, so a speculative pick made against `claimed`
+    is reused when every one of those norms is in claimed exactly when it
+    is in the tree's used_norms. Otherwise the node is picked again from its
+    warm list (or, if speculation never reached it, from a fresh one).
+    """
+
+    def __init__(self, builder: TreeBuilder, depth: int):
+        self.builder = builder
+        self.depth = depth
+        if builder.memo is None:
+            builder.memo = CleanListMemo()
+        # token -> children, claimed, norms read, (pulled, checked)
+        self.picks: Dict[str, Tuple[Children, FrozenSet[Any], FrozenSet[Any], Pick]] = {}
+        self.scored: Set[str] = set()  # last planned level (thread mode): streams only, no pick
+
+    def warm(self, workers: int = 1, executor: Optional[Executor] = None) -> "LevelPlan":
+        """Compute every level's pools and picks (tasks: `workers` chunks per level)."""
+        if executor is None:
+            if workers <= 1:
+                return self._warm(1, None)
+            with ThreadPoolExecutor(workers) as pool:
+                return self._warm(workers, pool)
+        return self._warm(max(1, workers), executor)
+
+    def _warm(self, workers: int, executor: Optional[Executor]) -> "LevelPlan":
+        builder = self.builder
+        remote = isinstance(executor, ProcessPoolExecutor)
+        params = _builder_params(builder)
+        # process workers keep their streams: read a little past each pick instead of rescanning later
+        reserve = builder.breadth * builder.breadth if remote else 0
+        claimed = frozenset(builder.used_norms)
+        frontier = [builder.root_token]
+        runners_up: Set[str] = set()
+        for level in range(self.depth - 1):
+            frontier = [t for t in dict.fromkeys(frontier) if t not in self.picks and t not in self.scored]
+            if not frontier:
+                break
+            parts = _chunks(frontier, workers)
+            # runners-up matter only where the next level still has parents, and the root's pick is exact
+            spare_for = set(frontier) - runners_up if 0 < level < self.depth - 2 else set()
+            if not remote and level == self.depth - 2:
+                # children are leaves: nothing to plan past this level, the depth-first pass picks from the streams
+                with metrics.stage("neighbor_scan"):
+                    builder.streams.update(builder.engine.query_batch(frontier, nprobe=builder.ann_nprobe,
+                                                                      mask=builder.mask))
+                self.scored.update(frontier)
+                break
+            if remote:
+                # worker processes record into their own Trace; merged into the caller's sink below
+                futures = [executor.submit(metrics.traced, _level_task, None, builder.root_token, params,
+                                           part, level, claimed, reserve, spare_for & set(part))
+                           for part in parts]
+            else:
+                # the whole level in one product (BLAS spreads it over the cores); tasks only pick
+                with metrics.stage("neighbor_scan"):
+                    streams = builder.engine.query_batch(frontier, nprobe=builder.ann_nprobe, mask=builder.mask)
+                if executor is None:  # one task: no pool round trip
+                    futures = [_done(_level_task(builder, builder.root_token, params, frontier, level, claimed,
+                                                 reserve, spare_for, streams))]
+                else:
+                    # each task in a copy of this context, so it records into the request's Trace
+                    futures = [executor.submit(contextvars.copy_context().run, _level_task, builder,
+                                               builder.root_token, params, part, level, claimed, reserve,
+                                               spare_for & set(part), streams)
+                               for part in parts]
+            results = [f.result() for f in futures]
+            if remote:
+                for _, trace in results:
+                    metrics.merge(trace)
+                results = [result for result, _ in results]
+            # Merge in priority order: earlier nodes of the level keep their children
+            taken: Set[Any] = set()
+            next_frontier: List[str] = []
+            spares: List[str] = []
+            for part, result in zip(parts, results):
+                for token, (key, items, complete, children, pick, spare, *stream) in zip(part, result):
+                    if key != builder.memo_key(token):
+                        # worker model/filter/tables differ from the tree's: its lists and picks do not apply
+                        continue
+                    builder.memo.seed(key, items, complete)
+                    if stream and stream[0] is not None:
+                        builder.streams[token] = stream[0]
+                    read = frozenset(k for _, _, k in items)
+                    if token in runners_up:  # its pool is ready; it claims nothing and is not expanded
+                        self.picks[token] = (children, claimed, read, pick)
+                        continue
+                    used = claimed
+                    if any(builder.norm_of(c) in taken for c, _ in children):
+                        # an earlier node took one of them: pick again from the (now warm) list
+                        used = claimed | taken
+                        picker = builder.select_children(token, level, used_norms=set(used),
+                                                         stream=builder.streams.get(token))
+                        children, read = picker.picked, None
+                    self.picks[token] = (children, used, read, pick)
+                    taken.update(builder.norm_of(c) for c, _ in children)
+                    next_frontier.extend(c for c, _ in children)
+                    spares.extend(c for c, _ in spare)
+            claimed = claimed | taken
+            runners_up = set(spares) - set(next_frontier)
+            frontier = next_frontier + spares
+        metrics.count("parallel_tree_pools_total", len(self.picks) + len(self.scored), result="computed")
+        return self
+
+    def choose_children(self, token: str, level: int) -> Children:
+        """TreeBuilder.choose_children for the depth-first pass, reusing the speculative pick when valid."""
+        builder = self.builder
+        used_norms = builder.used_norms
+        pick = self.picks.pop(token, None)
+        if pick is None:
+            metrics.count("parallel_tree_pools_total", result="scored" if token in self.scored else "missed")
+            return builder.choose_children(token, level)
+        children, claimed, read, (pulled, checked) = pick
+        if read is None or any((n in claimed) != (n in used_norms) for n in read):
+            metrics.count("parallel_tree_pools_total", result="warm")
+            return builder.choose_children(token, level)
+        metrics.count("parallel_tree_pools_total", result="reused")
+        record_pick(level, checked, len(children), pulled)
+        used_norms.update(builder.norm_of(c) for c, _ in children)
+        return children
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pruned / domain-subset models built from a source .kv.
+
+- Drops every row the HybridFilter rejects: those tokens can never enter a
+  tree, yet every full-vocabulary scan scores them
+- Optional domain word list (medicine, law, physics, ...): keeps the listed
+  words (matched by normalized form) and, with neighbors=N, each one's top-N
+  filter-passing neighbors in the source model, so trees rooted in the
+  domain stay inside it
+- Frequency cutoffs: max_rank (gensim vocabularies are frequency-sorted,
+  row 0 = most frequent) and min_count when the model stores counts
+- merge_case: one row per lowercased form, the most frequent casing wins
+  (pick_token still resolves "Apple" / "APPLE" to the kept row)
+- Saved as a regular .kv (vectors in a separate .npy, so mmap="r" works)
+  plus <out>.prune.json describing the source, filter and options; point
+  KV_PATH / --kv at it and build_similarity_tree uses it as is
+
+Build:  python prune_vocab.py --kv lexvec_300d.kv --out lexvec_pruned.kv [--domain-file medicine.txt --neighbors 200]
+"""
+
+import json
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Set
+
+import numpy as np
+
+from filter_cache import VerdictMask, config_digest
+from main import HybridFilter, normalize
+from neighbors import NeighborEngine
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors
+
+META_SUFFIX = ".prune.json"
+
+def meta_path_for(kv_path: str) -> str:
+    return kv_path + META_SUFFIX
+
+def load_prune_meta(kv_path: str) -> Optional[Dict[str, Any]]:
+    """Metadata written by prune_model() next to a pruned .kv, or None for a full model."""
+    path = meta_path_for(kv_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# =============================
+# Row selection
+# =============================
+
+def filter_valid(wv: "KeyedVectors", word_filter: HybridFilter, kv_path: Optional[str] = None,
+                 fingerprint: Optional[str] = None) -> np.ndarray:
+    """is_valid() per row: the saved <kv>.verdicts mask for this config if there is one, else computed."""
+    if kv_path is not None:
+        mask = VerdictMask.load_all(kv_path, fingerprint=fingerprint).get(config_digest(word_filter.config_key()))
+        if mask is not None:
+            return mask.valid.copy()
+    return VerdictMask.build(wv, word_filter).valid.copy()
+
+def domain_rows(wv: "KeyedVectors", words: Iterable[str], valid: np.ndarray, neighbors: int = 0,
+                batch: int = 256) -> np.ndarray:
+    """Rows whose normalized form is a domain word, plus top-`neighbors` valid neighbors of each."""
+    wanted = {normalize(w) for w in words if w.strip()}
+    keep = np.fromiter((normalize(k) in wanted for k in wv.index_to_key), dtype=bool, count=len(valid))
+    if neighbors:
+        engine = NeighborEngine(wv)
+        mask = VerdictMask(np.packbits(valid), len(valid))
+        seeds = [wv.index_to_key[r] for r in np.flatnonzero(keep & valid)]
+        for start in range(0, len(seeds), batch):  # bounds the (batch, V) score block
+            streams = engine.query_batch(seeds[start:start + batch], mask=mask)
+            for stream in streams.values():
+                rows, _ = stream.take_rows(neighbors)
+                keep[rows] = True
+    return keep
+
+def case_representatives(wv: "KeyedVectors", keep: np.ndarray) -> np.ndarray:
+    """Narrow `keep` to the first (most frequent) kept row per lowercased token."""
+    seen: Set[str] = set()
+    out = np.zeros_like(keep)
+    for row in np.flatnonzero(keep).tolist():
+        low = wv.index_to_key[row].lower()
+        if low not in seen:
+            seen.add(low)
+            out[row] = True
+    return out
+
+# =============================
+# Build
+# =============================
+
+def prune_model(
+    wv: "KeyedVectors",
+    out_path: str,
+    word_filter: Optional[HybridFilter] = None,
+    domain: Optional[Iterable[str]] = None,
+    neighbors: int = 0,
+    keep_words: Iterable[str] = (),
+    max_rank: Optional[int] = None,
+    min_count: Optional[int] = None,
+    merge_case: bool = False,
+    source_path: Optional[str] = None,
+    fingerprint: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Write the pruned model to out_path (+ .prune.json) and return its metadata.
+    keep_words are kept whatever the filter says (e.g. roots that must resolve).
+    """
+    from gensim.models import KeyedVectors
+
+    t0 = time.perf_counter()
+    word_filter = word_filter or HybridFilter()
+    n = len(wv.index_to_key)
+    counts: Dict[str, int] = {}
+
+    valid = filter_valid(wv, word_filter, kv_path=source_path, fingerprint=fingerprint)
+    keep = valid.copy()
+    counts["filter"] = int(keep.sum())
+    if max_rank is not None:
+        keep[max_rank:] = False
+        counts["max_rank"] = int(keep.sum())
+    if min_count is not None:
+        if "count" not in wv.expandos:
+            raise ValueError("min_count: this model stores no token counts (use max_rank)")
+        keep &= np.asarray(wv.expandos["count"]) >= min_count
+        counts["min_count"] = int(keep.sum())
+    if domain is not None:
+        keep &= domain_rows(wv, domain, keep, neighbors=neighbors)
+        counts["domain"] = int(keep.sum())
+    for w in keep_words:
+        if w in wv.key_to_index:
+            keep[wv.key_to_index[w]] = True
+    if merge_case:
+        keep = case_representatives(wv, keep)
+        counts["merge_case"] = int(keep.sum())
+
+    rows = np.flatnonzero(keep)
+    keys = [wv.index_to_key[r] for r in rows.tolist()]
+    pruned = KeyedVectors(wv.vector_size, dtype=wv.vectors.dtype)
+    pruned.add_vectors(keys, np.asarray(wv.vectors[rows]))
+    for attr, values in wv.expandos.items():  # e.g. counts, in the same (frequency) order
+        pruned.expandos[attr] = np.asarray(values)[rows]
+    pruned.save(out_path, separately=["vectors"])
+
+    meta = {
+        "source": os.path.abspath(source_path) if source_path else None,
+        "source_fingerprint": fingerprint,
+        "source_vocab": n,
+        "vocab_size": len(keys),
+        "kept": round(len(keys) / n, 4) if n else None,
+        "filter": config_digest(word_filter.config_key()),
+        "domain": domain is not None,
+        "neighbors": neighbors if domain is not None else None,
+        "max_rank": max_rank,
+        "min_count": min_count,
+        "merge_case": merge_case,
+        "rows_after": counts,
+        "vectors_mb": round(pruned.vectors.nbytes / (1024 * 1024), 1),
+        "source_vectors_mb": round(wv.vectors.nbytes / (1024 * 1024), 1),
+        "build_seconds": round(time.perf_counter() - t0, 3),
+    }
+    with open(meta_path_for(out_path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+if __name__ == "__main__":
+    import argparse
+    from gensim.models import KeyedVectors
+    from registry import model_fingerprint
+
+    ap = argparse.ArgumentParser(description="Build a pruned (filter-passing / domain) .kv from a source model.")
+    ap.add_argument("--kv", required=True, help="Source KeyedVectors .kv file")
+    ap.add_argument("--out", required=True, help="Output .kv path")
+    ap.add_argument("--domain-file", default=None, help="Newline-separated domain words to restrict to")
+    ap.add_argument("--neighbors", type=int, default=0, help="Also keep each domain word's top-N neighbors")
+    ap.add_argument("--keep-file", default=None, help="Newline-separated words to keep regardless of filters")
+    ap.add_argument("--max-rank", type=int, default=None, help="Keep only the N most frequent rows")
+    ap.add_argument("--min-count", type=int, default=None, help="Minimum token count (models with counts)")
+    ap.add_argument("--merge-case", action="store_true", help="One row per lowercased form (most frequent casing)")
+    ap.add_argument("--lang", default="en", help="Language for pyspellchecker (if installed)")
+    ap.add_argument("--spell-distance", type=int, default=1, help="Edit distance for spellchecker")
+    ap.add_argument("--no-spell", action="store_true", help="Disable dictionary check even if available")
+    ap.add_argument("--allow-file", default=None, help="Path to newline-separated whitelist file")
+    ap.add_argument("--deny-file", default=None, help="Path to newline-separated blacklist file")
+    args = ap.parse_args()
+
+    def load_word_file(path: Optional[str]) -> Set[str]:
+        if not path: return set()
+        with open(path, "r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    wv = KeyedVectors.load(args.kv, mmap="r")
+    word_filter = HybridFilter(
+        allow=load_word_file(args.allow_file),
+        deny=load_word_file(args.deny_file),
+        language=args.lang,
+        spell_distance=args.spell_distance,
+        use_spell=not args.no_spell,
+        use_cache=False,
+    )
+    meta = prune_model(
+        wv, args.out, word_filter=word_filter,
+        domain=load_word_file(args.domain_file) if args.domain_file else None,
+        neighbors=args.neighbors, keep_words=load_word_file(args.keep_file),
+        max_rank=args.max_rank, min_count=args.min_count, merge_case=args.merge_case,
+        source_path=args.kv, fingerprint=model_fingerprint(args.kv),
+    )
+    print(f"Kept {meta['vocab_size']}/{meta['source_vocab']} rows ({meta['kept']:.1%}): "
+          f"{meta['vectors_mb']} MB vs {meta['source_vectors_mb']} MB; saved {args.out} in {meta['build_seconds']}s")
+    print(f"Rows after each step: {meta['rows_after']}")
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Process-wide model registry.
+
+- Loads each KeyedVectors file once (mmap="r", so the OS page cache is shared
+  read-only between workers) and each HybridFilter config once
+- Hands the same objects to every /api/word request
+- warm() at startup, reload() to pick up a new file without restarting
+- Reports load time and resident memory
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+from main import ACCEPTANCE, HybridFilter, KV_PATH, FILTER_CONFIG, PRELOAD_STATS
+from neighbors import NeighborEngine, get_engine
+from ann_index import IVFIndex, index_dir_for
+from token_index import TokenIndex
+from filter_cache import VERDICT_CACHE, VerdictMask
+from vocab_tables import VocabTables
+from compact_store import CompactVectors, advise_random
+from prune_vocab import load_prune_meta
+from knn_graph import KNNGraph
+from neighbor_cache import SharedNeighborCache
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors
+
+# =============================
+# Process / file helpers
+# =============================
+
+def resident_memory_mb() -> Optional[float]:
+    """Current RSS of this process in MB (Linux /proc, else peak RSS via resource)."""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    except Exception:
+        return None
+
+def model_fingerprint(path: str) -> str:
+    """
+    Cheap identity for a vector file: path + size + mtime of the .kv and its
+    companion .npy arrays. Changes whenever the vectors are swapped on disk.
+    """
+    h = hashlib.sha1(os.path.abspath(path).encode("utf-8"))
+    for p in (path, f"{path}.vectors.npy"):
+        if os.path.exists(p):
+            st = os.stat(p)
+            h.update(f"{st.st_size}:{st.st_mtime_ns}".encode("ascii"))
+    return h.hexdigest()[:16]
+
+# =============================
+# Registry
+# =============================
+
+class ModelHandle:
+    """One loaded vector file plus its load stats."""
+
+    def __init__(self, path: str, wv: "KeyedVectors", load_seconds: float, fingerprint: str):
+        self.path = path
+        self.wv = wv
+        self.load_seconds = load_seconds
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+        self.engine: NeighborEngine = get_engine(wv)
+        self.prune_meta = load_prune_meta(path)  # set for models written by prune_vocab.py
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "fingerprint": self.fingerprint,
+            "vocab_size": len(self.wv.index_to_key),
+            "dim": int(self.wv.vector_size),
+            "mmap": isinstance(self.wv.vectors, np.memmap),
+            "vectors_mb": round(self.wv.vectors.nbytes / (1024 * 1024), 1),
+            "pruned_from": self.prune_meta.get("source") if self.prune_meta else None,
+            "compact": self.engine.compact.dtype if self.engine.compact is not None else None,
+            "compact_mb": (round(self.engine.compact.nbytes / (1024 * 1024), 1)
+                           if self.engine.compact is not None else None),
+            "load_seconds": round(self.load_seconds, 3),
+            "loaded_at": self.loaded_at,
+            "neighbor_scans": self.engine.scans,
+            "rescored_rows": self.engine.rescored,
+            "ann_nlist": self.engine.ann.nlist if self.engine.ann is not None else None,
+            "knn_k": self.engine.knn.k if self.engine.knn is not None else None,
+            "neighbor_cache": self.engine.shared.stats() if self.engine.shared is not None else None,
+            "verdict_masks": sorted(self.engine.masks),
+        }
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._models: Dict[str, ModelHandle] = {}
+        self._filters: Dict[Tuple, HybridFilter] = {}
+        self._filter_load_seconds: Dict[Tuple, float] = {}
+
+    # ---- vectors ----
+
+    def get_model(self, path: str = KV_PATH) -> ModelHandle:
+        handle = self._models.get(path)
+        if handle is not None:
+            return handle
+        with self._lock:
+            handle = self._models.get(path)
+            if handle is None:
+                handle = self._load_model(path)
+                self._models[path] = handle
+            return handle
+
+    def get_vectors(self, path: str = KV_PATH) -> "KeyedVectors":
+        return self.get_model(path).wv
+
+    def _load_model(self, path: str) -> ModelHandle:
+        from gensim.models import KeyedVectors
+
+        print(f"Loading vectors: {path}")
+        t0 = time.perf_counter()
+        wv = KeyedVectors.load(path, mmap="r")
+        fingerprint = model_fingerprint(path)
+        compact = CompactVectors.load_for(path, fingerprint, len(wv.index_to_key))
+        if compact is None:
+            wv.fill_norms()  # once here instead of on the first most_similar of every worker
+        else:
+            advise_random(wv.vectors)
+        handle = ModelHandle(path, wv, time.perf_counter() - t0, fingerprint)
+        handle.engine.compact = compact  # carries the norms, so the float32 matrix stays on disk
+        self._attach_ann(handle)
+        handle.engine.tokens = TokenIndex.load_or_build(path, wv, fingerprint=handle.fingerprint)
+        handle.engine.masks = VerdictMask.load_all(path, fingerprint=handle.fingerprint)
+        handle.engine.knn = KNNGraph.load_for(path, handle.fingerprint, len(wv.index_to_key))
+        handle.engine.shared = SharedNeighborCache.load_for(path, handle.fingerprint, len(wv.index_to_key))
+        handle.engine.tables = VocabTables.load_or_build(path, wv, fingerprint=handle.fingerprint)
+        return handle
+
+    def _attach_ann(self, handle: ModelHandle) -> None:
+        """Memory-map <model>.kv.ivf/ if it was built for this exact file."""
+        ivf_dir = index_dir_for(handle.path)
+        if not os.path.isdir(ivf_dir):
+            return
+        index = IVFIndex.load(ivf_dir, mmap=True)
+        if index.meta.get("fingerprint") != handle.fingerprint:
+            print(f"Ignoring stale ANN index {ivf_dir} (rebuild with ann_index.py)")
+            return
+        handle.engine.ann = index
+
+    # ---- filters ----
+
+    def get_filter(
+        self,
+        allow: Optional[Set[str]] = None,
+        deny: Optional[Set[str]] = None,
+        language: str = "en",
+        spell_distance: int = 1,
+        use_spell: Optional[bool] = None,
+    ) -> HybridFilter:
+        key = HybridFilter.make_config_key(allow, deny, language, spell_distance, use_spell)
+        wf = self._filters.get(key)
+        if wf is not None:
+            return wf
+        with self._lock:
+            wf = self._filters.get(key)
+            if wf is None:
+                t0 = time.perf_counter()
+                wf = HybridFilter(
+                    allow=allow,
+                    deny=deny,
+                    language=language,
+                    spell_distance=spell_distance,
+                    use_spell=use_spell,
+                )
+                self._filters[key] = wf
+                self._filter_load_seconds[key] = time.perf_counter() - t0
+            return wf
+
+    # ---- lifecycle ----
+
+    def warm(
+        self,
+        paths: Iterable[str] = (KV_PATH,),
+        filter_configs: Iterable[Dict[str, Any]] = (FILTER_CONFIG,),
+    ) -> Dict[str, Any]:
+        """Load everything up front (call at server start). Missing files are reported, not raised."""
+        for path in paths:
+            try:
+                self.get_model(path)
+            except FileNotFoundError as e:
+                print(f"Model warm-up skipped: {e}")
+        for cfg in filter_configs:
+            self.get_filter(**cfg)
+        return self.stats()
+
+    def reload(self, path: Optional[str] = None, filters: bool = False) -> Dict[str, Any]:
+        """
+        Re-load one vector file (or all loaded ones) in place. The old handle keeps
+        serving in-flight requests; new requests get the fresh one.
+        filters=True also rebuilds every cached HybridFilter.
+        Only already-loaded files and KV_PATH can be reloaded (ValueError
+        otherwise): loading unpickles the file. A failed load keeps the old handle.
+        """
+        with self._lock:
+            if path and path not in self._models and path != KV_PATH:
+                raise ValueError(f"not a loaded or configured model path: {path!r}")
+            targets = [path] if path else list(self._models)
+            for p in targets:
+                self._models[p] = self._load_model(p)
+            if filters:
+                old = list(self._filters)
+                self._filters.clear()
+                self._filter_load_seconds.clear()
+                for (allow, deny, language, spell_distance, use_spell) in old:
+                    self.get_filter(set(allow), set(deny), language, spell_distance, use_spell)
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "rss_mb": resident_memory_mb(),
+            "preload_seconds": dict(PRELOAD_STATS),
+            "models": [h.stats() for h in self._models.values()],
+            "verdict_cache": VERDICT_CACHE.stats(),
+            "tree_acceptance": ACCEPTANCE.stats(),
+            "filters": [
+                {
+                    "language": key[2],
+                    "spell_distance": key[3],
+                    "use_spell": key[4],
+                    "allow": len(key[0]),
+                    "deny": len(key[1]),
+                    "load_seconds": round(self._filter_load_seconds.get(key, 0.0), 3),
+                }
+                for key in self._filters
+            ],
+        }
+
+# One registry per process (gunicorn --preload: load in the master and fork)
+REGISTRY = ModelRegistry()
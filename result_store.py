@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Per-request tree results (replaces the single shared trees.json).
+
+- Trees are encoded once as compact JSON (no indent, no spaces)
+- Stored under a content address (sha1 of those bytes), so concurrent users
+  never overwrite each other and identical trees share one entry
+- Gzip variant computed lazily once per entry and reused
+- Bounded in-memory LRU; nothing is written to disk unless asked for:
+  - export=True (main.run_in_code) writes EXPORT_DIR/<id>.json, and any
+    worker can serve that id from there; it is the only on-disk copy
+  - SHARED_RESULTS_DIR (opt-in, off by default) writes every result there
+    (like tree_cache.py), so an id from one server worker resolves on any
+    other; oldest files are dropped past max_disk_bytes
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+EXPORT_DIR = "exports"  # trees.json is only the front end's static sample
+
+# Set to a directory (e.g. ".results") to share every result between server workers
+SHARED_RESULTS_DIR: Optional[str] = None
+
+_ID = re.compile(r"[0-9a-f]{20}")
+
+def encode_json(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def gzip_bytes(data: bytes, level: int = 6) -> bytes:
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def content_id(body: bytes) -> str:
+    """Id of a result from its compact JSON bytes (what put() returns)."""
+    return hashlib.sha1(body).hexdigest()[:20]
+
+def export_path(rid: str, export_dir: str = EXPORT_DIR) -> str:
+    return os.path.join(export_dir, f"{rid}.json")
+
+class ResultStore:
+    def __init__(self, max_items: int = 1024, directory: Optional[str] = None,
+                 export_dir: Optional[str] = EXPORT_DIR, max_disk_bytes: int = 256 * 1024 * 1024):
+        """
+        directory: shared on-disk tier written by put() (None = this process only).
+        export_dir: where exports are written; read (never written) on a miss.
+        """
+        self.max_items = max_items
+        self.directory = directory
+        self.export_dir = export_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._items: "OrderedDict[str, Dict[str, Optional[bytes]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+
+    def put(self, obj: Any) -> Tuple[str, bytes]:
+        """Store `obj`; returns (content id, compact JSON bytes)."""
+        body = encode_json(obj)
+        rid = content_id(body)
+        with self._lock:
+            known = rid in self._items
+        if not known:
+            self._disk_put(rid, body)
+        self._mem_put(rid, body)
+        return rid, body
+
+    def get(self, rid: str, gzipped: bool = False) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(rid)
+        if item is None:
+            body = self._disk_get(rid)
+            if body is None:
+                return None
+            item = self._mem_put(rid, body)
+        with self._lock:
+            if not gzipped:
+                return item["json"]
+            if item["gzip"] is None:
+                item["gzip"] = gzip_bytes(item["json"])
+            return item["gzip"]
+
+    def _mem_put(self, rid: str, body: bytes) -> Dict[str, Optional[bytes]]:
+        with self._lock:
+            item = self._items.setdefault(rid, {"json": body, "gzip": None})
+            self._items.move_to_end(rid)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+            return item
+
+    # ---- disk tier ----
+
+    def _path(self, rid: str) -> str:
+        return os.path.join(self.directory, rid[:2], f"{rid}.json")
+
+    def _exported(self, rid: str) -> Optional[str]:
+        return export_path(rid, self.export_dir) if self.export_dir else None
+
+    def _disk_get(self, rid: str) -> Optional[bytes]:
+        if not _ID.fullmatch(rid):
+            return None
+        for path in (self._path(rid) if self.directory else None, self._exported(rid)):
+            if path is None:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    return f.read()
+            except OSError:
+                pass
+        return None
+
+    def _disk_put(self, rid: str, body: bytes) -> None:
+        if not self.directory:
+            return
+        path = self._path(rid)
+        exported = self._exported(rid)
+        try:
+            # content-addressed: same id, same bytes; an export is already the on-disk copy
+            if os.path.exists(path) or (exported and os.path.exists(exported)):
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)  # atomic: other workers never see half a file
+        except OSError as e:
+            print(f"Result store write failed: {e}")
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_bytes += len(body)
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _disk_files(self) -> Iterator[Tuple[str, int, float]]:
+        for sub in os.listdir(self.directory):
+            d = os.path.join(self.directory, sub)
+            if os.path.isdir(d):
+                for name in os.listdir(d):
+                    if name.endswith(".json"):
+                        p = os.path.join(d, name)
+                        try:
+                            st = os.stat(p)
+                        except OSError:
+                            continue
+                        yield p, st.st_size, st.st_mtime
+
+    def _evict_disk(self) -> None:
+        """Oldest-first until under 90% of the byte budget."""
+        files = sorted(self._disk_files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_disk_bytes * 0.9)
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+# One store per process; the disk tier (if enabled) is shared between processes
+RESULT_STORE = ResultStore(directory=SHARED_RESULTS_DIR)
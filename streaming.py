@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Incremental tree delivery for /api/word/stream.
+
+- The build runs on workers.BUILD_POOL (same admission control as /api/word)
+  and puts iter_similarity_tree() events on a queue as nodes are chosen
+- The request thread relays them as NDJSON lines or Server-Sent Events, so
+  the root and first level reach the client while deeper levels are computing
+- Time-to-first-node, time-to-first-level and total time are tracked per
+  stream in STREAM_STATS
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import metrics
+from main import attach_node
+from result_store import RESULT_STORE, encode_json
+from workers import BUILD_POOL, BuildPool
+
+def produce_events(word: str, out) -> None:
+    """Pool task: put ("node", event) for every node, then ("done", trace) or ("error", msg)."""
+    from main import stream_tree_for_word
+    with metrics.tracing() as trace:
+        try:
+            for event in stream_tree_for_word(word):
+                out.put(("node", event))
+        except Exception as e:
+            out.put(("error", f"{type(e).__name__}: {e}"))
+            raise
+    out.put(("done", trace))
+
+# =============================
+# Metrics
+# =============================
+
+class LatencyStats:
+    """Rolling window of per-stream timings (ms), summarized as mean/p50/p95."""
+
+    def __init__(self, window: int = 1024):
+        self._samples: Dict[str, "deque[float]"] = {}
+        self._window = window
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def record(self, ok: bool = True, **timings_ms: Optional[float]) -> None:
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            for name, ms in timings_ms.items():
+                if ms is not None:
+                    self._samples.setdefault(name, deque(maxlen=self._window)).append(ms)
+
+    @staticmethod
+    def _summary(values) -> Dict[str, float]:
+        vals = sorted(values)
+        pick = lambda q: vals[min(len(vals) - 1, int(q * len(vals)))]
+        return {
+            "count": len(vals),
+            "mean": round(sum(vals) / len(vals), 2),
+            "p50": round(pick(0.50), 2),
+            "p95": round(pick(0.95), 2),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {"completed": self.completed, "failed": self.failed}
+            for name, values in self._samples.items():
+                out[name] = self._summary(values)
+        return out
+
+STREAM_STATS = LatencyStats()
+
+# =============================
+# Streams
+# =============================
+
+class TreeStream:
+    """
+    One streamed build. Construction admits it to the pool (raises
+    workers.PoolSaturated when full); iterating yields (kind, payload) with
+    kind "node", then exactly one "done" or "error".
+    """
+
+    def __init__(self, word: str, pool: Optional[BuildPool] = None, timeout: Optional[float] = None):
+        self.word = word
+        self.pool = pool or BUILD_POOL
+        self.timeout = timeout if timeout is not None else self.pool.timeout
+        self.t0 = time.perf_counter()
+        self.queue = self.pool.make_queue()
+        self.future = self.pool.submit(produce_events, word, self.queue)
+
+    def _ms(self) -> float:
+        return round((time.perf_counter() - self.t0) * 1000.0, 2)
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        deadline = None if self.timeout is None else self.t0 + self.timeout
+        nodes: Dict[int, Dict[str, Any]] = {}
+        first_node_ms = first_level_ms = None
+        while True:
+            try:
+                wait = None if deadline is None else max(0.0, deadline - time.perf_counter())
+                kind, payload = self.queue.get(timeout=wait)
+            except queue.Empty:
+                # The build keeps its pool slot (and still fills the tree cache) until it finishes
+                self.pool.note_timeout()
+                STREAM_STATS.record(ok=False, first_node_ms=first_node_ms)
+                yield "error", {"error": f'tree for "{self.word}" took too long', "nodes": len(nodes)}
+                return
+
+            if kind == "node":
+                attach_node(nodes, payload)
+                if first_node_ms is None:
+                    first_node_ms = self._ms()
+                if first_level_ms is None and payload["level"] == 1 and payload["index"] == payload["siblings"] - 1:
+                    first_level_ms = self._ms()
+                yield "node", payload
+            elif kind == "error":
+                STREAM_STATS.record(ok=False, first_node_ms=first_node_ms)
+                yield "error", {"error": payload, "nodes": len(nodes)}
+                return
+            else:
+                total_ms = self._ms()
+                if first_level_ms is None:
+                    first_level_ms = total_ms  # childless root
+                payload.add_stage("stream_first_node", first_node_ms / 1000.0)
+                payload.add_stage("stream_first_level", first_level_ms / 1000.0)
+                payload.add_stage("stream", total_ms / 1000.0)
+                metrics.METRICS.merge(payload)  # with the build's own stage timings
+                STREAM_STATS.record(first_node_ms=first_node_ms, first_level_ms=first_level_ms, total_ms=total_ms)
+                tree_id, _ = RESULT_STORE.put(nodes[0])
+                yield "done", {
+                    "id": tree_id,
+                    "tree_url": f"/api/tree/{tree_id}",
+                    "nodes": len(nodes),
+                    "first_node_ms": first_node_ms,
+                    "first_level_ms": first_level_ms,
+                    "total_ms": total_ms,
+                }
+                return
+
+# =============================
+# Wire formats
+# =============================
+
+def ndjson_line(kind: str, payload: Dict[str, Any]) -> bytes:
+    return encode_json({"type": kind, **payload}) + b"\n"
+
+def sse_message(kind: str, payload: Dict[str, Any]) -> bytes:
+    return b"event: " + kind.encode("ascii") + b"\ndata: " + encode_json(payload) + b"\n\n"
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Prebuilt token-resolution index for pick_token (replaces the linear
+`base.lower() in t.lower()` vocabulary scan).
+
+- Lowercase map:   case-insensitive exact lookup ("BrAiN" -> "brain")
+- POS-variant map: tagged keys by their bare form ("brain" -> "brain|N", "brain_NOUN")
+- Trigram index:   substring candidates from posting lists, verified and ranked
+                   (prefix match, then closest length, then vocab rank)
+
+Everything is flat NumPy arrays (one utf-8 blob + offsets, sorted row orders,
+CSR trigram postings) saved as <model>.kv.tokidx/ and memory-mapped on load.
+"""
+
+import bisect
+import json
+import os
+import re
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors
+
+INDEX_SUFFIX = ".tokidx"
+
+# "brain|N", "brain.n", "brain_NOUN", "run|V", ...
+_POS_SUFFIX = re.compile(r"(\|[A-Za-z]+|\.[a-z]|_[A-Z]+)$")
+
+def index_dir_for(kv_path: str) -> str:
+    return kv_path + INDEX_SUFFIX
+
+def _trigrams(b: bytes) -> List[int]:
+    return [(b[i] << 16) | (b[i + 1] << 8) | b[i + 2] for i in range(len(b) - 2)]
+
+class TokenIndex:
+    _ARRAYS = ("blob", "offsets", "lower_order", "pos_rows", "pos_base_len",
+               "gram_ids", "gram_offsets", "gram_rows")
+
+    def __init__(self, keys: List[str], arrays: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]] = None):
+        self.keys = keys  # index_to_key of the model (original case)
+        self.blob = arrays["blob"]                  # uint8, lowercase keys concatenated
+        self.offsets = arrays["offsets"]            # int64 (V+1,)
+        self.lower_order = arrays["lower_order"]    # int32 rows sorted by (lower key, row)
+        self.pos_rows = arrays["pos_rows"]          # int32 POS-tagged rows sorted by (bare key, row)
+        self.pos_base_len = arrays["pos_base_len"]  # int32 byte length of bare key, aligned with pos_rows
+        self.gram_ids = arrays["gram_ids"]          # int32 sorted unique trigrams
+        self.gram_offsets = arrays["gram_offsets"]  # int64 CSR offsets into gram_rows
+        self.gram_rows = arrays["gram_rows"]        # int32 rows, ascending within each trigram
+        self.meta = meta or {}
+
+    # ---- build ----
+
+    @classmethod
+    def build(cls, wv: "KeyedVectors", fingerprint: Optional[str] = None) -> "TokenIndex":
+        t0 = time.perf_counter()
+        keys = list(wv.index_to_key)
+        lowered = [k.lower().encode("utf-8") for k in keys]
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in lowered])
+        blob = np.frombuffer(b"".join(lowered), dtype=np.uint8).copy()
+
+        lower_order = np.array(sorted(range(len(keys)), key=lambda r: (lowered[r], r)), dtype=np.int32)
+
+        pos = []
+        for r, k in enumerate(keys):
+            m = _POS_SUFFIX.search(k)
+            if m and m.start() > 0:
+                pos.append((lowered[r][:len(k[:m.start()].lower().encode("utf-8"))], r))
+        pos.sort()
+        pos_rows = np.array([r for _, r in pos], dtype=np.int32)
+        pos_base_len = np.array([len(b) for b, _ in pos], dtype=np.int32)
+
+        postings: Dict[int, List[int]] = {}
+        for r, b in enumerate(lowered):
+            for g in set(_trigrams(b)):
+                postings.setdefault(g, []).append(r)
+        gram_ids = np.array(sorted(postings), dtype=np.int32)
+        counts = [len(postings[g]) for g in gram_ids.tolist()]
+        gram_offsets = np.zeros(len(gram_ids) + 1, dtype=np.int64)
+        gram_offsets[1:] = np.cumsum(counts)
+        gram_rows = np.fromiter(
+            (r for g in gram_ids.tolist() for r in postings[g]), dtype=np.int32, count=int(gram_offsets[-1])
+        )
+
+        meta = {
+            "vocab_size": len(keys),
+            "fingerprint": fingerprint,
+            "build_seconds": round(time.perf_counter() - t0, 3),
+        }
+        arrays = dict(blob=blob, offsets=offsets, lower_order=lower_order, pos_rows=pos_rows,
+                      pos_base_len=pos_base_len, gram_ids=gram_ids, gram_offsets=gram_offsets,
+                      gram_rows=gram_rows)
+        return cls(keys, arrays, meta)
+
+    # ---- persistence ----
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path: str, wv: "KeyedVectors", mmap: bool = True) -> "TokenIndex":
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in cls._ARRAYS}
+        return cls(wv.index_to_key, arrays, meta)
+
+    @classmethod
+    def load_or_build(cls, kv_path: str, wv: "KeyedVectors", fingerprint: Optional[str] = None) -> "TokenIndex":
+        """Memory-map <kv>.tokidx/ if it matches `fingerprint`, else build it once and try to save it."""
+        path = index_dir_for(kv_path)
+        if os.path.isdir(path):
+            index = cls.load(path, wv)
+            if index.meta.get("fingerprint") == fingerprint and index.meta.get("vocab_size") == len(wv.index_to_key):
+                return index
+        index = cls.build(wv, fingerprint=fingerprint)
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"Token index not saved ({e}); using in-memory copy")
+        return index
+
+    # ---- lookups ----
+
+    def _lower_key(self, row: int, length: Optional[int] = None) -> bytes:
+        start = int(self.offsets[row])
+        end = int(self.offsets[row + 1]) if length is None else start + length
+        return self.blob[start:end].tobytes()
+
+    def lookup_lower(self, word: str) -> Optional[str]:
+        """Case-insensitive exact match (most frequent casing wins)."""
+        q = word.lower().encode("utf-8")
+        i = bisect.bisect_left(self.lower_order, q, key=lambda r: self._lower_key(int(r)))
+        if i < len(self.lower_order) and self._lower_key(int(self.lower_order[i])) == q:
+            return self.keys[int(self.lower_order[i])]
+        return None
+
+    def lookup_pos_variant(self, word: str) -> Optional[str]:
+        """POS-tagged key whose bare form equals `word` (case-insensitive)."""
+        q = word.lower().encode("utf-8")
+        n = len(self.pos_rows)
+        i = bisect.bisect_left(range(n), q, key=lambda j: self._lower_key(int(self.pos_rows[j]), int(self.pos_base_len[j])))
+        if i < n and self._lower_key(int(self.pos_rows[i]), int(self.pos_base_len[i])) == q:
+            return self.keys[int(self.pos_rows[i])]
+        return None
+
+    def prefix_rows(self, word: str) -> np.ndarray:
+        """Rows whose lowercase key starts with `word` (a contiguous range of lower_order)."""
+        q = word.lower().encode("utf-8")
+        head = lambda r: self._lower_key(int(r))[:len(q)]
+        lo = bisect.bisect_left(self.lower_order, q, key=head)
+        hi = bisect.bisect_right(self.lower_order, q, lo=lo, key=head)
+        return np.asarray(self.lower_order[lo:hi])
+
+    def substring_hits(self, word: str, max_hits: Optional[int] = 64) -> List[int]:
+        """Rows whose lowercase key contains `word`, in vocab order (first `max_hits`; None = all)."""
+        q = word.lower().encode("utf-8")
+        if not q:
+            return []
+        if len(q) < 3:
+            # too short for trigrams: memchr-speed find over the blob, mapped back to rows
+            blob = self.blob.tobytes()
+            hits, pos = [], blob.find(q)
+            while pos != -1 and (max_hits is None or len(hits) < max_hits):
+                r = int(np.searchsorted(self.offsets, pos, side="right")) - 1
+                if pos + len(q) <= self.offsets[r + 1]:
+                    hits.append(r)
+                    pos = blob.find(q, int(self.offsets[r + 1]))
+                else:
+                    pos = blob.find(q, pos + 1)
+            return hits
+
+        lists = []
+        for g in set(_trigrams(q)):
+            j = int(np.searchsorted(self.gram_ids, g))
+            if j >= len(self.gram_ids) or int(self.gram_ids[j]) != g:
+                return []
+            lists.append(self.gram_rows[self.gram_offsets[j]:self.gram_offsets[j + 1]])
+        lists.sort(key=len)
+        cand = lists[0]
+        for other in lists[1:]:
+            cand = cand[np.isin(cand, other, assume_unique=True)]
+            if not len(cand):
+                return []
+        hits = []
+        for r in cand.tolist():
+            if q in self._lower_key(r):
+                hits.append(r)
+                if max_hits is not None and len(hits) >= max_hits:
+                    break
+        return hits
+
+    def best_substring(self, word: str) -> Optional[str]:
+        """
+        Ranked substring fallback over every match: prefix match, then closest
+        length, then vocab rank. Prefix matches come from lower_order, so the
+        substring scan only runs when there are none.
+        """
+        if not word:
+            return None
+        rows = self.prefix_rows(word)
+        if not len(rows):
+            rows = np.asarray(self.substring_hits(word, max_hits=None), dtype=np.int64)
+            if not len(rows):
+                return None
+        rows = rows.astype(np.int64)
+        lengths = self.offsets[rows + 1] - self.offsets[rows]
+        return self.keys[int(rows[np.lexsort((rows, lengths))[0]])]
+
+    def resolve(self, word: str) -> Optional[str]:
+        return self.lookup_lower(word) or self.lookup_pos_variant(word) or self.best_substring(word)
+
+if __name__ == "__main__":
+    import argparse
+    from gensim.models import KeyedVectors
+    from registry import model_fingerprint
+
+    ap = argparse.ArgumentParser(description="Build the pick_token lookup index next to a .kv file.")
+    ap.add_argument("--kv", required=True, help="Path to KeyedVectors .kv file")
+    args = ap.parse_args()
+
+    wv = KeyedVectors.load(args.kv, mmap="r")
+    index = TokenIndex.build(wv, fingerprint=model_fingerprint(args.kv))
+    index.save(index_dir_for(args.kv))
+    print(f"Saved token index to {index_dir_for(args.kv)} in {index.meta['build_seconds']}s")
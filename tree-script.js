@@ -118,12 +118,12 @@ document.addEventListener('DOMContentLoaded', async () => {
   }
 
   try {
-    const res = await fetch('trees.json'); // [cite: Cal-Hacks-2025/sampleTree.json]
-    if (!res.ok) {
-      throw new Error(`Could not load sampleTree.json: ${res.statusText}`);
-    }
-    const treeData = await res.json();
-    console.log('Loaded trees.json data:', treeData);
+    // Fresh builds are streamed and drawn node by node; stored/sample trees load whole
+    const treeId = urlParams.get('id');
+    if (!treeId && word !== 'sample' && await streamTree(word)) return;
+
+    const treeData = await loadTreeData(word, treeId);
+    console.log('Loaded tree data:', treeData);
 
     initTree(treeData);
 
@@ -148,6 +148,95 @@ document.addEventListener('DOMContentLoaded', async () => {
   }
 });
 
+// --- TREE DATA ---
+// Per-request result: by id from the backend store, else build it now.
+// trees.json is only the static sample.
+async function loadTreeData(word, treeId) {
+  if (treeId) {
+    const res = await fetch(`/api/tree/${encodeURIComponent(treeId)}`);
+    if (res.ok) return res.json();
+  }
+  if (word && word !== 'sample') {
+    const res = await fetch('/api/word', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ word: word, inline: true })
+    });
+    if (!res.ok) {
+      throw new Error(`Could not build tree for "${word}": ${res.statusText}`);
+    }
+    return (await res.json()).tree;
+  }
+  const res = await fetch('trees.json');
+  if (!res.ok) {
+    throw new Error(`Could not load trees.json: ${res.statusText}`);
+  }
+  return res.json();
+}
+
+// --- STREAMED TREE ---
+// /api/word/stream sends one NDJSON line per node, in build order, each with its
+// parent id and sibling count, so nodes can be placed as soon as they arrive.
+// Resolves false if nothing was drawn, so the caller can fall back to loadTreeData.
+const streamedNodes = new Map(); // node id -> { node, position, prevPos, depth, gen }
+
+async function streamTree(word) {
+  const res = await fetch(`/api/word/stream?word=${encodeURIComponent(word)}`);
+  if (!res.ok || !res.body) return false;
+
+  streamedNodes.clear();
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+  let drawn = 0;
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+    const lines = buffered.split('\n');
+    buffered = lines.pop();
+    for (const line of lines) {
+      if (!line) continue;
+      const msg = JSON.parse(line);
+      if (msg.type === 'node') {
+        if (drawn++ === 0) {
+          initTree(null);
+          loadingOverlay.classList.add('hidden');
+        }
+        renderStreamedNode(msg);
+      } else if (msg.type === 'done') {
+        // a reload now fetches the stored result instead of rebuilding it
+        history.replaceState(null, '', `?word=${encodeURIComponent(word)}&id=${encodeURIComponent(msg.id)}`);
+        console.log(`Streamed ${msg.nodes} nodes (first after ${msg.first_node_ms} ms, all after ${msg.total_ms} ms)`);
+      } else if (msg.type === 'error') {
+        throw new Error(msg.error);
+      }
+    }
+  }
+  return drawn > 0;
+}
+
+// Same placement as renderTree, one node at a time
+function renderStreamedNode(ev) {
+  const node = { word: ev.word, children: [] };
+  if (ev.parent === null) {
+    rootWord = ev.word;
+    new VisualizedWordNode(node.word, scene, [0, 0, 0], node.children);
+    streamedNodes.set(ev.id, { node, position: [0, 0, 0], prevPos: null, depth: 0, gen: null });
+    return;
+  }
+  const parent = streamedNodes.get(ev.parent);
+  if (!parent) return;
+  if (!parent.gen) {
+    parent.gen = generateNextPosition(parent.position, parent.prevPos, parent.depth, ev.siblings);
+  }
+  const position = parent.gen.next().value;
+  parent.node.children.push(node);
+  new VisualizedBranch(parent.position, position, scene);
+  new VisualizedWordNode(node.word, scene, position, node.children);
+  streamedNodes.set(ev.id, { node, position, prevPos: parent.position, depth: parent.depth + 1, gen: null });
+}
+
 // --- RENDERER INITIALIZATION ---
 function initTree(treeData) {
   if (!sceneContainer) {
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Result cache for whole similarity trees, in front of build_similarity_tree.
+
+- Key = root word + every build parameter + filter config + model fingerprint
+  (swapping the vector file changes the fingerprint, so old trees never match)
+- In-memory LRU for hot roots, on-disk JSON store shared by all workers
+- TTL and size-based eviction on both tiers; hit/miss counters
+
+Warm-up:  python tree_cache.py --kv lexvec_300d.kv --roots brain water music
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from main import HybridFilter, attach_node, build_similarity_tree, get_engine, iter_similarity_tree, tree_events
+from filter_cache import config_digest
+import metrics
+
+CACHE_DIR = ".tree_cache"
+
+# Bumped when the stored tree shape changes (2: children keep their "score"), so old entries miss
+TREE_FORMAT = 2
+
+# How a tree is built, not what it is: parallel builds equal the serial one
+_EXECUTION_PARAMS = ("workers", "executor")
+
+# Parameters that define a tree (everything except the model/filter objects and _EXECUTION_PARAMS)
+_BUILD_DEFAULTS = {
+    name: p.default
+    for name, p in inspect.signature(build_similarity_tree).parameters.items()
+    if name not in ("wv", "root_word", "word_filter", "engine") + _EXECUTION_PARAMS
+}
+
+class TreeCache:
+    def __init__(
+        self,
+        directory: Optional[str] = CACHE_DIR,
+        max_memory_items: int = 512,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+    ):
+        """directory=None keeps the cache in memory only; ttl_seconds=None never expires."""
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._mem: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---- keys ----
+
+    @staticmethod
+    def make_key(root_word: str, fingerprint: str, word_filter: HybridFilter,
+                 masked: bool = False, **params) -> str:
+        unknown = set(params) - set(_BUILD_DEFAULTS) - set(_EXECUTION_PARAMS)
+        if unknown:
+            raise TypeError(f"unknown build parameter(s): {sorted(unknown)}")
+        full = {**_BUILD_DEFAULTS, **{k: v for k, v in params.items() if k not in _EXECUTION_PARAMS}}
+        payload = json.dumps(
+            [TREE_FORMAT, root_word, fingerprint, config_digest(word_filter.config_key()), masked, sorted(full.items())],
+            default=str,
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    # ---- tiers ----
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._mem.move_to_end(key)
+                    self.hits_memory += 1
+                    return entry[1]
+                del self._mem[key]
+        tree = self._disk_get(key)
+        with self._lock:
+            if tree is None:
+                self.misses += 1
+                return None
+            self.hits_disk += 1
+            self._mem_put(key, tree, time.time())
+        return tree
+
+    def put(self, key: str, tree: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._mem_put(key, tree, now)
+        self._disk_put(key, tree)
+
+    def _mem_put(self, key: str, tree: Dict[str, Any], created: float) -> None:
+        self._mem[key] = (created, tree)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_memory_items:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key: str, tree: Dict[str, Any]) -> None:
+        if not self.directory:
+            return
+        path = self._path(key)
+        data = json.dumps(tree, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)  # atomic: concurrent workers never see half a file
+        except OSError as e:
+            print(f"Tree cache write failed: {e}")
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(data)
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _disk_files(self):
+        for sub in os.listdir(self.directory):
+            d = os.path.join(self.directory, sub)
+            if os.path.isdir(d):
+                for name in os.listdir(d):
+                    if name.endswith(".json"):
+                        p = os.path.join(d, name)
+                        try:
+                            st = os.stat(p)
+                        except OSError:
+                            continue
+                        yield p, st.st_size, st.st_mtime
+
+    def _scan_disk_bytes(self) -> int:
+        return sum(size for _, size, _ in self._disk_files())
+
+    def _evict_disk(self) -> None:
+        """Drop expired files, then oldest-first until under 90% of the byte budget."""
+        files = sorted(self._disk_files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_disk_bytes * 0.9)
+        for path, size, mtime in files:
+            if total <= target and not self._expired(mtime):
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+        if self.directory and os.path.isdir(self.directory):
+            for path, _, _ in list(self._disk_files()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.hits_memory + self.hits_disk
+        total = hits + self.misses
+        return {
+            "memory_items": len(self._mem),
+            "disk_bytes": self._disk_bytes,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(hits / total, 4) if total else None,
+        }
+
+    # ---- front of build_similarity_tree ----
+
+    def get_or_build(self, wv, root_word: str, fingerprint: str,
+                     word_filter: Optional[HybridFilter] = None, engine=None,
+                     **params) -> Tuple[Dict[str, Any], bool]:
+        """Cached build_similarity_tree(...). Returns (tree, was_cached)."""
+        word_filter = word_filter or HybridFilter()
+        engine = engine or get_engine(wv)
+        masked = engine.mask_for(word_filter) is not None
+        key = self.make_key(root_word, fingerprint, word_filter, masked=masked, **params)
+        with metrics.stage("tree_cache_lookup"):
+            tree = self.get(key)
+        metrics.count("tree_cache_lookups_total", result="miss" if tree is None else "hit")
+        if tree is not None:
+            return tree, True
+        tree = build_similarity_tree(wv, root_word, word_filter=word_filter, engine=engine, **params)
+        with metrics.stage("tree_cache_store"):
+            self.put(key, tree)
+        return tree, False
+
+    def iter_or_build(self, wv, root_word: str, fingerprint: str,
+                      word_filter: Optional[HybridFilter] = None, engine=None,
+                      **params) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming get_or_build(): yields iter_similarity_tree() events, replayed
+        from the cache on a hit. A fresh build is cached once it runs to completion.
+        """
+        word_filter = word_filter or HybridFilter()
+        engine = engine or get_engine(wv)
+        masked = engine.mask_for(word_filter) is not None
+        key = self.make_key(root_word, fingerprint, word_filter, masked=masked, **params)
+        tree = self.get(key)
+        metrics.count("tree_cache_lookups_total", result="miss" if tree is None else "hit")
+        if tree is not None:
+            yield from tree_events(tree)
+            return
+        nodes: Dict[int, Dict[str, Any]] = {}
+        for event in iter_similarity_tree(wv, root_word, word_filter=word_filter, engine=engine, **params):
+            attach_node(nodes, event)
+            yield event
+        self.put(key, nodes[0])
+
+    def warm(self, wv, roots: Iterable[str], fingerprint: str,
+             word_filter: Optional[HybridFilter] = None, **params) -> Dict[str, Any]:
+        """Pre-build (or refresh from disk) trees for a list of roots."""
+        built = 0
+        for root in roots:
+            _, cached = self.get_or_build(wv, root, fingerprint, word_filter=word_filter, **params)
+            built += not cached
+        return {"built": built, **self.stats()}
+
+# One cache per process; the disk tier is shared between processes
+TREE_CACHE = TreeCache()
+
+if __name__ == "__main__":
+    import argparse
+    from main import FILTER_CONFIG, KV_PATH
+    from registry import REGISTRY
+
+    ap = argparse.ArgumentParser(description="Pre-build cached trees for a list of roots.")
+    ap.add_argument("--kv", default=KV_PATH, help="Path to KeyedVectors .kv file")
+    ap.add_argument("--roots", nargs="*", default=[], help="Root words to pre-build")
+    ap.add_argument("--roots-file", default=None, help="Newline-separated root words")
+    ap.add_argument("--depth", type=int, default=4, help="Tree depth (levels, including root)")
+    ap.add_argument("--breadth", type=int, default=4, help="Children per node")
+    ap.add_argument("--min-sim-parent", type=float, default=0.32, help="Min similarity to parent")
+    ap.add_argument("--min-sim-root", type=float, default=0.28, help="Min similarity to root (levels>=1)")
+    args = ap.parse_args()
+
+    roots = list(args.roots)
+    if args.roots_file:
+        with open(args.roots_file, "r", encoding="utf-8") as f:
+            roots += [line.strip() for line in f if line.strip()]
+
+    handle = REGISTRY.get_model(args.kv)
+    t0 = time.perf_counter()
+    summary = TREE_CACHE.warm(
+        handle.wv, roots, handle.fingerprint,
+        word_filter=REGISTRY.get_filter(**FILTER_CONFIG),
+        depth=args.depth,
+        breadth=args.breadth,
+        min_sim_to_parent=args.min_sim_parent,
+        min_sim_to_root=args.min_sim_root,
+    )
+    print(f"Warmed {len(roots)} roots in {time.perf_counter() - t0:.2f}s: {summary}")
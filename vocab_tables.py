@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Per-vocabulary normalization / canonical-family tables.
+
+normalize() and canonical_key() (WordNet lemmatization or suffix stemming) are
+pure functions of a token, so they are evaluated once per vocabulary row:
+
+- norm_ids:   int32 (V,) row -> id of normalize(token)
+- family_ids: int32 (V,) row -> id of canonical_key(token)
+- strings:    interned table (utf-8 blob + offsets) of every distinct norm
+
+Tree building then dedupes and collapses families on integer ids.
+Saved as <model>.kv.vtables/ and memory-mapped on load.
+"""
+
+import json
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+
+import main
+
+if TYPE_CHECKING:
+    from gensim.models import KeyedVectors
+
+TABLES_SUFFIX = ".vtables"
+
+def tables_dir_for(kv_path: str) -> str:
+    return kv_path + TABLES_SUFFIX
+
+class VocabTables:
+    _ARRAYS = ("norm_ids", "family_ids", "norm_blob", "norm_offsets")
+
+    def __init__(self, wv: "KeyedVectors", arrays: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]] = None):
+        self.key_to_index = wv.key_to_index
+        self.norm_ids = arrays["norm_ids"]
+        self.family_ids = arrays["family_ids"]
+        self.norm_blob = arrays["norm_blob"]
+        self.norm_offsets = arrays["norm_offsets"]
+        self.meta = meta or {}
+        self._norm_strings: Optional[List[str]] = None
+
+    # ---- build ----
+
+    @classmethod
+    def build(cls, wv: "KeyedVectors", fingerprint: Optional[str] = None) -> "VocabTables":
+        t0 = time.perf_counter()
+        n = len(wv.index_to_key)
+        norm_intern: Dict[str, int] = {}
+        fam_intern: Dict[str, int] = {}
+        norm_ids = np.empty(n, dtype=np.int32)
+        family_ids = np.empty(n, dtype=np.int32)
+        for r, tok in enumerate(wv.index_to_key):
+            norm_ids[r] = norm_intern.setdefault(main.normalize(tok), len(norm_intern))
+            family_ids[r] = fam_intern.setdefault(main.canonical_key(tok), len(fam_intern))
+        encoded = [s.encode("utf-8") for s in norm_intern]  # dict order == id order
+        norm_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        norm_offsets[1:] = np.cumsum([len(b) for b in encoded])
+        meta = {
+            "vocab_size": n,
+            "norms": len(norm_intern),
+            "families": len(fam_intern),
+            "lemmatizer": main.lemmatizer_available(),
+            "fingerprint": fingerprint,
+            "build_seconds": round(time.perf_counter() - t0, 3),
+        }
+        arrays = dict(norm_ids=norm_ids, family_ids=family_ids,
+                      norm_blob=np.frombuffer(b"".join(encoded), dtype=np.uint8).copy(),
+                      norm_offsets=norm_offsets)
+        return cls(wv, arrays, meta)
+
+    # ---- persistence ----
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path: str, wv: "KeyedVectors", mmap: bool = True) -> "VocabTables":
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in cls._ARRAYS}
+        return cls(wv, arrays, meta)
+
+    @classmethod
+    def load_or_build(cls, kv_path: str, wv: "KeyedVectors", fingerprint: Optional[str] = None) -> "VocabTables":
+        """
+        Memory-map <kv>.vtables/ if it matches this model and the current
+        lemmatizer availability (families differ with/without NLTK); else build and save.
+        """
+        path = tables_dir_for(kv_path)
+        if os.path.isdir(path):
+            tables = cls.load(path, wv)
+            m = tables.meta
+            if (m.get("fingerprint") == fingerprint and m.get("vocab_size") == len(wv.index_to_key)
+                    and m.get("lemmatizer") == main.lemmatizer_available()):
+                return tables
+        tables = cls.build(wv, fingerprint=fingerprint)
+        try:
+            tables.save(path)
+        except OSError as e:
+            print(f"Vocab tables not saved ({e}); using in-memory copy")
+        return tables
+
+    # ---- lookups ----
+
+    def norm_id(self, token: str) -> int:
+        return int(self.norm_ids[self.key_to_index[token]])
+
+    def family_id(self, token: str) -> int:
+        return int(self.family_ids[self.key_to_index[token]])
+
+    def norm_str(self, norm_id: int) -> str:
+        """Interned normalized form (table decoded once on first use)."""
+        if self._norm_strings is None:
+            blob = self.norm_blob.tobytes()
+            offs = self.norm_offsets.tolist()
+            self._norm_strings = [blob[offs[i]:offs[i + 1]].decode("utf-8") for i in range(len(offs) - 1)]
+        return self._norm_strings[norm_id]
+
+if __name__ == "__main__":
+    import argparse
+    from gensim.models import KeyedVectors
+    from registry import model_fingerprint
+
+    ap = argparse.ArgumentParser(description="Build normalization/family tables next to a .kv file.")
+    ap.add_argument("--kv", required=True, help="Path to KeyedVectors .kv file")
+    args = ap.parse_args()
+
+    wv = KeyedVectors.load(args.kv, mmap="r")
+    tables = VocabTables.build(wv, fingerprint=model_fingerprint(args.kv))
+    tables.save(tables_dir_for(args.kv))
+    print(f"{tables.meta['norms']} norms / {tables.meta['families']} families "
+          f"saved to {tables_dir_for(args.kv)} in {tables.meta['build_seconds']}s")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bounded worker pool for tree builds, so /api/word never blocks its event loop.
+
+- mode="thread":  NumPy scoring releases the GIL; cheap to start, shares the
+                  registry/caches of the serving process (default)
+- mode="process": whole builds in worker processes, for the pure-Python
+                  filtering/dedupe work; children fork after the registry is
+                  warmed, so they share the mmap'd vectors
+- local=True runs a task on a thread of the serving process even in
+  process mode, for work on per-process state (lazy trees), under the
+  same admission control
+- Admission control: at most `max_workers` running + `max_queue` waiting,
+  beyond that submit() raises PoolSaturated (-> 429 with Retry-After)
+- Per-request timeout (-> 503): a build still waiting in the queue is
+  cancelled; one already running keeps its slot until it really finishes,
+  so the pool can't be oversubscribed by retries
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+class PoolSaturated(Exception):
+    """Raised when the build queue is full."""
+
+    def __init__(self, retry_after: float = 1.0):
+        super().__init__("tree build queue is full")
+        self.retry_after = retry_after
+
+class BuildPool:
+    def __init__(
+        self,
+        mode: str = "thread",
+        max_workers: Optional[int] = None,
+        max_queue: int = 16,
+        timeout: Optional[float] = 30.0,
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"mode must be 'thread' or 'process', not {mode!r}")
+        self.mode = mode
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor: Optional[Executor] = None
+        self._local: Optional[Executor] = None  # threads for local=True tasks in process mode
+        self._manager = None  # multiprocessing.Manager for streaming queues (process mode)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.failed = 0
+
+    def _get_executor(self, local: bool = False) -> Executor:
+        if local and self.mode == "process":
+            if self._local is None:
+                with self._lock:
+                    if self._local is None:
+                        self._local = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                         thread_name_prefix="tree-local")
+            return self._local
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.mode == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                            thread_name_prefix="tree-build")
+        return self._executor
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _release(self, fut) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if fut.cancelled() or fut.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def submit(self, fn: Callable[..., Any], *args, local: bool = False) -> Future:
+        """Admit fn(*args) to the pool or raise PoolSaturated; returns its future."""
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise PoolSaturated(retry_after=max(1.0, (self.timeout or 30.0) / 4))
+            self.in_flight += 1
+        try:
+            cfut = self._get_executor(local).submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        cfut.add_done_callback(self._release)
+        return cfut
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, local: bool = False) -> Any:
+        """Run fn(*args) on the pool; raises PoolSaturated or asyncio.TimeoutError."""
+        cfut = self.submit(fn, *args, local=local)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cfut),
+                                          timeout if timeout is not None else self.timeout)
+        except asyncio.TimeoutError:
+            self.note_timeout()
+            raise
+
+    def note_timeout(self) -> None:
+        with self._lock:
+            self.timed_out += 1
+
+    def make_queue(self):
+        """A queue workers can put() results on: in-process for threads, managed for processes."""
+        if self.mode == "thread":
+            return queue.Queue()
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+        return self._manager.Queue()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.max_workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._local is not None:
+            self._local.shutdown(wait=False, cancel_futures=True)
+            self._local = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+# One pool per serving process
+BUILD_POOL = BuildPool()